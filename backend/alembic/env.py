@@ -2,6 +2,7 @@ from logging.config import fileConfig
 import os
 
 from sqlalchemy import create_engine, engine_from_config, pool
+from sqlalchemy.engine import make_url
 
 from alembic import context
 
@@ -26,8 +27,25 @@ target_metadata = Base.metadata
 # my_important_option = config.get_main_option("my_important_option")
 # ... etc.
 
+def include_object(object, name, type_, reflected, compare_to):
+    # The FTS5 search table and its shadow tables are managed by hand
+    # (models.FORM_SEARCH_DDL), not by autogenerate
+    if type_ == "table" and name.startswith("form_submission_search"):
+        return False
+    # Monthly audit partitions are created by the audit flusher (audit.partition)
+    if type_ == "table" and name.startswith("audit_log_"):
+        return False
+    return True
+
+
 def get_url():
-    return f"sqlite:///./dev.db"
+    # The app's database (DATABASE_URL), through the sync driver
+    from config import settings
+
+    url = make_url(settings.database_url)
+    if url.drivername == "sqlite+aiosqlite":
+        url = url.set(drivername="sqlite")
+    return url
 
 
 def run_migrations_offline() -> None:
@@ -48,6 +66,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -65,7 +84,8 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata,
+            include_object=include_object,
         )
 
         with context.begin_transaction():
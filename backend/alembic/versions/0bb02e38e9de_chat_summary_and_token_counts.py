@@ -0,0 +1,34 @@
+"""chat summary and token counts
+
+Revision ID: 0bb02e38e9de
+Revises: c15535fcd21f
+Create Date: 2026-10-17 00:52:09.517204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0bb02e38e9de'
+down_revision: Union[str, None] = 'c15535fcd21f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('chat', sa.Column('summary', sa.Text(), nullable=True))
+    op.add_column('chat', sa.Column('summary_seq', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('chat_message', sa.Column('token_count', sa.Integer(), nullable=True))
+    # Same estimate tokens.count_message_tokens uses when tiktoken isn't installed
+    op.execute('UPDATE chat_message SET token_count = length(data) / 4 + 4')
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('chat_message') as batch_op:
+        batch_op.drop_column('token_count')
+    with op.batch_alter_table('chat') as batch_op:
+        batch_op.drop_column('summary_seq')
+        batch_op.drop_column('summary')
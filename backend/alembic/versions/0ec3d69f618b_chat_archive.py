@@ -0,0 +1,43 @@
+"""chat archive
+
+Revision ID: 0ec3d69f618b
+Revises: 1257e1c4b677
+Create Date: 2026-10-17 01:31:53.087534
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0ec3d69f618b'
+down_revision: Union[str, None] = '1257e1c4b677'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('chat', sa.Column('active_at', sa.DateTime(), nullable=True))
+    op.add_column('chat', sa.Column('archived_at', sa.DateTime(), nullable=True))
+    # A chat was last active at its latest message, or when it was created
+    op.execute(
+        """
+        UPDATE chat SET active_at = coalesce(
+            (SELECT max(m.created_at) FROM chat_message m WHERE m.chat_id = chat.id),
+            created_at
+        )
+        """
+    )
+    op.create_index('ix_chat_active_at', 'chat', ['active_at'], unique=False, sqlite_where=sa.text('archived_at IS NULL'))
+
+
+def downgrade() -> None:
+    # Their messages are only in the archive
+    archived = op.get_bind().scalar(sa.text("SELECT count(*) FROM chat WHERE archived_at IS NOT NULL"))
+    if archived:
+        raise RuntimeError(f"{archived} chats are archived; open them to restore them before downgrading")
+    op.drop_index('ix_chat_active_at', table_name='chat', sqlite_where=sa.text('archived_at IS NULL'))
+    op.drop_column('chat', 'archived_at')
+    op.drop_column('chat', 'active_at')
@@ -0,0 +1,65 @@
+"""form counts
+
+Revision ID: 1257e1c4b677
+Revises: d42a8f6c3e19
+Create Date: 2026-10-17 01:27:20.434928
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1257e1c4b677'
+down_revision: Union[str, None] = 'd42a8f6c3e19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Same as models.FORM_COUNT_DDL at the time of this revision
+def count_form(row: str, delta: int) -> str:
+    return " ".join(
+        "INSERT INTO form_count (chat_id, day, status, count) "
+        f"SELECT {chat}, {day}, coalesce({row}.status, 0), {delta} WHERE {day} IS NOT NULL "
+        "ON CONFLICT (chat_id, day, status) DO UPDATE SET count = count + excluded.count;"
+        for chat in (f"{row}.chat_id", "''")
+        for day in (f"date({row}.created_at)", "''")
+    )
+
+TRIGGERS = {
+    "form_count_insert": ("AFTER INSERT ON form_submission", count_form("new", 1)),
+    "form_count_update": (
+        "AFTER UPDATE OF chat_id, status, created_at ON form_submission "
+        "WHEN old.chat_id IS NOT new.chat_id OR old.status IS NOT new.status "
+        "OR date(old.created_at) IS NOT date(new.created_at)",
+        count_form("old", -1) + " " + count_form("new", 1),
+    ),
+    "form_count_delete": ("AFTER DELETE ON form_submission", count_form("old", -1)),
+}
+
+
+def upgrade() -> None:
+    op.create_table('form_count',
+    sa.Column('chat_id', sa.String(length=32), nullable=False),
+    sa.Column('day', sa.String(), nullable=False),
+    sa.Column('status', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('chat_id', 'day', 'status')
+    )
+    # Counters for the existing forms
+    for chat, day in [("chat_id", "date(created_at)"), ("chat_id", "''"), ("''", "date(created_at)"), ("''", "''")]:
+        op.execute(
+            "INSERT INTO form_count (chat_id, day, status, count) "
+            f"SELECT {chat}, {day}, coalesce(status, 0), count(*) FROM form_submission "
+            f"WHERE {day} IS NOT NULL GROUP BY 1, 2, 3"
+        )
+    for name, (when, body) in TRIGGERS.items():
+        op.execute(f"CREATE TRIGGER {name} {when} BEGIN {body} END")
+
+
+def downgrade() -> None:
+    for name in reversed(list(TRIGGERS)):
+        op.execute(f'DROP TRIGGER {name}')
+    op.drop_table('form_count')
@@ -0,0 +1,45 @@
+"""chat listing preview
+
+Revision ID: 5d0b7a3e91c4
+Revises: c982a4ff516f
+Create Date: 2026-10-17 02:14:37.803512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d0b7a3e91c4'
+down_revision: Union[str, None] = 'c982a4ff516f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('chat', sa.Column('last_message_preview', sa.String(), nullable=True))
+    # Same rule as crud.message_preview: the latest message with text content
+    op.execute(
+        """
+        UPDATE chat SET last_message_preview = (
+            SELECT substr(json_extract(m.data, '$.content'), 1, 200)
+            FROM chat_message m
+            WHERE m.chat_id = chat.id
+              AND json_type(m.data, '$.content') = 'text'
+              AND json_extract(m.data, '$.content') != ''
+            ORDER BY m.seq DESC
+            LIMIT 1
+        )
+        """
+    )
+    op.drop_index('ix_chat_created_at', table_name='chat')
+    op.create_index('ix_chat_created_at', 'chat', ['created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_chat_created_at', table_name='chat')
+    op.create_index('ix_chat_created_at', 'chat', ['created_at'], unique=False)
+    with op.batch_alter_table('chat') as batch_op:
+        batch_op.drop_column('last_message_preview')
@@ -0,0 +1,58 @@
+"""form submission search
+
+Revision ID: 8e4f2c6a1b07
+Revises: 5d0b7a3e91c4
+Create Date: 2026-10-17 03:02:18.441960
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e4f2c6a1b07'
+down_revision: Union[str, None] = '5d0b7a3e91c4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Same as models.FORM_SEARCH_DDL at the time of this revision
+PHONE_DIGITS = "replace(replace(replace(replace(replace(replace({}, ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', '')"
+EMAIL_KEY = "replace(replace(replace(replace(replace(lower({}), '.', ''), '@', ''), '_', ''), '-', ''), '+', '')"
+SEARCH_ROW = (
+    "INSERT OR REPLACE INTO form_submission_search (rowid, form_id, name, email, email_key, phone) "
+    "VALUES (new.rowid, new.id, new.name, lower(new.email), "
+    + EMAIL_KEY.format("new.email") + ", " + PHONE_DIGITS.format("new.phone_number") + ");"
+)
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE VIRTUAL TABLE form_submission_search USING fts5("
+        "form_id UNINDEXED, name, email, email_key, phone, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    op.execute(
+        "INSERT INTO form_submission_search (rowid, form_id, name, email, email_key, phone) "
+        "SELECT rowid, id, name, lower(email), " + EMAIL_KEY.format("email") + ", "
+        + PHONE_DIGITS.format("phone_number") + " FROM form_submission"
+    )
+    op.execute(
+        "CREATE TRIGGER form_submission_search_insert AFTER INSERT ON form_submission BEGIN "
+        + SEARCH_ROW + " END"
+    )
+    op.execute(
+        "CREATE TRIGGER form_submission_search_update AFTER UPDATE OF name, email, phone_number ON form_submission BEGIN "
+        + SEARCH_ROW + " END"
+    )
+    op.execute(
+        "CREATE TRIGGER form_submission_search_delete AFTER DELETE ON form_submission BEGIN "
+        "DELETE FROM form_submission_search WHERE rowid = old.rowid; END"
+    )
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER form_submission_search_delete')
+    op.execute('DROP TRIGGER form_submission_search_update')
+    op.execute('DROP TRIGGER form_submission_search_insert')
+    op.execute('DROP TABLE form_submission_search')
@@ -0,0 +1,56 @@
+"""cache version
+
+Revision ID: b7e1d4a9c2f3
+Revises: 3f6d9b2e8a15
+Create Date: 2026-10-17 05:21:46.530912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e1d4a9c2f3'
+down_revision: Union[str, None] = '3f6d9b2e8a15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Same as models.CACHE_VERSION_DDL at the time of this revision
+BUMP_VERSION = (
+    "INSERT INTO cache_version (kind, key, version, updated_at) VALUES ('{}', {}, 1, CURRENT_TIMESTAMP) "
+    "ON CONFLICT (kind, key) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;"
+)
+TRIGGERS = {
+    "cache_version_chat_insert": ("AFTER INSERT ON chat", [("chat", "new.id")]),
+    "cache_version_chat_update": ("AFTER UPDATE ON chat", [("chat", "new.id")]),
+    "cache_version_chat_delete": ("AFTER DELETE ON chat", [("chat", "old.id")]),
+    "cache_version_forms_insert": ("AFTER INSERT ON form_submission", [("forms", "new.chat_id")]),
+    "cache_version_forms_update": (
+        "AFTER UPDATE ON form_submission", [("forms", "old.chat_id"), ("forms", "new.chat_id")]
+    ),
+    "cache_version_forms_delete": ("AFTER DELETE ON form_submission", [("forms", "old.chat_id")]),
+}
+
+
+def upgrade() -> None:
+    # Rows without a version are at version 0, so existing chats need none
+    op.create_table('cache_version',
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('kind', 'key')
+    )
+    for name, (when, bumps) in TRIGGERS.items():
+        op.execute(
+            f"CREATE TRIGGER {name} {when} BEGIN "
+            + " ".join(BUMP_VERSION.format(kind, key) for kind, key in bumps) + " END"
+        )
+
+
+def downgrade() -> None:
+    for name in reversed(list(TRIGGERS)):
+        op.execute(f'DROP TRIGGER {name}')
+    op.drop_table('cache_version')
@@ -0,0 +1,96 @@
+"""chat message table
+
+Revision ID: c15535fcd21f
+Revises: 546f84e030c3
+Create Date: 2026-10-17 00:10:41.208113
+
+"""
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c15535fcd21f'
+down_revision: Union[str, None] = '546f84e030c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 500
+
+chat = sa.table(
+    'chat',
+    sa.column('id', sa.String),
+    sa.column('created_at', sa.DateTime),
+    sa.column('messages', sa.JSON),
+    sa.column('message_count', sa.Integer),
+)
+chat_message = sa.table(
+    'chat_message',
+    sa.column('chat_id', sa.String),
+    sa.column('seq', sa.Integer),
+    sa.column('created_at', sa.DateTime),
+    sa.column('role', sa.String),
+    sa.column('data', sa.JSON),
+)
+
+
+def upgrade() -> None:
+    op.create_table('chat_message',
+    sa.Column('chat_id', sa.String(length=32), nullable=False),
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('role', sa.String(), nullable=True),
+    sa.Column('data', sa.JSON(), nullable=False),
+    sa.ForeignKeyConstraint(['chat_id'], ['chat.id'], ),
+    sa.PrimaryKeyConstraint('chat_id', 'seq')
+    )
+    op.add_column('chat', sa.Column('message_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Backfill: split every messages blob into one row per message
+    conn = op.get_bind()
+    last_id = ''
+    while batch := conn.execute(
+        sa.select(chat.c.id, chat.c.created_at, chat.c.messages)
+        .where(chat.c.id > last_id).order_by(chat.c.id).limit(BATCH_SIZE)
+    ).all():
+        last_id = batch[-1][0]
+        rows = []
+        for chat_id, created_at, messages in batch:
+            if isinstance(messages, str):
+                messages = json.loads(messages)
+            messages = messages or []
+            rows.extend(
+                {'chat_id': chat_id, 'seq': seq, 'created_at': created_at,
+                 'role': m.get('role'), 'data': m}
+                for seq, m in enumerate(messages)
+            )
+            conn.execute(
+                chat.update().where(chat.c.id == chat_id).values(message_count=len(messages))
+            )
+        if rows:
+            conn.execute(chat_message.insert(), rows)
+
+    with op.batch_alter_table('chat') as batch_op:
+        batch_op.drop_column('messages')
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('chat') as batch_op:
+        batch_op.add_column(sa.Column('messages', sa.JSON(), nullable=True))
+
+    conn = op.get_bind()
+    messages: dict = {}
+    for chat_id, data in conn.execute(
+        sa.select(chat_message.c.chat_id, chat_message.c.data)
+        .order_by(chat_message.c.chat_id, chat_message.c.seq)
+    ):
+        messages.setdefault(chat_id, []).append(data)
+    for chat_id, blob in messages.items():
+        conn.execute(chat.update().where(chat.c.id == chat_id).values(messages=blob))
+
+    with op.batch_alter_table('chat') as batch_op:
+        batch_op.drop_column('message_count')
+    op.drop_table('chat_message')
@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+import orjson
+from sqlalchemy import (
+    Column, Float, Integer, LargeBinary, MetaData, String, Table, Text, bindparam, delete, func, insert,
+    select, type_coerce, update,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+
+from chat_locks import chat_turns
+from config import Settings, settings
+from database import SessionLocal
+import jobs
+import metrics
+from models import Chat, ChatMessage
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+# Archived chats live in their own SQLite file (ARCHIVE_PATH), one row per
+# chat: its chat_message rows as a single zlib-compressed JSON array. The
+# chat row itself stays in the app database (listing and forms don't need
+# the messages) with archived_at set.
+#
+# Archiving writes the archive row first and commits it, then deletes the
+# chat's messages in the app database, but only if the chat is still idle
+# and unchanged. Restoring inserts the messages back and clears archived_at
+# in one transaction, then drops the archive row. Either way a crash in
+# between leaves a spare archive row, never a chat without its messages.
+archived_chat = Table(
+    "archived_chat",
+    metadata,
+    Column("chat_id", String(32), primary_key=True),
+    Column("message_count", Integer, nullable=False),
+    # Size of the messages before / after compression
+    Column("raw_bytes", Integer, nullable=False),
+    Column("data", LargeBinary, nullable=False),
+    Column("archived_at", Float, nullable=False),
+)
+
+# chat_message.data is inserted as the JSON text it was read as
+_restore_messages = insert(ChatMessage.__table__).values(data=bindparam("data", type_=Text))
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def encode(rows) -> bytes:
+    return orjson.dumps([
+        [row.seq, row.created_at.isoformat() if row.created_at else None, row.role, row.data, row.token_count]
+        for row in rows
+    ])
+
+
+def decode(chat_id: str, raw: bytes) -> List[dict]:
+    return [
+        {
+            "chat_id": chat_id,
+            "seq": seq,
+            "created_at": datetime.fromisoformat(created_at) if created_at else None,
+            "role": role,
+            "data": data,
+            "token_count": token_count,
+        }
+        for seq, created_at, role, data, token_count in orjson.loads(raw)
+    ]
+
+
+class ChatArchive:
+    def __init__(self, settings: Settings):
+        """
+        Moves chats idle for ``archive_after`` seconds out of the hot
+        database, ``archive_batch_size`` per compaction pass, and back when
+        they are next loaded through load_chat().
+        """
+        self.settings = settings
+        self._engine: Optional[AsyncEngine] = None
+        self._init_lock = asyncio.Lock()
+        self.stats = {"archived": 0, "restored": 0, "raw_bytes": 0, "compressed_bytes": 0}
+        # tier -> [loads, total seconds]
+        self._loads = {"hot": [0, 0.0], "cold": [0, 0.0]}
+
+    async def _get_engine(self) -> AsyncEngine:
+        if self._engine is None:
+            async with self._init_lock:
+                if self._engine is None:
+                    engine = create_async_engine(f"sqlite+aiosqlite:///{self.settings.archive_path}")
+                    async with engine.begin() as conn:
+                        await conn.run_sync(metadata.create_all)
+                    self._engine = engine
+        return self._engine
+
+    async def load_chat(self, db: AsyncSession, chat_id: str) -> Optional[Chat]:
+        """The chat, with its messages back in chat_message if it was archived."""
+        start = time.perf_counter()
+        chat = await db.get(Chat, chat_id)
+        if chat is None:
+            return None
+        tier = "hot" if chat.archived_at is None else "cold"
+        if tier == "cold":
+            with metrics.span("chat.restore"):
+                await self.restore(db, chat)
+        elapsed = time.perf_counter() - start
+        metrics.chat_load_seconds.observe(elapsed, tier)
+        self._loads[tier][0] += 1
+        self._loads[tier][1] += elapsed
+        return chat
+
+    async def restore(self, db: AsyncSession, chat: Chat) -> None:
+        """Move an archived chat's messages back to chat_message; commits ``db``."""
+        engine = await self._get_engine()
+        async with engine.connect() as conn:
+            raw = await conn.scalar(select(archived_chat.c.data).where(archived_chat.c.chat_id == chat.id))
+        if raw is None:
+            await db.refresh(chat)
+            if chat.archived_at is None:
+                return  # Restored by another worker meanwhile
+            raise RuntimeError(f"Chat {chat.id} is archived, but missing from {self.settings.archive_path}")
+
+        # Only one of concurrent loads restores it; the others find it done
+        claimed = await db.execute(
+            update(Chat)
+            .where(Chat.id == chat.id, Chat.archived_at.is_not(None))
+            .values(archived_at=None, active_at=_now())
+        )
+        if claimed.rowcount:
+            rows = decode(chat.id, zlib.decompress(raw))
+            if rows:
+                await db.execute(_restore_messages, rows)
+        await db.commit()
+
+        if claimed.rowcount:
+            self.stats["restored"] += 1
+            async with engine.begin() as conn:
+                await conn.execute(delete(archived_chat).where(archived_chat.c.chat_id == chat.id))
+
+    async def archive_chat(self, chat_id: str, cutoff: datetime) -> Optional[tuple]:
+        """
+        Archive ``chat_id`` if it has been idle since before ``cutoff``.
+        Returns its (raw, compressed) size, or None if it was left alone.
+        """
+        async with chat_turns.hold(chat_id), SessionLocal() as db:
+            chat = await db.get(Chat, chat_id)
+            if chat is None or chat.archived_at is not None or chat.active_at is None or chat.active_at >= cutoff:
+                return None
+            message_count = chat.message_count
+            result = await db.execute(
+                select(
+                    ChatMessage.seq, ChatMessage.created_at, ChatMessage.role,
+                    type_coerce(ChatMessage.data, Text).label("data"), ChatMessage.token_count,
+                )
+                .where(ChatMessage.chat_id == chat_id)
+                .order_by(ChatMessage.seq)
+            )
+            raw = encode(result)
+            data = zlib.compress(raw, self.settings.archive_compression_level)
+
+            engine = await self._get_engine()
+            statement = sqlite_insert(archived_chat).values(
+                chat_id=chat_id, message_count=message_count, raw_bytes=len(raw), data=data,
+                archived_at=time.time(),
+            )
+            async with engine.begin() as conn:
+                await conn.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=["chat_id"],
+                        set_={c: statement.excluded[c] for c in ["message_count", "raw_bytes", "data", "archived_at"]},
+                    )
+                )
+
+            # Unless a turn got in meanwhile (e.g. in another worker)
+            archived = await db.execute(
+                update(Chat)
+                .where(
+                    Chat.id == chat_id, Chat.archived_at.is_(None), Chat.message_count == message_count,
+                    Chat.active_at < cutoff,
+                )
+                .values(archived_at=_now())
+                .execution_options(synchronize_session=False)
+            )
+            if not archived.rowcount:
+                await db.rollback()
+                async with engine.begin() as conn:
+                    await conn.execute(delete(archived_chat).where(archived_chat.c.chat_id == chat_id))
+                return None
+            await db.execute(delete(ChatMessage).where(ChatMessage.chat_id == chat_id))
+            await db.commit()
+
+        self.stats["archived"] += 1
+        self.stats["raw_bytes"] += len(raw)
+        self.stats["compressed_bytes"] += len(data)
+        return len(raw), len(data)
+
+    async def compact(self) -> dict:
+        """Archive up to ``archive_batch_size`` of the chats idle the longest."""
+        start = time.perf_counter()
+        cutoff = _now() - timedelta(seconds=self.settings.archive_after)
+        async with SessionLocal() as db:
+            chat_ids = (
+                await db.scalars(
+                    select(Chat.id)
+                    .where(Chat.archived_at.is_(None), Chat.active_at < cutoff)
+                    .order_by(Chat.active_at)
+                    .limit(self.settings.archive_batch_size)
+                )
+            ).all()
+
+        report = {"archived": 0, "raw_bytes": 0, "compressed_bytes": 0}
+        for chat_id in chat_ids:
+            sizes = await self.archive_chat(chat_id, cutoff)
+            if sizes is not None:
+                report["archived"] += 1
+                report["raw_bytes"] += sizes[0]
+                report["compressed_bytes"] += sizes[1]
+        report["bytes_saved"] = report["raw_bytes"] - report["compressed_bytes"]
+        report["seconds"] = round(time.perf_counter() - start, 3)
+        return report
+
+    async def info(self) -> dict:
+        """
+        This worker's counts and mean hot / cold load times since it
+        started, plus the archive's totals.
+        """
+        engine = await self._get_engine()
+        async with engine.connect() as conn:
+            chats, raw_bytes, compressed_bytes = (
+                await conn.execute(
+                    select(
+                        func.count(),
+                        func.coalesce(func.sum(archived_chat.c.raw_bytes), 0),
+                        func.coalesce(func.sum(func.length(archived_chat.c.data)), 0),
+                    )
+                )
+            ).one()
+        return {
+            **self.stats,
+            "archive": {
+                "chats": chats,
+                "raw_bytes": raw_bytes,
+                "compressed_bytes": compressed_bytes,
+                "bytes_saved": raw_bytes - compressed_bytes,
+            },
+            "load_ms": {
+                tier: {"loads": loads, "mean": round(seconds / loads * 1000, 3) if loads else None}
+                for tier, (loads, seconds) in self._loads.items()
+            },
+        }
+
+    async def aclose(self) -> None:
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
+
+
+chat_archive = ChatArchive(settings)
+
+
+# Queued under a fixed dedupe key (see main.compact_archive), held only while
+# the job is pending, so repeated requests queue one pass at a time
+@jobs.handler("archive_idle_chats", keep_dedupe_key=False)
+async def archive_idle_chats(db: AsyncSession, payload: dict) -> None:
+    report = await chat_archive.compact()
+    logger.info("Archived idle chats: %s", report)
+
+
+async def main() -> None:
+    """Run one compaction pass and print its report, e.g. from cron."""
+    print(orjson.dumps(await chat_archive.compact(), option=orjson.OPT_INDENT_2).decode())
+    await chat_archive.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,523 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import (
+    JSON, Column, DateTime, Index, Integer, MetaData, String, Table, delete, event, func, insert,
+    inspect, select, tuple_, union_all, update,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from config import Settings, settings
+from database import RoutingSession, SessionLocal
+from models import AuditEntity, AuditJournal, AuditSnapshot, Chat, FormSubmission
+
+logger = logging.getLogger(__name__)
+
+# Audited models, by entity_type (their table name)
+AUDITED = {model.__tablename__: model for model in (Chat, FormSubmission)}
+PARTITION_PREFIX = "audit_log_"
+
+journal = AuditJournal.__table__
+JOURNAL_COLUMNS = [c.key for c in journal.c if c.key != "id"]
+partition_metadata = MetaData()
+
+
+def partition_name(when: datetime) -> str:
+    return f"{PARTITION_PREFIX}{when:%Y_%m}"
+
+
+def partition(name: str) -> Table:
+    """
+    The monthly table ``name`` holding the changes made that month. Rows are
+    the journal's, with its id as ``seq``. Tables are created by the flusher
+    when their month starts, so they aren't part of the migrations.
+    """
+    table = partition_metadata.tables.get(name)
+    if table is None:
+        table = Table(
+            name,
+            partition_metadata,
+            Column("seq", Integer, primary_key=True),
+            Column("entity_type", String, nullable=False),
+            Column("entity_id", String, nullable=False),
+            Column("action", String, nullable=False),
+            Column("changes", JSON, nullable=False),
+            Column("changed_at", DateTime, nullable=False),
+            Index(f"ix_{name}_entity", "entity_type", "entity_id", "seq"),
+        )
+    return table
+
+
+# --- Capture -----------------------------------------------------------------
+# Deltas come from the attribute history SQLAlchemy already keeps for the
+# flush, so nothing is re-read or compared field by field. All of a flush's
+# deltas are journaled with a single executemany INSERT.
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _changes(state, action: str) -> dict:
+    changes = {}
+    for attr in state.mapper.column_attrs:
+        key = attr.key
+        if action == "update":
+            history = state.attrs[key].history
+            if not history.added:
+                continue
+            change = {"new": _plain(history.added[0])}
+            if history.deleted:
+                change["old"] = _plain(history.deleted[0])
+        elif action == "insert":
+            change = {"new": _plain(state.dict.get(key))}
+        else:
+            change = {"old": _plain(state.dict.get(key))}
+        changes[key] = change
+    return changes
+
+
+def _record(state, action: str, changes: dict, now: datetime) -> dict:
+    return {
+        "entity_type": state.mapper.local_table.name,
+        "entity_id": state.dict["id"],
+        "action": action,
+        "changes": changes,
+        "changed_at": now,
+    }
+
+
+def _row(record: dict) -> dict:
+    return {key: record[key] for key in JOURNAL_COLUMNS}
+
+
+def stage(session: Session, records: List[dict]) -> None:
+    """
+    Journal ``records`` in the session's transaction, so they are committed
+    or rolled back with the change they describe. Once the transaction
+    commits they are handed to the flusher.
+    """
+    if not records:
+        return
+    result = session.connection().execute(
+        insert(journal).returning(journal.c.id, sort_by_parameter_order=True), [_row(r) for r in records]
+    )
+    for record, seq in zip(records, result.scalars()):
+        record["seq"] = seq
+    session.info.setdefault("audit_records", []).extend(records)
+
+
+async def current_values(db: AsyncSession, model, filters: list, keys: list) -> Optional[dict]:
+    """
+    ``keys`` of the ``model`` rows matching ``filters``, by id, or None if
+    ``model`` isn't audited. Read on the writer, so in the transaction of
+    the bulk UPDATE about to replace them (see stage_objects).
+    """
+    if not settings.audit_enabled or model.__tablename__ not in AUDITED:
+        return None
+    db.sync_session.use_writer()
+    result = await db.execute(select(model.id, *(getattr(model, key) for key in keys)).where(*filters))
+    return {row[0]: dict(zip(keys, row[1:])) for row in result}
+
+
+def stage_objects(
+    session: Session, action: str, objs: list, values: Optional[dict] = None, before: Optional[dict] = None
+) -> None:
+    """
+    Audit rows written by a bulk INSERT/UPDATE/DELETE ... RETURNING, which
+    bypasses the flush. For updates, ``before`` holds the rows' values
+    from before the UPDATE (see current_values): only the ``values`` that
+    changed are recorded, and rows where none did aren't.
+    """
+    if not settings.audit_enabled or not objs:
+        return
+    if inspect(objs[0]).mapper.local_table.name not in AUDITED:
+        return
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    records = []
+    for obj in objs:
+        state = inspect(obj)
+        if action == "update":
+            old = (before or {}).get(state.dict["id"], {})
+            changes = {}
+            for key in values:
+                new = state.dict.get(key, values[key])
+                if key not in old:
+                    changes[key] = {"new": _plain(new)}
+                elif old[key] != new:
+                    changes[key] = {"old": _plain(old[key]), "new": _plain(new)}
+            if not changes:
+                continue
+        else:
+            changes = _changes(state, action)
+        records.append(_record(state, action, changes, now))
+    stage(session, records)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _capture_flush(session, flush_context):
+    # The session still lists the flushed objects, and their attribute history
+    # is still there, until after this event
+    if not settings.audit_enabled:
+        return
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    records = []
+    for action, objs in (("insert", session.new), ("update", session.dirty), ("delete", session.deleted)):
+        for obj in objs:
+            state = inspect(obj)
+            if state.mapper.local_table.name not in AUDITED:
+                continue
+            changes = _changes(state, action)
+            if changes:
+                records.append(_record(state, action, changes, now))
+    stage(session, records)
+
+
+# Called with each committed transaction's records, in commit order (see feed.py)
+committed_hooks: List[Callable[[List[dict]], None]] = []
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _queue_committed(session):
+    records = session.info.pop("audit_records", None)
+    if records:
+        audit_log.enqueue(records)
+        for hook in committed_hooks:
+            hook(records)
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _drop_rolled_back(session):
+    session.info.pop("audit_records", None)
+
+
+# --- Reading -----------------------------------------------------------------
+
+async def _partitions(db: AsyncSession) -> List[str]:
+    names = await db.run_sync(lambda session: inspect(session.connection()).get_table_names())
+    return sorted(name for name in names if name.startswith(PARTITION_PREFIX))
+
+
+async def _deltas(
+    db: AsyncSession,
+    entity_type: str,
+    entity_id: str,
+    *,
+    after: Optional[int] = None,
+    upto: Optional[int] = None,
+    before: Optional[int] = None,
+    since: Optional[datetime] = None,
+    newest_first: bool = False,
+    limit: Optional[int] = None,
+) -> list:
+    """
+    (seq, action, changes, changed_at) of an entity's changes with
+    ``after < seq <= upto`` and ``seq < before``, from the partitions of
+    ``since``'s month on plus the journal, which holds the changes the
+    flusher hasn't moved yet.
+    """
+    first = partition_name(since) if since is not None else ""
+    tables = [partition(name) for name in await _partitions(db) if name >= first]
+    selects = []
+    for table in [*tables, journal]:
+        seq = table.c.id if table is journal else table.c.seq
+        statement = select(
+            seq.label("seq"), table.c.action, table.c.changes, table.c.changed_at
+        ).where(table.c.entity_type == entity_type, table.c.entity_id == entity_id)
+        if after is not None:
+            statement = statement.where(seq > after)
+        if upto is not None:
+            statement = statement.where(seq <= upto)
+        if before is not None:
+            statement = statement.where(seq < before)
+        selects.append(statement)
+    changes = union_all(*selects).subquery()
+    statement = select(changes).order_by(changes.c.seq.desc() if newest_first else changes.c.seq).limit(limit)
+    result = await db.execute(statement)
+    return result.all()
+
+
+async def _latest_snapshot(
+    db: AsyncSession, entity_type: str, entity_id: str, upto: int
+) -> Optional[AuditSnapshot]:
+    statement = (
+        select(AuditSnapshot)
+        .filter(
+            AuditSnapshot.entity_type == entity_type,
+            AuditSnapshot.entity_id == entity_id,
+            AuditSnapshot.seq <= upto,
+        )
+        .order_by(AuditSnapshot.seq.desc())
+        .limit(1)
+    )
+    return await db.scalar(statement)
+
+
+def _apply(state: Optional[dict], action: str, changes: dict) -> Optional[dict]:
+    if action == "delete":
+        return None
+    state = dict(state or {})
+    for field, change in changes.items():
+        state[field] = change["new"]
+    return state
+
+
+async def _replay(
+    db: AsyncSession, entity_type: str, entity_id: str, upto: int, since: Optional[datetime] = None
+) -> Tuple[Optional[dict], list]:
+    """
+    Start from the latest snapshot at or before ``upto`` and list the deltas
+    from there to ``upto``; returns (snapshot state, deltas).
+    """
+    snapshot = await _latest_snapshot(db, entity_type, entity_id, upto)
+    if snapshot is None:
+        deltas = await _deltas(db, entity_type, entity_id, upto=upto, since=since)
+        return None, deltas
+    deltas = await _deltas(
+        db, entity_type, entity_id, after=snapshot.seq, upto=upto, since=snapshot.changed_at
+    )
+    return snapshot.data, deltas
+
+
+async def history(
+    db: AsyncSession,
+    entity_type: str,
+    entity_id: str,
+    *,
+    before: Optional[int] = None,
+    limit: int = 20,
+    since: Optional[datetime] = None,
+) -> List[dict]:
+    """
+    An entity's changes, newest first, each with ``data``: the full state
+    right after it (None once deleted), rebuilt from the nearest earlier
+    snapshot. Pages by ``before``, the seq of the previous page's last entry.
+    ``since`` (e.g. the entity's creation time) lets older partitions be
+    skipped.
+    """
+    page = await _deltas(
+        db, entity_type, entity_id, before=before, since=since, newest_first=True, limit=limit
+    )
+    if not page:
+        return []
+    state, deltas = await _replay(db, entity_type, entity_id, upto=page[-1].seq, since=since)
+    for row in deltas:
+        state = _apply(state, row.action, row.changes)
+    # The page itself, oldest first, carrying the state forward
+    entries = []
+    for row in reversed(page):
+        if row.seq > page[-1].seq:
+            state = _apply(state, row.action, row.changes)
+        entries.append({**row._asdict(), "data": state})
+    return entries[::-1]
+
+
+async def changes_after(db: AsyncSession, seq: int, limit: int) -> List[dict]:
+    """
+    Up to ``limit`` changes with a seq above ``seq``, oldest first, committed
+    by any process: the journal's, and those the flusher has moved since to
+    the latest partitions. Both are read with one statement, so a change is
+    never seen in both or in neither.
+    """
+    while True:
+        names = (await _partitions(db))[-2:]
+        selects = [select(journal.c.id.label("seq"), *(journal.c[k] for k in JOURNAL_COLUMNS)).where(journal.c.id > seq)]
+        for table in map(partition, names):
+            selects.append(select(table.c.seq, *(table.c[k] for k in JOURNAL_COLUMNS)).where(table.c.seq > seq))
+        changes = union_all(*selects).subquery()
+        result = await db.execute(select(changes).order_by(changes.c.seq).limit(limit))
+        records = [row._asdict() for row in result]
+        # A partition created meanwhile (a new month) may hold changes moved
+        # out of the journal after the tables were listed
+        if (await _partitions(db))[-2:] == names:
+            return records
+
+
+# --- Flushing ----------------------------------------------------------------
+
+class AuditLog:
+    def __init__(self, settings: Settings):
+        """
+        Moves journaled changes to the monthly audit_log_* tables in the
+        background, so audit bookkeeping stays off the request path.
+
+        Committed records wait in a bounded in-process queue and are flushed
+        in batches of ``audit_batch_size`` or every ``audit_flush_interval``
+        seconds. The journal is the durable copy: a flush claims its records
+        by deleting them from it, in the same transaction as it stores them.
+        Whatever the queue never delivered (process restart, queue overflow,
+        failed flush, other workers' leftovers) is recovered from the journal.
+        """
+        self.settings = settings
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Set when committed records may be in the journal only
+        self._recover = True
+        self.stats = {"flushed": 0, "batches": 0, "overflows": 0, "snapshots": 0, "errors": 0}
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.settings.audit_queue_size)
+        self._recover = True
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the flusher, flushing what is still queued."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        queue, self._task, self._queue = self._queue, None, None
+        records = []
+        while not queue.empty():
+            records.extend(queue.get_nowait())
+        if records:
+            await self.flush(records)
+
+    def enqueue(self, records: List[dict]) -> None:
+        if self._queue is None:
+            return  # Not running: recovered from the journal on start
+        try:
+            self._queue.put_nowait(records)
+        except asyncio.QueueFull:
+            self._recover = True
+            self.stats["overflows"] += 1
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if self._recover:
+                    self._recover = False
+                    await self.recover()
+                await self.flush(await self._collect())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Nothing is lost: the records are still in the journal
+                logger.exception("Flushing the audit log failed")
+                self.stats["errors"] += 1
+                self._recover = True
+                await asyncio.sleep(self.settings.audit_flush_interval)
+
+    async def _collect(self) -> List[dict]:
+        """Wait for records, then gather more until the batch is full or the interval is up."""
+        loop = asyncio.get_running_loop()
+        records = list(await self._queue.get())
+        deadline = loop.time() + self.settings.audit_flush_interval
+        while len(records) < self.settings.audit_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                records.extend(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return records
+
+    async def flush(self, records: List[dict]) -> None:
+        async with SessionLocal() as db:
+            result = await db.scalars(
+                delete(journal)
+                .where(journal.c.id.in_([r["seq"] for r in records]))
+                .returning(journal.c.id)
+            )
+            # Records a recovery pass already moved are skipped
+            claimed = set(result.all())
+            await self._store(db, [r for r in records if r["seq"] in claimed])
+            await db.commit()
+
+    async def recover(self) -> None:
+        """Move everything left in the journal, oldest first."""
+        batch_size = self.settings.audit_batch_size
+        while True:
+            async with SessionLocal() as db:
+                oldest = select(journal.c.id).order_by(journal.c.id).limit(batch_size).scalar_subquery()
+                result = await db.execute(
+                    delete(journal)
+                    .where(journal.c.id.in_(oldest))
+                    .returning(journal.c.id.label("seq"), *[c for c in journal.c if c.key != "id"])
+                )
+                records = [row._asdict() for row in result]
+                await self._store(db, records)
+                await db.commit()
+            if len(records) < batch_size:
+                return
+
+    async def _store(self, db: AsyncSession, records: List[dict]) -> None:
+        if not records:
+            return
+        by_partition = defaultdict(list)
+        for record in records:
+            by_partition[partition_name(record["changed_at"])].append(record)
+        for name, rows in by_partition.items():
+            table = partition(name)
+            await db.execute(CreateTable(table, if_not_exists=True))
+            for index in table.indexes:
+                await db.execute(CreateIndex(index, if_not_exists=True))
+            await db.execute(insert(table), [{"seq": r["seq"], **_row(r)} for r in rows])
+        await self._update_snapshots(db, records)
+        self.stats["flushed"] += len(records)
+        self.stats["batches"] += 1
+
+    async def _update_snapshots(self, db: AsyncSession, records: List[dict]) -> None:
+        """
+        Count each entity's changes and snapshot it once
+        ``audit_snapshot_every`` have piled up since the last snapshot. A
+        snapshot at seq N needs every earlier change moved already, so it
+        waits while the journal still holds older records.
+        """
+        batch = {}
+        for record in records:
+            key = (record["entity_type"], record["entity_id"])
+            count, last = batch.get(key, (0, record))
+            batch[key] = (count + 1, record if record["seq"] > last["seq"] else last)
+        result = await db.execute(
+            select(AuditEntity.entity_type, AuditEntity.entity_id, AuditEntity.last_seq, AuditEntity.changes_since_snapshot)
+            .filter(tuple_(AuditEntity.entity_type, AuditEntity.entity_id).in_(list(batch)))
+        )
+        known = {(row.entity_type, row.entity_id): row for row in result}
+        oldest_pending = await db.scalar(select(func.min(journal.c.id)))
+
+        inserts, updates, gone, snapshots = [], [], [], []
+        for key, (count, last) in batch.items():
+            row = known.get(key)
+            if row is not None:
+                count += row.changes_since_snapshot
+            last_seq = max(row.last_seq, last["seq"]) if row is not None else last["seq"]
+            if last["action"] == "delete" and last_seq == last["seq"]:
+                if row is not None:
+                    gone.append(key)
+                continue
+            if count >= self.settings.audit_snapshot_every and (oldest_pending is None or last_seq < oldest_pending):
+                state, deltas = await _replay(db, *key, upto=last_seq)
+                for delta in deltas:
+                    state = _apply(state, delta.action, delta.changes)
+                if deltas:
+                    snapshots.append({
+                        "entity_type": key[0], "entity_id": key[1], "seq": deltas[-1].seq,
+                        "changed_at": deltas[-1].changed_at, "data": state,
+                    })
+                count = 0
+            values = {"entity_type": key[0], "entity_id": key[1], "last_seq": last_seq, "changes_since_snapshot": count}
+            (updates if row is not None else inserts).append(values)
+
+        if inserts:
+            await db.execute(insert(AuditEntity), inserts)
+        if updates:
+            await db.execute(update(AuditEntity), updates)
+        if gone:
+            await db.execute(
+                delete(AuditEntity).where(tuple_(AuditEntity.entity_type, AuditEntity.entity_id).in_(gone))
+            )
+        if snapshots:
+            await db.execute(insert(AuditSnapshot), snapshots)
+            self.stats["snapshots"] += len(snapshots)
+
+
+audit_log = AuditLog(settings)
@@ -0,0 +1,12 @@
+"""
+Offline benchmarks for the backend.
+
+Run them from the backend directory, e.g. ``python -m benchmarks.chat_concurrency``.
+Nothing here talks to the real OpenAI API: completions are served by the local
+stub in ``benchmarks.stub_llm``, and bulk data comes from the generators in
+``benchmarks.seed``.
+
+``benchmarks.suite`` runs the main scenarios together and can check a run
+against an earlier JSON baseline; the other modules each look at one question
+in more depth.
+"""
@@ -0,0 +1,88 @@
+"""
+What the audit trail costs a form update.
+
+Runs ``--updates`` form updates through ``crud.form.update``, ``--concurrency``
+at a time, in three modes:
+
+- off: AUDIT_ENABLED=false
+- write_behind: the shipped design, where the update's transaction only
+  journals its deltas and the background flusher moves them to the
+  partitions in batches
+- inline: each update's deltas are moved to the partitions (partition
+  insert, snapshot bookkeeping) right after it commits, before the update
+  returns, which is roughly the cost of auditing synchronously on the
+  request path
+
+    python -m benchmarks.audit_overhead --updates 5000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import summarize, temp_database
+
+
+async def run_mode(mode: str, updates: int, concurrency: int) -> dict:
+    import audit
+    import crud
+    import schemas
+    from config import settings
+    from database import SessionLocal
+
+    settings.audit_enabled = mode != "off"
+    inline = []
+    enqueue = audit.audit_log.enqueue
+    if mode == "inline":
+        audit.audit_log.enqueue = inline.append
+    async with temp_database():
+        async with SessionLocal() as db:
+            chat = await crud.chat.create(db, obj_in=schemas.ChatCreate())
+            forms = await crud.form.create_many(db, objs_in=[
+                schemas.FormSubmissionCreate(
+                    name=f"Person {i}", email=f"p{i}@example.com", phone_number="5550100", chat_id=chat.id
+                )
+                for i in range(concurrency * 10)
+            ])
+        form_ids = [f.id for f in forms]
+        if mode == "write_behind":
+            audit.audit_log.start()
+
+        latencies = []
+
+        async def worker(offset: int):
+            for i in range(offset, updates, concurrency):
+                start = time.perf_counter()
+                async with SessionLocal() as db:
+                    form_obj = await crud.form.get(db, id=form_ids[i % len(form_ids)])
+                    await crud.form.update(
+                        db, db_obj=form_obj, obj_in={"status": i % 3 + 1}, refresh=False
+                    )
+                if inline:
+                    await audit.audit_log.flush(inline.pop())
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        if mode == "write_behind":
+            await audit.audit_log.stop()
+    audit.audit_log.enqueue = enqueue
+    return {"updates_per_second": round(updates / elapsed), **summarize(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    result = {
+        mode: asyncio.run(run_mode(mode, args.updates, args.concurrency))
+        for mode in ["off", "write_behind", "inline"]
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
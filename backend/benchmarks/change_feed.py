@@ -0,0 +1,94 @@
+"""
+Cost of the change feed with many idle subscribers: ``--subscribers``
+per-chat subscriptions spread over ``--chats`` chats plus ``--global``
+subscriptions to every chat, each consumed like the SSE endpoint does.
+Reports the time of a form update, the time from starting the update
+until its event, read back from the audit trail, reached a subscriber, and
+memory per subscriber (its consuming task included).
+
+    python -m benchmarks.change_feed --subscribers 5000
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+
+from benchmarks.common import summarize, temp_database
+from benchmarks.seed import chat_id, form_id, seed_chats
+
+
+async def run(chats: int, subscribers: int, everything: int, writes: int) -> dict:
+    import audit
+    import crud
+    from database import SessionLocal
+    from feed import change_feed
+    import schemas
+
+    delivered = {}
+    consumers = []
+
+    async def consume(chat: str) -> None:
+        async for event in change_feed.events(chat, None):
+            if event["type"] == "change":
+                delivered.setdefault(event["seq"], time.perf_counter())
+
+    async with temp_database() as engine:
+        seed_chats(engine.url.database, chats, forms_every=1)
+        audit.audit_log.start()
+        await change_feed.start()
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(subscribers):
+            consumers.append(asyncio.create_task(consume(chat_id(i % chats))))
+        for _ in range(everything):
+            consumers.append(asyncio.create_task(consume(None)))
+        await asyncio.sleep(0.1)
+        per_subscriber = (tracemalloc.get_traced_memory()[0] - before) / max(1, len(consumers))
+        tracemalloc.stop()
+
+        update_samples, delivery_samples = [], []
+        for i in range(writes):
+            last_seq = change_feed.last_seq
+            async with SessionLocal() as db:
+                form = await crud.form.get(db, id=form_id(i % chats))
+                start = time.perf_counter()
+                await crud.form.update(db, db_obj=form, obj_in=schemas.FormSubmissionUpdate(name=f"Renamed {i}"))
+                update_samples.append(time.perf_counter() - start)
+            if consumers:
+                while change_feed.last_seq == last_seq:
+                    await asyncio.sleep(0)
+                seq = change_feed.last_seq
+                while seq not in delivered:
+                    await asyncio.sleep(0)
+                delivery_samples.append(delivered[seq] - start)
+
+        for task in consumers:
+            task.cancel()
+        await asyncio.gather(*consumers, return_exceptions=True)
+        await change_feed.stop()
+        await audit.audit_log.stop()
+
+    return {
+        "subscribers": len(consumers),
+        "bytes_per_subscriber": round(per_subscriber),
+        "update": summarize(update_samples),
+        "delivery": summarize(delivery_samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--global", dest="everything", type=int, default=10)
+    parser.add_argument("--writes", type=int, default=200)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.chats, args.subscribers, args.everything, args.writes))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
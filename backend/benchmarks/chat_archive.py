@@ -0,0 +1,81 @@
+"""
+What archiving idle chats saves and costs: seeds ``--chats`` chats of
+``--messages`` messages (all idle), runs one compaction pass into a
+temporary archive, then times ``GET /chat/{chat_id}?limit=50`` on archived
+chats (cold: each is restored on the way) and again once they are back
+(hot). Reports the bytes moved out of the app database, their compressed
+size and the app database's used pages before and after.
+
+    python -m benchmarks.chat_archive --chats 1000 --messages 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import summarize, temp_database
+from benchmarks.seed import chat_id, seed_chats
+
+
+def used_bytes(path: str) -> int:
+    """Bytes of the database's pages that aren't on the freelist."""
+    conn = sqlite3.connect(path)
+    page_size, pages, free = (conn.execute(f"PRAGMA {p}").fetchone()[0] for p in ("page_size", "page_count", "freelist_count"))
+    conn.close()
+    return (pages - free) * page_size
+
+
+async def run(chats: int, messages: int, reads: int) -> dict:
+    from archive import chat_archive
+    from config import settings
+    from main import app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        await chat_archive.aclose()
+        settings.archive_path = os.path.join(tmp, "archive.db")
+        settings.archive_batch_size = chats
+        async with temp_database() as engine:
+            path = engine.url.database
+            seed_chats(path, chats, messages, forms_every=0)
+            before = used_bytes(path)
+            report = await chat_archive.compact()
+            after = used_bytes(path)
+
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                samples = {}
+                for tier in ["cold", "hot"]:
+                    samples[tier] = []
+                    for i in range(min(reads, chats)):
+                        start = time.perf_counter()
+                        resp = await client.get(f"/chat/{chat_id(i)}?limit=50")
+                        samples[tier].append(time.perf_counter() - start)
+                        assert resp.status_code == 200 and len(resp.json()["messages"]) == min(50, messages)
+        await chat_archive.aclose()
+
+    return {
+        "compaction": report,
+        "app_db_used_bytes": {"before": before, "after": after},
+        "cold_get": summarize(samples["cold"]),
+        "hot_get": summarize(samples["hot"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--reads", type=int, default=200)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.chats, args.messages, args.reads))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Latency of unrelated endpoints while many chat turns are in flight.
+
+Starts the stub completion server, fires ``--turns`` concurrent
+``PUT /chat/{chat_id}`` turns (each one does a tool-call round trip, so two
+completions per turn) and, while they run, keeps probing ``GET /`` and
+``GET /chat``. With a blocking LLM client every probe waits behind a
+completion; with the async client they stay in the low milliseconds.
+
+With ``--max-probe-ms`` the exit status is 1 if any probe took longer. A
+probe that waits for a turn (e.g. for a database connection the turn holds
+through its completions) takes about a completion, and each probe waits for
+the previous one, so it is the max that shows it, not the percentiles. With
+a stub latency well above the threshold this catches it:
+
+    python -m benchmarks.chat_concurrency --turns 100 --latency 0.5
+    python -m benchmarks.chat_concurrency --turns 20 --latency 3 --max-probe-ms 1000
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import summarize, temp_database
+from benchmarks.stub_llm import StubConfig, StubServer
+
+
+async def probe(client: httpx.AsyncClient, url: str, samples: list, done: asyncio.Event, interval: float):
+    while not done.is_set():
+        start = time.perf_counter()
+        resp = await client.get(url)
+        resp.raise_for_status()
+        samples.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+
+
+async def run(turns: int, interval: float, stub_url: str) -> dict:
+    from config import settings
+    from llm import llm
+    from main import app
+
+    settings.openai_base_url = stub_url
+    settings.openai_api_key = "stub"
+    # Every turn sends the same prompt; measure the model path, not the cache
+    settings.llm_cache_enabled = False
+
+    async with temp_database():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            chat_ids = []
+            for _ in range(turns):
+                resp = await client.post("/chat", json={})
+                chat_ids.append(resp.json()["id"])
+
+            turn_latencies: list = []
+
+            async def turn(chat_id: str):
+                start = time.perf_counter()
+                resp = await client.put(
+                    f"/chat/{chat_id}",
+                    json={"messages": [{"role": "user", "content": "Sign me up, I'm Jane"}]},
+                )
+                resp.raise_for_status()
+                turn_latencies.append(time.perf_counter() - start)
+
+            done = asyncio.Event()
+            probes = {"GET /": [], "GET /chat": []}
+            probe_tasks = [
+                asyncio.create_task(probe(client, "/", probes["GET /"], done, interval)),
+                asyncio.create_task(probe(client, "/chat", probes["GET /chat"], done, interval)),
+            ]
+
+            start = time.perf_counter()
+            await asyncio.gather(*(turn(c) for c in chat_ids))
+            elapsed = time.perf_counter() - start
+            done.set()
+            await asyncio.gather(*probe_tasks)
+
+        await llm.aclose()
+
+    return {
+        "turns": turns,
+        "wall_time_s": round(elapsed, 3),
+        "chat_turn": summarize(turn_latencies),
+        **{name: summarize(samples) for name, samples in probes.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.5, help="stub completion latency in seconds")
+    parser.add_argument("--tool-calls", type=int, default=2, help="parallel tool calls per turn")
+    parser.add_argument("--interval", type=float, default=0.01, help="pause between probe requests")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-probe-ms", type=float, help="fail if any probe took longer than this")
+    args = parser.parse_args()
+
+    with StubServer(StubConfig(latency=args.latency, tool_calls=args.tool_calls), port=args.port) as stub:
+        result = asyncio.run(run(args.turns, args.interval, stub.base_url))
+    print(json.dumps(result, indent=2))
+
+    if args.max_probe_ms is not None:
+        slow = [name for name in ["GET /", "GET /chat"] if result[name]["max_ms"] > args.max_probe_ms]
+        for name in slow:
+            print(f"{name}: max {result[name]['max_ms']} ms is above {args.max_probe_ms} ms", file=sys.stderr)
+        if slow:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
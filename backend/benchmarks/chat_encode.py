@@ -0,0 +1,84 @@
+"""
+Time spent encoding chat responses: ``GET /chat/{chat_id}`` on chats of
+``--messages`` messages, as served now (the stored message JSON spliced into
+the response bytes) and through the previous path, where the messages were
+parsed into dicts, put in a ``schemas.Chat`` and validated and encoded again
+by FastAPI's ``response_model`` handling. The previous path is mounted on a
+separate app against the same database.
+
+    python -m benchmarks.chat_encode --messages 1000
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Optional
+
+import httpx
+from fastapi import Depends, FastAPI, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from benchmarks.common import summarize, temp_database
+from benchmarks.seed import chat_id, seed_chats
+
+
+def legacy_app() -> FastAPI:
+    import crud
+    import schemas
+    from main import get_db
+
+    app = FastAPI()
+
+    @app.get("/chat/{chat_id}", response_model=schemas.Chat)
+    async def get_chat(
+        chat_id: str, limit: Optional[int] = Query(None), db: AsyncSession = Depends(get_db)
+    ):
+        chat = await crud.chat.get(db, id=chat_id)
+        messages = await crud.chat.get_messages(db, chat_id=chat_id, limit=limit)
+        return schemas.Chat(
+            id=chat.id,
+            created_at=chat.created_at,
+            messages=[m.data for m in messages],
+            message_count=chat.message_count,
+            first_seq=messages[0].seq if messages else None,
+        )
+
+    return app
+
+
+async def run(chats: int, messages: int, requests: int) -> dict:
+    from main import app
+
+    results = {}
+    async with temp_database() as engine:
+        seed_chats(engine.url.database, chats, messages, forms_every=0)
+        for name, target in [("response_model", legacy_app()), ("raw_json", app)]:
+            transport = httpx.ASGITransport(app=target)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                for label, params in [("full", {}), ("last_50", {"limit": 50})]:
+                    samples = []
+                    for i in range(requests):
+                        start = time.perf_counter()
+                        resp = await client.get(f"/chat/{chat_id(i % chats)}", params=params)
+                        resp.raise_for_status()
+                        samples.append(time.perf_counter() - start)
+                    results[f"{name}_{label}"] = {"response_bytes": len(resp.content), **summarize(samples)}
+    for label in ["full", "last_50"]:
+        before, after = results[f"response_model_{label}"]["p50_ms"], results[f"raw_json_{label}"]["p50_ms"]
+        results[f"speedup_{label}"] = round(before / after, 2) if after else None
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=100)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.chats, args.messages, args.requests))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Latency of listing chats in a large database.
+
+Seeds ``--chats`` chats (each with ``--messages`` messages and every tenth
+with a form submission), then times ``GET /chat`` for the first page and for
+a page from the middle of the table (reached through its cursor), next to
+the previous approach: OFFSET paging that loads every listed chat's messages.
+
+    python -m benchmarks.chat_listing --chats 1000000
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import timedelta
+
+import httpx
+from sqlalchemy import select
+
+from benchmarks.common import summarize, temp_database
+from benchmarks.seed import START, chat_id, seed_chats
+
+
+async def timed(samples: list, coro):
+    start = time.perf_counter()
+    result = await coro
+    samples.append(time.perf_counter() - start)
+    return result
+
+
+async def offset_listing(skip: int, limit: int) -> list:
+    """What GET /chat used to do: OFFSET paging plus every listed chat's messages."""
+    import models
+    from database import SessionLocal
+
+    async with SessionLocal() as db:
+        chats = (await db.scalars(select(models.Chat).offset(skip).limit(limit))).all()
+        messages = await db.scalars(
+            select(models.ChatMessage)
+            .where(models.ChatMessage.chat_id.in_([c.id for c in chats]))
+            .order_by(models.ChatMessage.chat_id, models.ChatMessage.seq)
+        )
+        return [m.data for m in messages]
+
+
+async def run(chats: int, messages: int, requests: int, limit: int) -> dict:
+    from main import app, encode_cursor
+
+    results = {}
+    async with temp_database() as engine:
+        start = time.perf_counter()
+        seed_chats(engine.url.database, chats, messages)
+        results["seed_seconds"] = round(time.perf_counter() - start, 1)
+
+        # Cursor of the chat right before the middle of the listing
+        middle = chats // 2
+        cursor = encode_cursor(START + timedelta(seconds=middle), chat_id(middle))
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for name, params in [
+                ("cursor_first_page", {"limit": limit}),
+                ("cursor_middle_page", {"limit": limit, "cursor": cursor}),
+            ]:
+                samples: list = []
+                for _ in range(requests):
+                    resp = await timed(samples, client.get("/chat", params=params))
+                    resp.raise_for_status()
+                results[name] = {"response_bytes": len(resp.content), **summarize(samples)}
+
+        for name, skip in [("offset_first_page", 0), ("offset_middle_page", middle)]:
+            samples = []
+            for _ in range(requests):
+                await timed(samples, offset_listing(skip, limit))
+            results[name] = summarize(samples)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=1_000_000)
+    parser.add_argument("--messages", type=int, default=2)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.chats, args.messages, args.requests, args.limit))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+What the frontend's polling of an open chat costs: ``GET /chat/{chat_id}``
+and ``GET /chat/{chat_id}/forms`` on chats of ``--messages`` messages, with
+READ_CACHE_ENABLED=false, with the read cache, and with the cache plus
+If-None-Match (what a browser sends once it has the ETag), which is
+answered with a 304.
+
+    python -m benchmarks.chat_polling --messages 1000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.common import summarize, temp_database
+from benchmarks.seed import chat_id, seed_chats
+
+
+async def run(chats: int, messages: int, requests: int) -> dict:
+    from config import settings
+    from main import app
+    from read_cache import read_cache
+
+    results = {}
+    async with temp_database() as engine:
+        seed_chats(engine.url.database, chats, messages, forms_every=1)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for mode in ["uncached", "cached", "conditional"]:
+                settings.read_cache_enabled = mode != "uncached"
+                read_cache.clear()
+                for name, path in [("chat", "/chat/{}"), ("forms", "/chat/{}/forms")]:
+                    etags = {}
+                    samples = []
+                    for i in range(requests):
+                        url = path.format(chat_id(i % chats))
+                        headers = {"If-None-Match": etags[url]} if mode == "conditional" and url in etags else {}
+                        start = time.perf_counter()
+                        resp = await client.get(url, headers=headers)
+                        samples.append(time.perf_counter() - start)
+                        if resp.status_code == 200 and "etag" in resp.headers:
+                            etags[url] = resp.headers["etag"]
+                    results[f"{mode}_{name}"] = summarize(samples)
+    settings.read_cache_enabled = True
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.chats, args.messages, args.requests))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
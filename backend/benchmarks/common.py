@@ -0,0 +1,58 @@
+import os
+import resource
+import tempfile
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+import database
+from database import configure_sessions, create_engines
+from models import Base
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of ``samples`` (``pct`` in 0-100)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples: List[float]) -> dict:
+    """p50/p95/p99/max of a list of latencies in seconds, reported in milliseconds."""
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "max_ms": round(max(samples, default=0.0) * 1000, 2),
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MiB."""
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@asynccontextmanager
+async def temp_database() -> AsyncIterator[AsyncEngine]:
+    """
+    Point the app's ``SessionLocal`` at a fresh SQLite file (with the engines
+    the current settings call for) for the duration of a benchmark, so dev.db
+    is never touched. Yields the writer engine.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        engines = create_engines(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        async with engines.writer.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        configure_sessions(engines)
+        try:
+            yield engines.writer
+        finally:
+            configure_sessions(database.engines)
+            await engines.writer.dispose()
+            await engines.reader.dispose()
@@ -0,0 +1,107 @@
+"""
+Read and write throughput of the app database under concurrency, per engine
+profile (DATABASE_PROFILE).
+
+For each profile a fresh database is seeded with ``--chats`` chats holding
+``--forms-per-chat`` forms each. Then, for ``--seconds``, ``--writers`` tasks
+keep updating forms (``PUT /form-submission/{id}``) while ``--readers``
+tasks keep listing a chat's forms (``GET /chat/{chat_id}/forms``) and
+chats (``GET /chat``). Reports completed operations per second, latency and
+failed requests (e.g. "database is locked").
+
+    python -m benchmarks.db_concurrency --writers 8 --readers 32
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from benchmarks.common import summarize, temp_database
+
+
+async def seed(client: httpx.AsyncClient, chats: int, forms_per_chat: int) -> dict:
+    forms = {}
+    for _ in range(chats):
+        chat_id = (await client.post("/chat", json={})).json()["id"]
+        resp = await client.post(
+            "/form-submission/bulk-create",
+            json=[
+                {"name": f"Person {i}", "email": f"p{i}@example.com", "phone_number": "5550100", "chat_id": chat_id}
+                for i in range(forms_per_chat)
+            ],
+        )
+        forms[chat_id] = [f["id"] for f in resp.json()]
+    return forms
+
+
+async def worker(client, deadline: float, op, latencies: list, errors: list):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            resp = await op()
+            if resp.status_code >= 400:
+                errors.append(resp.status_code)
+                continue
+        except Exception as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def run_profile(profile: str, args) -> dict:
+    from config import settings
+    from main import app
+
+    settings.database_profile = profile
+    rng = random.Random(0)
+    async with temp_database():
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            forms = await seed(client, args.chats, args.forms_per_chat)
+            chat_ids = list(forms)
+            all_forms = [f for ids in forms.values() for f in ids]
+
+            def write():
+                return client.put(f"/form-submission/{rng.choice(all_forms)}", json={"status": rng.randint(1, 3)})
+
+            def read():
+                if rng.random() < 0.5:
+                    return client.get("/chat", params={"limit": 20})
+                return client.get(f"/chat/{rng.choice(chat_ids)}/forms")
+
+            writes, reads, write_errors, read_errors = [], [], [], []
+            deadline = time.perf_counter() + args.seconds
+            await asyncio.gather(
+                *(worker(client, deadline, write, writes, write_errors) for _ in range(args.writers)),
+                *(worker(client, deadline, read, reads, read_errors) for _ in range(args.readers)),
+            )
+
+    return {
+        "writes_per_second": round(len(writes) / args.seconds, 1),
+        "reads_per_second": round(len(reads) / args.seconds, 1),
+        "write_errors": len(write_errors),
+        "read_errors": len(read_errors),
+        "write_latency": summarize(writes),
+        "read_latency": summarize(reads),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", default=["basic", "tuned"])
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--forms-per-chat", type=int, default=20)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    result = {profile: asyncio.run(run_profile(profile, args)) for profile in args.profiles}
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
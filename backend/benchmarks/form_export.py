@@ -0,0 +1,113 @@
+"""
+Throughput and memory of exporting form submissions.
+
+Seeds ``--forms`` form submissions, then drains
+``GET /form-submission/export`` as NDJSON and as CSV, counting bytes as they
+arrive without keeping them. For comparison the same rows are loaded the way
+``GET /chat/{chat_id}/forms`` does it: ``scalars().all()`` into ORM objects,
+then Pydantic models, then one JSON document.
+
+Peak RSS only ever grows, so the streamed exports run first and each step
+reports how much it raised the peak.
+
+    python -m benchmarks.form_export --forms 1000000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import peak_rss_mb, temp_database
+from benchmarks.seed import seed_forms
+
+
+async def drain(app, query: str) -> dict:
+    """Call the ASGI app directly and count the body bytes as they are sent."""
+    received = {"rows": 0, "bytes": 0, "chunks": 0, "status": None}
+    first_byte = None
+
+    requested = False
+    finished = asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # The response watches for a disconnect; there is none until it is done
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal first_byte
+        if message["type"] == "http.response.start":
+            received["status"] = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body"):
+            if first_byte is None:
+                first_byte = time.perf_counter()
+            received["bytes"] += len(message["body"])
+            received["rows"] += message["body"].count(b"\n")
+            received["chunks"] += 1
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/form-submission/export", "raw_path": b"/form-submission/export",
+        "query_string": query.encode(), "headers": [], "client": ("bench", 0), "server": ("bench", 80),
+    }
+    start = time.perf_counter()
+    await app(scope, receive, send)
+    finished.set()
+    received["seconds"] = round(time.perf_counter() - start, 2)
+    if "format=csv" in query:
+        received["rows"] -= 1  # header
+    received["first_byte_ms"] = round((first_byte - start) * 1000, 2) if first_byte else None
+    return received
+
+
+async def materialized() -> dict:
+    """The ORM + Pydantic path of GET /chat/{chat_id}/forms, over every form."""
+    from sqlalchemy import select
+
+    from database import SessionLocal
+    import models
+    import schemas
+
+    start = time.perf_counter()
+    async with SessionLocal() as db:
+        forms = (await db.execute(select(models.FormSubmission))).scalars().all()
+        body = json.dumps([schemas.FormSubmission.model_validate(f).model_dump(mode="json") for f in forms])
+    return {"rows": len(forms), "bytes": len(body), "seconds": round(time.perf_counter() - start, 2)}
+
+
+async def run(forms: int) -> dict:
+    from main import app
+
+    results = {}
+    async with temp_database() as engine:
+        seed_forms(engine.url.database, forms)
+        for name, step in [
+            ("ndjson", lambda: drain(app, "format=ndjson")),
+            ("csv", lambda: drain(app, "format=csv")),
+            ("ndjson_status_filter", lambda: drain(app, "format=ndjson&status=2")),
+            ("materialized", materialized),
+        ]:
+            before = peak_rss_mb()
+            result = await step()
+            result["rows_per_second"] = round(result["rows"] / result["seconds"]) if result["seconds"] else None
+            result["peak_rss_growth_mb"] = round(peak_rss_mb() - before, 1)
+            results[name] = result
+    results["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--forms", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.forms))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Latency of searching form submissions: FTS5 index vs LIKE scan.
+
+Seeds ``--forms`` form submissions with varied names, emails and phone
+numbers, then runs the same searches through ``crud.form.search`` (the FTS5
+table behind ``GET /form-submission/search``) and through the LIKE scan over
+name/email/phone_number that was the only option before.
+
+    python -m benchmarks.form_search --forms 1000000
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import time
+
+from sqlalchemy import or_, select
+
+from benchmarks.common import summarize, temp_database
+from benchmarks.seed import form_id, seed_forms
+
+
+async def like_scan(db, query: str, limit: int) -> list:
+    import models
+
+    pattern = f"%{query}%"
+    statement = select(models.FormSubmission).filter(
+        or_(
+            models.FormSubmission.name.like(pattern),
+            models.FormSubmission.email.like(pattern),
+            models.FormSubmission.phone_number.like(pattern),
+        )
+    ).limit(limit)
+    return (await db.scalars(statement)).all()
+
+
+async def run(forms: int, repeat: int, limit: int) -> dict:
+    import crud
+    from database import SessionLocal
+
+    results = {}
+    async with temp_database() as engine:
+        start = time.perf_counter()
+        seed_forms(engine.url.database, forms)
+        results["seed_seconds"] = round(time.perf_counter() - start, 1)
+
+        # Search for a form from the middle of the table
+        conn = sqlite3.connect(engine.url.database)
+        name, email, phone = conn.execute(
+            "SELECT name, email, phone_number FROM form_submission WHERE id = ?", (form_id(forms // 2),)
+        ).fetchone()
+        conn.close()
+
+        # (label, search input, LIKE equivalent)
+        searches = [
+            ("email_prefix", email.split("@")[0] + "@", email.split("@")[0] + "@"),
+            ("email_exact", email, email),
+            ("short_email_prefix", email.split(".")[0] + "@", email.split(".")[0]),
+            ("phone_prefix", phone[:9], phone[:9]),
+            ("name_two_terms", name.split()[0].lower() + " " + name.split()[1][:3].lower(), name[:-1]),
+            ("name_prefix", name[:3].lower(), name[:3]),
+            ("no_match", "nobody@nowhere", "nobody@nowhere"),
+        ]
+
+        async with SessionLocal() as db:
+            for label, fts_query, like_query in searches:
+                fts, like = [], []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    found = await crud.form.search(db, query=fts_query, limit=limit)
+                    fts.append(time.perf_counter() - start)
+                    start = time.perf_counter()
+                    scanned = await like_scan(db, like_query, limit)
+                    like.append(time.perf_counter() - start)
+                results[label] = {
+                    "query": fts_query,
+                    "fts": {"matches": len(found), **summarize(fts)},
+                    "like": {"matches": len(scanned), **summarize(like)},
+                }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--forms", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.forms, args.repeat, args.limit))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
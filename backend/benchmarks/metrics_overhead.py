@@ -0,0 +1,62 @@
+"""
+Per-request cost of the built-in metrics.
+
+Sends ``--requests`` ``GET /chat/{chat_id}`` requests (a cheap, DB-bound
+endpoint: a CRUD span or two and two queries) with METRICS_ENABLED off, on,
+and on with every request profiled, and reports the latency of each.
+
+    python -m benchmarks.metrics_overhead --requests 5000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.common import summarize, temp_database
+
+WARMUP = 200
+
+
+async def run(requests: int) -> dict:
+    import metrics
+    from config import settings
+    from main import app
+
+    metrics.profile_hook = lambda breakdown: None
+    modes = [("off", False, 0.0), ("on", True, 0.0), ("on_profiled", True, 1.0)]
+    samples = {name: [] for name, _, _ in modes}
+    async with temp_database():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            resp = await client.post("/chat", json={"messages": [{"role": "user", "content": "hi"}]})
+            chat_id = resp.json()["id"]
+            for _ in range(WARMUP):
+                await client.get(f"/chat/{chat_id}")
+            # Interleave the modes so drift affects them equally
+            for _ in range(requests):
+                for name, enabled, sample_rate in modes:
+                    settings.metrics_enabled = enabled
+                    settings.metrics_profile_sample_rate = sample_rate
+                    start = time.perf_counter()
+                    resp = await client.get(f"/chat/{chat_id}")
+                    resp.raise_for_status()
+                    samples[name].append(time.perf_counter() - start)
+    return {
+        name: {**summarize(latencies), "mean_us": round(sum(latencies) / len(latencies) * 1e6, 1)}
+        for name, latencies in samples.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.requests))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
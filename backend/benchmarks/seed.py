@@ -0,0 +1,114 @@
+"""
+Seed data for benchmarks, written straight to a SQLite file with the sqlite3
+module in batches; going through the ORM would take far longer at 1M rows.
+Every generator is deterministic, so two runs seed the same database.
+
+Row ids are predictable: chats are ``chat{i:08d}`` and forms ``form{i:08d}``,
+created one second apart from 2024-01-01 on.
+"""
+import json
+import random
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Tuple
+
+SEED_BATCH = 50_000
+START = datetime(2024, 1, 1)
+# Named sizes for --scale options
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+FIRST = ["Jane", "John", "Maria", "Wei", "Aisha", "Carlos", "Olga", "Kenji", "Fatima", "Liam",
+         "Noah", "Emma", "Ravi", "Sofia", "Yusuf", "Chloe", "Mateo", "Hana", "Ivan", "Zara"]
+LAST = ["Doe", "Smith", "Garcia", "Chen", "Khan", "Lopez", "Ivanova", "Tanaka", "Ali", "Murphy",
+        "Brown", "Rossi", "Patel", "Silva", "Demir", "Martin", "Torres", "Sato", "Petrov", "Okafor"]
+
+
+def chat_id(i: int) -> str:
+    return f"chat{i:08d}"
+
+
+def form_id(i: int) -> str:
+    return f"form{i:08d}"
+
+
+def person(i: int, rng: random.Random) -> Tuple[str, str, str]:
+    """A varied (name, email, phone_number); email and phone are unique per ``i``."""
+    first, last = rng.choice(FIRST), rng.choice(LAST)
+    email = f"{first.lower()}.{last.lower()}{i}@example{i % 50}.com"
+    phone = f"({rng.randint(200, 999)}) {rng.randint(200, 999)}-{i % 10000:04d}"
+    return f"{first} {last}", email, phone
+
+
+def history(n: int) -> list:
+    """``n`` alternating user/assistant messages of a few hundred characters each."""
+    return [
+        {"role": "user", "content": f"question {i} " + "lorem ipsum " * 20}
+        if i % 2 == 0
+        else {"role": "assistant", "content": f"answer {i} " + "dolor sit amet " * 30}
+        for i in range(n)
+    ]
+
+
+def seed_chats(path: str, chats: int, messages: int = 2, forms_every: int = 10) -> None:
+    """
+    ``chats`` chats with ``messages`` messages each, and a form submission for
+    every ``forms_every``-th chat (none with 0).
+    """
+    conn = sqlite3.connect(path)
+    bodies = [json.dumps(m) for m in history(messages)]
+    preview = history(messages)[-1]["content"][:200] if messages else None
+    for offset in range(0, chats, SEED_BATCH):
+        ids = range(offset, min(offset + SEED_BATCH, chats))
+        conn.executemany(
+            "INSERT INTO chat (id, created_at, active_at, message_count, summary_seq, last_message_preview)"
+            " VALUES (?, ?, ?, ?, 0, ?)",
+            ((chat_id(i), START + timedelta(seconds=i), START + timedelta(seconds=i), messages, preview) for i in ids),
+        )
+        conn.executemany(
+            "INSERT INTO chat_message (chat_id, seq, created_at, role, data, token_count)"
+            " VALUES (?, ?, ?, ?, ?, 70)",
+            (
+                (chat_id(i), s, START + timedelta(seconds=i), "user" if s % 2 == 0 else "assistant", bodies[s])
+                for i in ids
+                for s in range(messages)
+            ),
+        )
+        if forms_every:
+            rng = random.Random(offset)
+            conn.executemany(
+                "INSERT INTO form_submission (id, created_at, chat_id, name, email, phone_number, status)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (form_id(i), START + timedelta(seconds=i), chat_id(i), *person(i, rng), i % 3 + 1)
+                    for i in ids
+                    if i % forms_every == 0
+                ),
+            )
+        conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def seed_forms(path: str, forms: int, chats: int = 1000) -> None:
+    """
+    ``forms`` form submissions spread round-robin over ``chats`` empty chats,
+    with varied names, emails and phone numbers and statuses cycling 1, 2, 3.
+    """
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO chat (id, created_at, active_at, message_count, summary_seq) VALUES (?, ?, ?, 0, 0)",
+        ((chat_id(i), START, START) for i in range(chats)),
+    )
+    rng = random.Random(42)
+    for offset in range(0, forms, SEED_BATCH):
+        conn.executemany(
+            "INSERT INTO form_submission (id, created_at, chat_id, name, email, phone_number, status)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                (form_id(i), START + timedelta(seconds=i), chat_id(i % chats), *person(i, rng), i % 3 + 1)
+                for i in range(offset, min(offset + SEED_BATCH, forms))
+            ),
+        )
+        conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
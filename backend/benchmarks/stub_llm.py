@@ -0,0 +1,194 @@
+"""
+Minimal OpenAI-compatible chat completions server for benchmarks.
+
+Only ``POST /v1/chat/completions`` is implemented. When the last message in the
+request is from the user, the stub answers with ``tool_calls`` parallel calls to
+``submit_interest_form``; otherwise it answers with plain text. With
+``tool_call_ratio`` below 1 only that fraction of user turns get tool calls
+(every other turn is answered with text), deterministically, so two runs see
+the same sequence.
+
+Every response is delayed by ``latency`` seconds to stand in for time to
+first token and, with a ``token_rate``, by another completion_tokens /
+token_rate seconds of generation. With ``"stream": true`` the same message is
+sent as SSE chunks, ``chunk_delay`` (or 1 / token_rate) seconds apart, with
+tool-call arguments split into small fragments.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+@dataclass
+class StubConfig:
+    latency: float = 0.5
+    tool_calls: int = 2
+    reply: str = "Thanks, your interest form has been submitted."
+    chunk_delay: float = 0.0
+    # Generated tokens per second; 0 means generation takes no time
+    token_rate: float = 0.0
+    tool_call_ratio: float = 1.0
+
+    @property
+    def token_delay(self) -> float:
+        """Pause between streamed chunks."""
+        if self.chunk_delay or not self.token_rate:
+            return self.chunk_delay
+        return 1 / self.token_rate
+
+
+def stream_chunks(message: dict, n: int, model: str, config: StubConfig):
+    """Yield the SSE lines of a streamed completion of ``message``."""
+
+    def chunk(delta: dict, finish_reason=None) -> str:
+        body = {
+            "id": f"chatcmpl-stub-{n}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(body)}\n\n"
+
+    async def gen():
+        yield chunk({"role": "assistant", "content": ""})
+        for i, call in enumerate(message.get("tool_calls") or []):
+            yield chunk({"tool_calls": [{
+                "index": i, "id": call["id"], "type": "function",
+                "function": {"name": call["function"]["name"], "arguments": ""},
+            }]})
+            args = call["function"]["arguments"]
+            for start in range(0, len(args), 8):
+                await asyncio.sleep(config.token_delay)
+                yield chunk({"tool_calls": [{"index": i, "function": {"arguments": args[start:start + 8]}}]})
+        words = message["content"].split(" ") if message.get("content") else []
+        for i, word in enumerate(words):
+            await asyncio.sleep(config.token_delay)
+            yield chunk({"content": word if i == 0 else " " + word})
+        yield chunk({}, "tool_calls" if message.get("tool_calls") else "stop")
+        yield "data: [DONE]\n\n"
+
+    return gen()
+
+
+def create_app(config: StubConfig) -> FastAPI:
+    app = FastAPI()
+    ids = itertools.count()
+    user_turns = itertools.count()
+
+    def wants_tools() -> bool:
+        # The k-th user turn gets tool calls when it crosses the next
+        # multiple of 1 / tool_call_ratio, e.g. every other turn at 0.5
+        k = next(user_turns)
+        return int((k + 1) * config.tool_call_ratio) > int(k * config.tool_call_ratio)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        await asyncio.sleep(config.latency)
+
+        n = next(ids)
+        message = {"role": "assistant", "content": config.reply}
+        if body["messages"][-1]["role"] == "user" and config.tool_calls and wants_tools():
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": f"call_{n}_{i}",
+                        "type": "function",
+                        "function": {
+                            "name": "submit_interest_form",
+                            "arguments": '{"name": "Jane Doe", "email": "jane@example.com", "phone_number": "555-0100"}',
+                        },
+                    }
+                    for i in range(config.tool_calls)
+                ],
+            }
+
+        if body.get("stream"):
+            return StreamingResponse(
+                stream_chunks(message, n, body.get("model", "stub"), config),
+                media_type="text/event-stream",
+            )
+
+        # Rough counts (4 characters a token), enough to exercise token metrics
+        prompt_tokens = len(json.dumps(body["messages"])) // 4
+        completion_tokens = len(json.dumps(message)) // 4
+        if config.token_rate:
+            await asyncio.sleep(completion_tokens / config.token_rate)
+        return {
+            "id": f"chatcmpl-stub-{n}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": message,
+                    "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    return app
+
+
+class StubServer:
+    """Runs the stub on a background thread with its own event loop."""
+
+    def __init__(self, config: Optional[StubConfig] = None, port: int = 8765):
+        self.port = port
+        self.server = uvicorn.Server(
+            uvicorn.Config(create_app(config or StubConfig()), port=port, log_level="warning")
+        )
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def __enter__(self) -> "StubServer":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.should_exit = True
+        self.thread.join()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--tool-calls", type=int, default=2)
+    parser.add_argument("--tool-call-ratio", type=float, default=1.0)
+    parser.add_argument("--token-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(StubConfig(
+            latency=args.latency,
+            tool_calls=args.tool_calls,
+            tool_call_ratio=args.tool_call_ratio,
+            token_rate=args.token_rate,
+        )),
+        port=args.port,
+    )
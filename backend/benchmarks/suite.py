@@ -0,0 +1,234 @@
+"""
+The benchmark suite: seeds a fresh database at a named ``--scale``, runs each
+scenario against the app in-process (completions served by the stub) and
+reports throughput, p50/p95/p99 latency and peak RSS as JSON.
+
+Scenarios, each ``--requests`` requests issued ``--concurrency`` at a time:
+
+- chat_turns: ``POST /chat/{id}/messages`` on seeded chats. The stub answers
+  a ``--tool-call-ratio`` fraction of them with tool calls, so those turns
+  take two completions
+- chat_listing: ``GET /chat``, the first page and the pages after it
+- form_filtering: ``GET /chat/{id}/forms?status=``
+- bulk_updates: ``POST /form-submission/bulk-update`` of all a chat's forms
+
+Seeding and the stub are deterministic, so runs on the same machine are
+comparable. Save one run with ``--output`` and pass it to a later run as
+``--baseline``: every metric that got worse by more than ``--tolerance`` is
+listed, and the exit status is 1 if there was any.
+
+    python -m benchmarks.suite --scale 10k --output baseline.json
+    python -m benchmarks.suite --scale 10k --baseline baseline.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import sqlite3
+import sys
+import time
+from typing import Awaitable, Callable, List
+
+import httpx
+
+from benchmarks.common import peak_rss_mb, summarize, temp_database
+from benchmarks.seed import SCALES, chat_id, seed_chats
+from benchmarks.stub_llm import StubConfig, StubServer
+
+SCENARIOS = ["chat_turns", "chat_listing", "form_filtering", "bulk_updates"]
+MESSAGES_PER_CHAT = 2
+FORMS_EVERY = 10
+
+# (metric, higher is better, differences up to this much are noise)
+CHECKS = [
+    ("throughput_rps", True, 0.0),
+    ("latency.p50_ms", False, 0.5),
+    ("latency.p95_ms", False, 1.0),
+    ("latency.p99_ms", False, 2.0),
+    ("peak_rss_growth_mb", False, 5.0),
+]
+
+
+async def run_scenario(op: Callable[[int], Awaitable[httpx.Response]], requests: int, concurrency: int) -> dict:
+    """Call ``op(0)`` .. ``op(requests - 1)``, ``concurrency`` at a time."""
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker(offset: int):
+        nonlocal errors
+        for i in range(offset, requests, concurrency):
+            start = time.perf_counter()
+            try:
+                ok = (await op(i)).status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "latency": summarize(latencies),
+        "peak_rss_growth_mb": round(peak_rss_mb() - before, 1),
+    }
+
+
+async def run(args, stub_url: str) -> dict:
+    import audit
+    from config import settings
+    import jobs
+    from llm import llm
+    from main import app
+
+    settings.openai_base_url = stub_url
+    settings.openai_api_key = "stub"
+    # Seeded chats all look alike; measure the model path, not the cache
+    settings.llm_cache_enabled = False
+
+    chats = SCALES[args.scale]
+    results = {}
+    async with temp_database() as engine:
+        start = time.perf_counter()
+        seed_chats(engine.url.database, chats, MESSAGES_PER_CHAT, FORMS_EVERY)
+        results["seed_seconds"] = round(time.perf_counter() - start, 1)
+        audit.audit_log.start()
+        jobs.job_queue.start()
+
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # Cursors of the first few listing pages, requested in turn
+            cursors = [None]
+            while len(cursors) < 10:
+                page = (await client.get("/chat", params={"limit": 20, "cursor": cursors[-1]})).json()
+                if not page["next_cursor"]:
+                    break
+                cursors.append(page["next_cursor"])
+            # Chats with forms, spread over the whole table
+            form_chats = chats // FORMS_EVERY
+            stride = max(1, form_chats // max(1, args.requests))
+
+            def form_chat(i: int) -> str:
+                return chat_id((i * stride % form_chats) * FORMS_EVERY)
+
+            ops = {
+                # A chat per turn: turns on one chat would queue on its lock
+                "chat_turns": lambda i: client.post(
+                    f"/chat/{chat_id(i * chats // args.requests)}/messages",
+                    json={
+                        "messages": [{"role": "user", "content": "Sign me up, I'm Jane"}],
+                        "last_seq": MESSAGES_PER_CHAT - 1,
+                    },
+                ),
+                "chat_listing": lambda i: client.get(
+                    "/chat", params={"limit": 20, "cursor": cursors[i % len(cursors)]}
+                ),
+                "form_filtering": lambda i: client.get(
+                    f"/chat/{form_chat(i)}/forms", params={"status": i % 3 + 1}
+                ),
+                "bulk_updates": lambda i: client.post(
+                    "/form-submission/bulk-update",
+                    json={"where": {"chat_id": form_chat(i)}, "values": {"status": i % 3 + 1}},
+                ),
+            }
+            for name in args.scenarios:
+                results[name] = await run_scenario(ops[name], args.requests, args.concurrency)
+
+        await jobs.job_queue.stop()
+        await audit.audit_log.stop()
+        await llm.aclose()
+    results["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return results
+
+
+def lookup(result: dict, metric: str):
+    for key in metric.split("."):
+        result = result.get(key) if isinstance(result, dict) else None
+    return result
+
+
+def regressions(baseline: dict, current: dict, tolerance: float) -> List[str]:
+    """Every metric of ``current`` worse than ``baseline`` by more than ``tolerance`` (a fraction)."""
+    found = []
+    for name in SCENARIOS:
+        old, new = baseline["scenarios"].get(name), current["scenarios"].get(name)
+        if not old or not new:
+            continue
+        if new["errors"] > old["errors"]:
+            found.append(f"{name}: errors {old['errors']} -> {new['errors']}")
+        for metric, higher_is_better, slack in CHECKS:
+            before, after = lookup(old, metric), lookup(new, metric)
+            if before is None or after is None:
+                continue
+            worse = before - after if higher_is_better else after - before
+            if worse > slack and worse > abs(before) * tolerance:
+                change = (after - before) / before * 100 if before else float("inf")
+                found.append(f"{name}: {metric} {before} -> {after} ({change:+.0f}%)")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=list(SCALES), default="10k", help="number of seeded chats")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub time to first token in seconds")
+    parser.add_argument("--token-rate", type=float, default=500.0, help="stub generated tokens per second")
+    parser.add_argument("--tool-calls", type=int, default=2, help="parallel tool calls per tool-call turn")
+    parser.add_argument("--tool-call-ratio", type=float, default=0.5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="write the results to this file")
+    parser.add_argument("--baseline", help="results of an earlier run to check against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, as a fraction")
+    args = parser.parse_args()
+
+    stub_config = StubConfig(
+        latency=args.latency,
+        tool_calls=args.tool_calls,
+        token_rate=args.token_rate,
+        tool_call_ratio=args.tool_call_ratio,
+    )
+    with StubServer(stub_config, port=args.port) as stub:
+        scenarios = asyncio.run(run(args, stub.base_url))
+
+    result = {
+        "meta": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "scale": args.scale,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "stub": vars(stub_config),
+        },
+        "seed_seconds": scenarios.pop("seed_seconds"),
+        "peak_rss_mb": scenarios.pop("peak_rss_mb"),
+        "scenarios": scenarios,
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["meta"]["scale"] != args.scale:
+            print(f"warning: baseline was run at scale {baseline['meta']['scale']}", file=sys.stderr)
+        found = regressions(baseline, result, args.tolerance)
+        for line in found:
+            print(f"regression: {line}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+        print("no regressions against the baseline", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
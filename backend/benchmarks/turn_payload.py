@@ -0,0 +1,91 @@
+"""
+Request size and latency of a chat turn: full-history PUT vs delta POST.
+
+For each history size a chat is seeded with that many messages, then
+``--turns`` turns are sent through ``PUT /chat/{chat_id}`` (whole history in
+the body) and through ``POST /chat/{chat_id}/messages`` (only the new message
+plus last_seq). The stub completes instantly and without tool calls, so the
+numbers are the server's own overhead.
+
+    python -m benchmarks.turn_payload --sizes 10 100 1000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.common import summarize, temp_database
+from benchmarks.seed import history as seed_history
+from benchmarks.stub_llm import StubConfig, StubServer
+
+
+async def bench_size(client: httpx.AsyncClient, size: int, turns: int) -> dict:
+    result = {}
+
+    # Full-history PUT
+    resp = await client.post("/chat", json={"messages": seed_history(size)})
+    chat_id, history = resp.json()["id"], resp.json()["messages"]
+    sizes, latencies = [], []
+    for i in range(turns):
+        body = json.dumps({"messages": history + [{"role": "user", "content": f"turn {i}"}]})
+        start = time.perf_counter()
+        resp = await client.put(f"/chat/{chat_id}", content=body, headers={"Content-Type": "application/json"})
+        latencies.append(time.perf_counter() - start)
+        resp.raise_for_status()
+        sizes.append(len(body))
+        history = resp.json()["messages"]
+    result["put_full_history"] = {"request_bytes": sum(sizes) // turns, **summarize(latencies)}
+
+    # Delta POST
+    resp = await client.post("/chat", json={"messages": seed_history(size)})
+    chat_id, last_seq = resp.json()["id"], size - 1
+    sizes, latencies = [], []
+    for i in range(turns):
+        body = json.dumps({"messages": [{"role": "user", "content": f"turn {i}"}], "last_seq": last_seq})
+        start = time.perf_counter()
+        resp = await client.post(f"/chat/{chat_id}/messages", content=body, headers={"Content-Type": "application/json"})
+        latencies.append(time.perf_counter() - start)
+        resp.raise_for_status()
+        sizes.append(len(body))
+        last_seq = resp.json()["message_count"] - 1
+    result["post_delta"] = {"request_bytes": sum(sizes) // turns, **summarize(latencies)}
+
+    return result
+
+
+async def run(sizes: list, turns: int, stub_url: str) -> dict:
+    from config import settings
+    from llm import llm
+    from main import app
+
+    settings.openai_base_url = stub_url
+    settings.openai_api_key = "stub"
+    # Measure the model path, not the completion cache
+    settings.llm_cache_enabled = False
+
+    results = {}
+    async with temp_database():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for size in sizes:
+                results[str(size)] = await bench_size(client, size, turns)
+        await llm.aclose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with StubServer(StubConfig(latency=0.0, tool_calls=0), port=args.port) as stub:
+        result = asyncio.run(run(args.sizes, args.turns, stub.base_url))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
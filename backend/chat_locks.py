@@ -0,0 +1,40 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import metrics
+
+
+class ChatTurnLocks:
+    def __init__(self):
+        """
+        One asyncio lock per chat with turns in progress, so turns on the same
+        chat run one after another (in arrival order) while turns on different
+        chats still run in parallel. A lock is dropped once nobody holds or
+        waits for it, so idle chats cost nothing.
+
+        This serializes turns within one worker; across workers the
+        optimistic check on Chat.message_count still rejects the loser.
+        """
+        self._locks: dict = {}
+
+    @asynccontextmanager
+    async def hold(self, chat_id: str) -> AsyncIterator[None]:
+        entry = self._locks.get(chat_id)
+        if entry is None:
+            entry = self._locks[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            with metrics.span("turn.lock_wait"):
+                await entry[0].acquire()
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[chat_id]
+
+
+chat_turns = ChatTurnLocks()
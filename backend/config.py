@@ -0,0 +1,135 @@
+from typing import Literal, Optional
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """
+    Runtime configuration, read from the environment (or a local .env file).
+
+    Every field maps to the upper-cased environment variable of the same name,
+    e.g. ``llm_timeout`` is set with ``LLM_TIMEOUT=30``.
+    """
+
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+    database_url: str = "sqlite+aiosqlite:///./dev.db"
+    # "tuned": for SQLite, WAL plus one writer connection and a pool of
+    # read-only connections (see database.create_engines); "basic": a single
+    # engine with driver defaults
+    database_profile: Literal["tuned", "basic"] = "tuned"
+    # Milliseconds a connection waits for a lock before "database is locked"
+    sqlite_busy_timeout: int = 5000
+    # NORMAL is safe with WAL (a power loss may drop the last commits, but
+    # never corrupts the database) and saves an fsync per commit
+    sqlite_synchronous: Literal["OFF", "NORMAL", "FULL", "EXTRA"] = "NORMAL"
+    sqlite_read_pool_size: int = 8
+
+    openai_api_key: str = ""
+    # Point the client at any OpenAI-compatible server (used by the benchmarks)
+    openai_base_url: Optional[str] = None
+
+    llm_model: str = "gpt-4o-mini"
+    # Seconds allowed for a whole completion request / for opening a connection
+    llm_timeout: float = 60.0
+    llm_connect_timeout: float = 5.0
+    llm_max_retries: int = 2
+    # Shared HTTP connection pool used by every chat turn
+    llm_max_connections: int = 100
+    llm_max_keepalive_connections: int = 20
+    # Upper bound on completions in flight at once; extra turns wait their turn
+    llm_max_concurrency: int = 64
+
+    # Persistent cache of completions, shared by all workers through a SQLite file
+    llm_cache_enabled: bool = True
+    llm_cache_path: str = "./llm_cache.db"
+    llm_cache_ttl: float = 24 * 3600
+    llm_cache_max_entries: int = 10_000
+    llm_cache_max_bytes: int = 100 * 1024 * 1024
+    # Size limits are enforced after this many stores (it costs a table scan)
+    llm_cache_evict_every: int = 100
+
+    # Audit trail of chat and form changes (see audit.py)
+    audit_enabled: bool = True
+    # Journaled changes are moved to the audit_log_* tables once this many are
+    # queued, or this many seconds after the first one
+    audit_batch_size: int = 500
+    audit_flush_interval: float = 1.0
+    # Committed transactions whose changes can wait in memory for the flusher;
+    # past that they are read back from the journal instead
+    audit_queue_size: int = 10_000
+    # Snapshot an entity's full state every this many changes, which bounds
+    # the deltas replayed to rebuild a past version
+    audit_snapshot_every: int = 50
+
+    # Background job queue (see jobs.py). With jobs_in_process=false the app
+    # only enqueues, and `python jobs.py` runs the workers instead
+    jobs_in_process: bool = True
+    jobs_workers: int = 4
+    # Idle workers look for due jobs this often (jobs enqueued in the same
+    # process wake them at once)
+    jobs_poll_interval: float = 1.0
+    jobs_max_attempts: int = 5
+    # Retry delay doubles after each failed attempt, up to the max
+    jobs_backoff_base: float = 1.0
+    jobs_backoff_max: float = 300.0
+    # A running job not finished within this many seconds is run again
+    jobs_lease: float = 60.0
+    # Finished jobs (and their dedupe keys) are kept this long
+    jobs_retention: float = 24 * 3600
+
+    # Request latency, per-stage spans, DB statement and LLM token counts,
+    # served at /metrics in the Prometheus text format
+    metrics_enabled: bool = True
+    # Fraction of requests whose full span breakdown is written, one JSON
+    # line each, to metrics_profile_path (see metrics.profile_hook)
+    metrics_profile_sample_rate: float = 0.0
+    metrics_profile_path: str = "./request_profiles.ndjson"
+
+    # In-process cache of GET /chat/{chat_id} and GET /chat/{chat_id}/forms
+    # responses (see read_cache.py), bounded by entries and encoded bytes
+    read_cache_enabled: bool = True
+    read_cache_max_entries: int = 1000
+    read_cache_max_bytes: int = 64 * 1024 * 1024
+    # Seconds a version read from the database is trusted before asking
+    # again. A worker sees its own writes at once; writes made by other
+    # workers can take this long to show. 0 checks on every request.
+    read_cache_version_ttl: float = 1.0
+
+    # Change feed of chat and form writes, served at /chat/{chat_id}/changes
+    # and /changes (see feed.py); its events come from the audit trail, so it
+    # needs audit_enabled. Each worker tails the trail for commits made by
+    # the others (and by `python jobs.py`) this often; its own wake it at once
+    feed_poll_interval: float = 0.5
+    # Recent events kept for clients that reconnect
+    feed_buffer_size: int = 10_000
+    # Events waiting for one subscriber before it is sent a reset instead
+    feed_subscriber_buffer: int = 1000
+    # Seconds between keep-alives on an idle subscription
+    feed_heartbeat: float = 15.0
+
+    # Cold storage for idle chats (see archive.py): chats without a turn for
+    # archive_after seconds have their messages moved, zlib-compressed, to
+    # the archive_path SQLite file, and back the next time they are opened.
+    # Unlike the LLM cache it holds the only copy of those messages, so back
+    # it up along with the app database.
+    archive_path: str = "./archive.db"
+    archive_after: float = 30 * 24 * 3600
+    # Chats archived per pass of the compaction job
+    archive_batch_size: int = 500
+    archive_compression_level: int = 6
+
+    # How long a chat turn's Idempotency-Key can be replayed
+    idempotency_key_ttl: float = 24 * 3600
+
+    # Prompt tokens a chat turn may use for the system prompt, tool
+    # definitions, summary and history (the new messages always go in)
+    context_token_budget: int = 16000
+    # When older messages must be summarized, fold enough of them that the
+    # remaining history fills only this fraction of the budget, so the next
+    # few turns fit without summarizing again
+    context_keep_ratio: float = 0.5
+    context_summary_max_tokens: int = 500
+
+
+settings = Settings()
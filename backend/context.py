@@ -0,0 +1,125 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+import crud
+from llm import llm
+import metrics
+import models
+from tokens import count_text_tokens, count_tools_tokens
+from turns import SYSTEM_TEMPLATE, TOOLS
+
+SUMMARY_TEMPLATE = """You maintain a running summary of a conversation between a user and an \
+assistant that collects interest forms. Update the summary with the new messages below. Keep every \
+name, email, phone number, form id and request that may matter later. Answer with the summary only, \
+in at most {max_tokens} tokens."""
+
+
+@dataclass
+class ChatContext:
+    # Messages to send between the system prompt and the turn's new messages
+    history: list
+    summary: Optional[str]
+    summary_seq: int
+
+    def apply(self, chat: models.Chat) -> None:
+        """Store the (possibly advanced) rolling summary on the chat row."""
+        if self.summary_seq > chat.summary_seq:
+            chat.summary = self.summary
+            chat.summary_seq = self.summary_seq
+
+
+def _cutoff(sizes: list, budget: int) -> int:
+    """
+    Oldest seq such that messages from it on fit in ``budget`` tokens.
+    ``sizes`` is (seq, role, token_count), newest first. The cutoff never
+    lands on a tool result, so an assistant message is always kept together
+    with the results of the calls it made.
+    """
+    if not sizes:
+        return 0
+    cutoff = sizes[0].seq + 1
+    total = 0
+    i = -1
+    for i, row in enumerate(sizes):
+        total += row.token_count or 0
+        if total > budget:
+            i -= 1
+            break
+        cutoff = row.seq
+    while 0 <= i < len(sizes) - 1 and sizes[i].role == "tool":
+        i += 1
+        cutoff = sizes[i].seq
+    return cutoff
+
+
+def _transcript(messages: list) -> str:
+    lines = []
+    for m in messages:
+        if m.get("tool_calls"):
+            for call in m["tool_calls"]:
+                lines.append(f"assistant called {call['function']['name']}({call['function']['arguments']})")
+        elif m.get("role") == "tool":
+            lines.append(f"{m.get('name', 'tool')} returned: {m.get('content')}")
+        else:
+            lines.append(f"{m.get('role')}: {m.get('content')}")
+    return "\n".join(lines)
+
+
+async def summarize(summary: Optional[str], messages: list) -> str:
+    """Fold ``messages`` into the existing rolling summary with one completion."""
+    prompt = _transcript(messages)
+    if summary:
+        prompt = f"Current summary:\n{summary}\n\nNew messages:\n{prompt}"
+    resp = await llm.complete(
+        [
+            {"role": "system", "content": SUMMARY_TEMPLATE.format(max_tokens=settings.context_summary_max_tokens)},
+            {"role": "user", "content": prompt},
+        ],
+        max_tokens=settings.context_summary_max_tokens,
+    )
+    return resp["content"] or summary or ""
+
+
+async def build_context(db: AsyncSession, chat: models.Chat) -> ChatContext:
+    """
+    Assemble the history to send with a turn within ``context_token_budget``.
+
+    The most recent messages are kept verbatim. Anything older that doesn't
+    fit is represented by the chat's rolling summary, which only ever gets
+    the newly dropped span folded in; it is never regenerated from scratch.
+    Only stored token counts are read to pick the cutoff, and only the
+    messages actually needed are loaded.
+    """
+    fixed = count_text_tokens(SYSTEM_TEMPLATE) + count_tools_tokens(TOOLS)
+    summary, summary_seq = chat.summary, chat.summary_seq
+
+    sizes = await crud.chat.get_message_sizes(db, chat_id=chat.id, since_seq=summary_seq)
+    budget = settings.context_token_budget - fixed - count_text_tokens(summary)
+    cutoff = max(_cutoff(sizes, budget), summary_seq)
+
+    dropped = None
+    if cutoff > summary_seq:
+        # Fold past the strict cutoff so the next turns don't summarize again
+        budget = settings.context_token_budget - fixed - settings.context_summary_max_tokens
+        cutoff = max(cutoff, _cutoff(sizes, int(budget * settings.context_keep_ratio)))
+        dropped = await crud.chat.get_messages(
+            db, chat_id=chat.id, since_seq=summary_seq, before_seq=cutoff
+        )
+    kept = await crud.chat.get_messages(db, chat_id=chat.id, since_seq=cutoff)
+
+    if dropped is not None:
+        # Everything is read: end the transaction, so its pooled connection
+        # isn't held through the completion
+        await db.commit()
+        with metrics.span("turn.summarize"):
+            summary = await summarize(summary, [m.data for m in dropped])
+        summary_seq = cutoff
+
+    history = [m.data for m in kept]
+    if summary:
+        history.insert(0, {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+    return ChatContext(history=history, summary=summary, summary_seq=summary_seq)
+
@@ -1,20 +1,41 @@
+import functools
+import re
 import uuid
-from datetime import datetime, timezone
-from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, Generic, List, Optional, Sequence, Tuple, Type, TypeVar, Union
 
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import (
+    Row, Text, column, delete, func, insert, literal_column, null, select, table, tuple_, type_coerce, update,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from models import Base, Chat, FormSubmission
+import audit
+from config import settings
+import metrics
+from models import Base, Chat, ChatMessage, FormSubmission, IdempotencyKey
+import read_cache
 import schemas
+from tokens import count_message_tokens
 
 ModelType = TypeVar("ModelType", bound=Base)
+PREVIEW_LENGTH = 200
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
 
+def timed(method):
+    """Time a CRUD method as the span ``crud.<table>.<method>``."""
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        if not settings.metrics_enabled:
+            return await method(self, *args, **kwargs)
+        with metrics.span(f"crud.{self.model.__tablename__}.{method.__name__}"):
+            return await method(self, *args, **kwargs)
+    return wrapper
+
+
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     def __init__(self, model: Type[ModelType]):
         """
@@ -27,6 +48,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         """
         self.model = model
 
+    @timed
     async def get(
         self, db: AsyncSession, id: Union[uuid.UUID, str, int], options: list = []
     ) -> Optional[ModelType]:
@@ -34,14 +56,51 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         result = await db.scalars(statement)
         return result.first()
 
+    @timed
     async def get_multi(
-        self, db: AsyncSession, *, filters: list = [], skip: int = 0, limit: int = 100
+        self, db: AsyncSession, *, filters: list = [], skip: int = 0, limit: Optional[int] = 100
     ) -> List[ModelType]:
         statement = select(self.model).filter(*filters).offset(skip).limit(limit)
         result = await db.scalars(statement)
         return result.all()
 
-    async def create(self, db: AsyncSession, *, obj_in: CreateSchemaType) -> ModelType:
+    async def stream_multi(
+        self,
+        db: AsyncSession,
+        *,
+        columns: Optional[list] = None,
+        filters: list = [],
+        order_by: list = [],
+        batch_size: int = 1000,
+    ) -> AsyncIterator[Sequence[Row]]:
+        """
+        Yield matching rows in batches of ``batch_size`` from a server-side
+        cursor, so memory stays flat however many rows match. With
+        ``columns``, plain rows of those columns are yielded instead of ORM
+        objects, which is much cheaper for large scans.
+        """
+        statement = (
+            select(*(columns or [self.model]))
+            .filter(*filters)
+            .order_by(*order_by)
+            .execution_options(yield_per=batch_size)
+        )
+        result = await db.stream(statement)
+        try:
+            async for partition in result.partitions():
+                yield partition if columns else [row[0] for row in partition]
+        finally:
+            await result.close()
+
+    @timed
+    async def create(
+        self,
+        db: AsyncSession,
+        *,
+        obj_in: CreateSchemaType,
+        commit: bool = True,
+        refresh: bool = True,
+    ) -> ModelType:
         obj_in_data = jsonable_encoder(obj_in)
         db_obj = self.model(
             **obj_in_data, created_at=datetime.now(timezone.utc).replace(tzinfo=None)
@@ -49,48 +108,411 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
 
         db.add(db_obj)
 
-        await db.commit()
-        await db.refresh(db_obj)
+        await self._commit(db, db_obj, commit, refresh)
         return db_obj
 
+    @timed
+    async def create_many(
+        self, db: AsyncSession, *, objs_in: List[CreateSchemaType], commit: bool = True
+    ) -> List[ModelType]:
+        """Insert all of ``objs_in`` with one INSERT ... RETURNING."""
+        if not objs_in:
+            return []
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        rows = [{**jsonable_encoder(obj_in), "created_at": now} for obj_in in objs_in]
+        result = await db.scalars(insert(self.model).returning(self.model), rows)
+        objs = result.all()
+        await db.run_sync(audit.stage_objects, "insert", objs)
+        read_cache.track(db.sync_session, objs)
+        if commit:
+            await db.commit()
+        return objs
+
+    @timed
     async def update(
         self,
         db: AsyncSession,
         *,
         db_obj: ModelType,
         obj_in: Union[UpdateSchemaType, Dict[str, Any]],
+        commit: bool = True,
+        refresh: bool = True,
     ) -> ModelType:
-        obj_data = jsonable_encoder(
-            db_obj, exclude={"embedding", "vector", "routing_options"}
-        )
         if isinstance(obj_in, dict):
             update_data = obj_in
         else:
-            update_data = jsonable_encoder(obj_in, exclude_unset=True)
-        for field in obj_data:
-            if field in update_data:
-                setattr(db_obj, field, update_data[field])
+            update_data = obj_in.model_dump(exclude_unset=True)
+        # Only the given columns are compared, and only the ones that differ
+        # are set, so the flush (and the audit trail) sees just real changes
+        columns = self.model.__table__.columns.keys()
+        for field, value in update_data.items():
+            if field in columns and getattr(db_obj, field) != value:
+                setattr(db_obj, field, value)
         db.add(db_obj)
-        await db.commit()
-        await db.refresh(db_obj)
+        await self._commit(db, db_obj, commit, refresh)
         return db_obj
 
-    async def remove(self, db: AsyncSession, *, id: str) -> ModelType:
+    @timed
+    async def update_many(
+        self,
+        db: AsyncSession,
+        *,
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]],
+        ids: Optional[List[Any]] = None,
+        filters: list = [],
+        commit: bool = True,
+    ) -> List[ModelType]:
+        """
+        Apply the same changes to every row matching ``ids`` and/or
+        ``filters`` with one UPDATE ... RETURNING; returns the updated rows.
+        """
+        if isinstance(obj_in, dict):
+            update_data = obj_in
+        else:
+            update_data = jsonable_encoder(obj_in, exclude_unset=True)
+        columns = self.model.__table__.columns.keys()
+        update_data = {k: v for k, v in update_data.items() if k in columns}
+        if not update_data:
+            return list(await self.get_multi(db, filters=self._bulk_filters(ids, filters), limit=None))
+
+        filters = self._bulk_filters(ids, filters)
+        # RETURNING only has the new values; the audit trail needs the old ones
+        before = await audit.current_values(db, self.model, filters, list(update_data))
+        statement = (
+            update(self.model)
+            .where(*filters)
+            .values(**update_data)
+            .returning(self.model)
+        )
+        result = await db.scalars(statement, execution_options={"synchronize_session": "fetch"})
+        objs = result.all()
+        await db.run_sync(audit.stage_objects, "update", objs, update_data, before)
+        read_cache.track(db.sync_session, objs)
+        if commit:
+            await db.commit()
+        return objs
+
+    @timed
+    async def remove(self, db: AsyncSession, *, id: str, commit: bool = True) -> ModelType:
+        # Served from the identity map when the caller already loaded the object
         obj = await db.get(self.model, id)
         await db.delete(obj)
-        await db.commit()
+        if commit:
+            await db.commit()
         return obj
+
+    @timed
+    async def remove_many(
+        self,
+        db: AsyncSession,
+        *,
+        ids: Optional[List[Any]] = None,
+        filters: list = [],
+        commit: bool = True,
+    ) -> List[ModelType]:
+        """
+        Delete every row matching ``ids`` and/or ``filters`` with one
+        DELETE ... RETURNING; returns the deleted rows. Unlike ``remove`` this
+        bypasses ORM cascades.
+        """
+        statement = (
+            delete(self.model)
+            .where(*self._bulk_filters(ids, filters))
+            .returning(self.model)
+        )
+        result = await db.scalars(statement, execution_options={"synchronize_session": "fetch"})
+        objs = result.all()
+        await db.run_sync(audit.stage_objects, "delete", objs)
+        read_cache.track(db.sync_session, objs)
+        if commit:
+            await db.commit()
+        return objs
+
+    def _bulk_filters(self, ids: Optional[List[Any]], filters: list) -> list:
+        if ids is None and not filters:
+            # Refuse to touch the whole table by accident
+            raise ValueError("ids or filters are required")
+        if ids is not None:
+            return [self.model.id.in_(ids), *filters]
+        return list(filters)
+
+    async def _commit(self, db: AsyncSession, db_obj: ModelType, commit: bool, refresh: bool) -> None:
+        """
+        With ``commit=False`` the change is only staged in ``db``, so several
+        writes can share one transaction; ``refresh=False`` skips reloading
+        the row (the session keeps objects usable after commit).
+        """
+        if not commit:
+            return
+        await db.commit()
+        if refresh:
+            await db.refresh(db_obj)
     
 class CRUDChat(
     CRUDBase[Chat, schemas.ChatCreate, schemas.ChatUpdate]
 ):
-    pass
+    @timed
+    async def create(self, db: AsyncSession, *, obj_in: schemas.ChatCreate) -> Chat:
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        db_obj = Chat(message_count=0, created_at=now, active_at=now)
+        db.add(db_obj)
+        if obj_in.messages:
+            await db.flush()  # assigns db_obj.id
+            self._add_messages(db, db_obj, obj_in.messages)
+
+        await db.commit()
+        await db.refresh(db_obj)
+        return db_obj
+
+    @timed
+    async def get_messages(
+        self,
+        db: AsyncSession,
+        *,
+        chat_id: str,
+        since_seq: Optional[int] = None,
+        before_seq: Optional[int] = None,
+        limit: Optional[int] = None,
+        raw: bool = False,
+    ) -> list:
+        """
+        Messages of a chat in seq order, optionally restricted to
+        ``since_seq <= seq < before_seq``. With ``limit``, only the last
+        ``limit`` of those are loaded, walking the (chat_id, seq) primary key
+        backwards instead of using OFFSET.
+
+        With ``raw``, (seq, data) rows are returned instead of ChatMessage
+        objects, ``data`` being the stored JSON text, not parsed.
+        """
+        if raw:
+            statement = select(ChatMessage.seq, type_coerce(ChatMessage.data, Text).label("data"))
+        else:
+            statement = select(ChatMessage)
+        statement = statement.filter(ChatMessage.chat_id == chat_id)
+        if since_seq is not None:
+            statement = statement.filter(ChatMessage.seq >= since_seq)
+        if before_seq is not None:
+            statement = statement.filter(ChatMessage.seq < before_seq)
+        if limit is None:
+            statement = statement.order_by(ChatMessage.seq)
+        else:
+            statement = statement.order_by(ChatMessage.seq.desc()).limit(limit)
+        result = await db.execute(statement)
+        rows = result.all() if raw else result.scalars().all()
+        return rows if limit is None else rows[::-1]
+
+    @timed
+    async def get_summaries(
+        self,
+        db: AsyncSession,
+        *,
+        before: Optional[Tuple[datetime, str]] = None,
+        limit: int = 20,
+    ) -> list:
+        """
+        Listing rows for the newest chats: id, created_at, message_count,
+        last_message_preview and form_count. Pages by keyset on (created_at, id)
+        from ``before`` (the last row of the previous page), walking the
+        ix_chat_created_at index; message bodies are never read.
+        """
+        form_count = (
+            select(func.count())
+            .where(FormSubmission.chat_id == Chat.id)
+            .correlate(Chat)
+            .scalar_subquery()
+        )
+        statement = select(
+            Chat.id,
+            Chat.created_at,
+            Chat.message_count,
+            Chat.last_message_preview,
+            form_count.label("form_count"),
+        )
+        if before is not None:
+            statement = statement.filter(tuple_(Chat.created_at, Chat.id) < tuple_(*before))
+        statement = statement.order_by(Chat.created_at.desc(), Chat.id.desc()).limit(limit)
+        result = await db.execute(statement)
+        return result.all()
+
+    @timed
+    async def get_message_sizes(
+        self, db: AsyncSession, *, chat_id: str, since_seq: int = 0
+    ) -> list:
+        """(seq, role, token_count) of messages from ``since_seq`` on, newest first, without their bodies."""
+        statement = (
+            select(ChatMessage.seq, ChatMessage.role, ChatMessage.token_count)
+            .filter(ChatMessage.chat_id == chat_id, ChatMessage.seq >= since_seq)
+            .order_by(ChatMessage.seq.desc())
+        )
+        result = await db.execute(statement)
+        return result.all()
+
+    @timed
+    async def append_messages(
+        self, db: AsyncSession, *, db_obj: Chat, messages: list
+    ) -> List[ChatMessage]:
+        """
+        Insert ``messages`` after the last stored one; earlier rows are left
+        untouched. Raises ``StaleDataError`` if another turn appended to the
+        chat since ``db_obj`` was loaded.
+        """
+        rows = self._add_messages(db, db_obj, messages)
+        db.add(db_obj)
+        await db.commit()
+        return rows
+
+    def _add_messages(self, db: AsyncSession, db_obj: Chat, messages: list) -> List[ChatMessage]:
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        rows = [
+            ChatMessage(
+                chat_id=db_obj.id,
+                seq=db_obj.message_count + i,
+                created_at=now,
+                role=m.get("role"),
+                data=m,
+                token_count=count_message_tokens(m),
+            )
+            for i, m in enumerate(messages)
+        ]
+        db.add_all(rows)
+        db_obj.message_count += len(rows)
+        db_obj.active_at = now
+        for m in reversed(messages):
+            preview = message_preview(m)
+            if preview:
+                db_obj.last_message_preview = preview
+                break
+        return rows
+
+def message_preview(message: dict) -> Optional[str]:
+    """Start of a message's text content, or None for tool calls and the like."""
+    content = message.get("content")
+    if isinstance(content, str) and content:
+        return content[:PREVIEW_LENGTH]
+    return None
 
 chat = CRUDChat(Chat)
 
+# See models.FORM_SEARCH_DDL
+form_search = table("form_submission_search", column("rowid"), column("form_id"), column("rank"))
+# Searches with more matches than this are listed newest first instead of ranked
+SEARCH_RANK_LIMIT = 1000
+_PHONE_QUERY = re.compile(r"^[\d\s()+.-]+$")
+
+def search_expression(query: str) -> Optional[str]:
+    """
+    Turn a user's search box input into an FTS5 MATCH expression, or None if
+    there is nothing to search for. Input that looks like a phone number is
+    matched by its digits; a term with an @ is an email prefix ("jane@"
+    finds jane@example.com, not mary.jane@...); any other term must
+    prefix-match a word of the name or email.
+    """
+    digits = re.sub(r"\D", "", query)
+    if _PHONE_QUERY.match(query) and len(digits) >= 3:
+        return f'phone : "{digits}"*'
+    terms = []
+    for term in query.lower().split():
+        if "@" in term:
+            column, term = "email_key", re.sub(r"[.@_+-]", "", term)
+        else:
+            column = "{name email}"
+        # Only word characters reach the expression, so input can't inject FTS syntax
+        tokens = re.findall(r"\w+", term)
+        if tokens:
+            terms.append(f'{column} : "' + " ".join(tokens) + '"*')
+    return " AND ".join(terms) or None
+
 class CRUDFormSubmission(
     CRUDBase[FormSubmission, schemas.FormSubmissionCreate, schemas.FormSubmissionUpdate]
 ):
-    pass
+    @timed
+    async def search(
+        self,
+        db: AsyncSession,
+        *,
+        query: str,
+        after: Optional[Tuple[Optional[float], int]] = None,
+        limit: int = 20,
+    ) -> list:
+        """
+        Forms matching ``query`` as (FormSubmission, rank, rowid) rows.
+
+        Scoring a match costs a lookup per row, so results are ranked best
+        match first only when there are at most ``SEARCH_RANK_LIMIT``
+        matches; broader queries ("jane") list the newest matches first and
+        come back with a None rank. Pages by keyset from ``after``, the
+        (rank, rowid) of the previous page's last row, which also tells which
+        of the two orders the search is in.
+        """
+        expression = search_expression(query)
+        if expression is None:
+            return []
+        match = literal_column("form_submission_search").op("MATCH")(expression)
+
+        if after is None:
+            # Counting stops as soon as the limit is exceeded
+            matching = await db.scalar(
+                select(func.count()).select_from(
+                    select(form_search.c.rowid).filter(match).limit(SEARCH_RANK_LIMIT + 1).subquery()
+                )
+            )
+            ranked = matching <= SEARCH_RANK_LIMIT
+        else:
+            ranked = after[0] is not None
+
+        if ranked:
+            matches = select(form_search.c.rowid, form_search.c.form_id, form_search.c.rank).filter(match)
+            if after is not None:
+                matches = matches.filter(tuple_(form_search.c.rank, form_search.c.rowid) > tuple_(*after))
+            order_by = [form_search.c.rank, form_search.c.rowid]
+        else:
+            matches = select(
+                form_search.c.rowid, form_search.c.form_id, null().label("rank")
+            ).filter(match)
+            if after is not None:
+                matches = matches.filter(form_search.c.rowid < after[1])
+            order_by = [form_search.c.rowid.desc()]
+        # Order and cut the page inside the FTS table first, so only the
+        # page's rows are joined to form_submission
+        matches = matches.order_by(*order_by).limit(limit).subquery()
+        statement = (
+            select(FormSubmission, matches.c.rank, matches.c.rowid)
+            .join(matches, FormSubmission.id == matches.c.form_id)
+            .order_by(*([matches.c.rank, matches.c.rowid] if ranked else [matches.c.rowid.desc()]))
+        )
+        result = await db.execute(statement)
+        return result.all()
+
+form = CRUDFormSubmission(FormSubmission)
+
+class CRUDIdempotencyKey:
+    async def get(
+        self, db: AsyncSession, *, chat_id: str, key: str, max_age: float
+    ) -> Optional[IdempotencyKey]:
+        """The stored key, unless it is older than ``max_age`` seconds."""
+        obj = await db.get(IdempotencyKey, (chat_id, key))
+        oldest = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=max_age)
+        if obj is None or obj.created_at < oldest:
+            return None
+        return obj
+
+    async def add(
+        self, db: AsyncSession, *, chat_id: str, key: str, request_hash: str,
+        first_seq: int, end_seq: int, max_age: float,
+    ) -> IdempotencyKey:
+        """
+        Stage a key in ``db`` without committing, so it is saved in the same
+        transaction as the turn it belongs to. Expired keys are purged first.
+        """
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        await db.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.created_at < now - timedelta(seconds=max_age))
+        )
+        return await db.merge(
+            IdempotencyKey(
+                chat_id=chat_id, key=key, request_hash=request_hash,
+                first_seq=first_seq, end_seq=end_seq, created_at=now,
+            )
+        )
 
-form = CRUDFormSubmission(FormSubmission)
\ No newline at end of file
+idempotency_key = CRUDIdempotencyKey()
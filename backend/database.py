@@ -1,19 +1,105 @@
-import os
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from typing import NamedTuple
+
+from sqlalchemy import Delete, Insert, Update, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from config import Settings, settings
+import metrics
+
+
+class Engines(NamedTuple):
+    writer: AsyncEngine
+    # Same as writer unless reads are split off
+    reader: AsyncEngine
+
+
+def _set_sqlite_pragmas(settings: Settings, read_only: bool):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout)}")
+        cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    return on_connect
+
+
+def create_engines(url: str, settings: Settings = settings) -> Engines:
+    """
+    Engines for the app database, according to ``settings.database_profile``.
+
+    With the "tuned" profile a SQLite database is opened in WAL mode, with a
+    busy timeout and relaxed fsyncs (see the sqlite_* settings), through one
+    writer connection and a pool of read-only ones. WAL lets readers run
+    while a write is in progress, and funnelling every write through a single
+    connection makes writers queue in the pool instead of retrying on
+    "database is locked". Connections are never pre-pinged: a SQLite file
+    can't drop a connection.
+
+    The "basic" profile, and any non-SQLite URL, get one default engine.
+    """
+    if settings.database_profile == "basic" or make_url(url).get_backend_name() != "sqlite":
+        engine = create_async_engine(url, pool_pre_ping=not url.startswith("sqlite"))
+        metrics.count_queries(engine.sync_engine)
+        return Engines(writer=engine, reader=engine)
+
+    # aiosqlite opens a connection (and a thread) per checkout by default
+    writer = create_async_engine(url, poolclass=AsyncAdaptedQueuePool, pool_size=1, max_overflow=0)
+    reader = create_async_engine(
+        url, poolclass=AsyncAdaptedQueuePool, pool_size=settings.sqlite_read_pool_size, max_overflow=0
+    )
+    event.listen(writer.sync_engine, "connect", _set_sqlite_pragmas(settings, read_only=False))
+    event.listen(reader.sync_engine, "connect", _set_sqlite_pragmas(settings, read_only=True))
+    for engine in (writer, reader):
+        metrics.count_queries(engine.sync_engine)
+    return Engines(writer=writer, reader=reader)
+
+
+class RoutingSession(Session):
+    """
+    Sends reads to the reader engine and everything else to the writer.
+    Once a transaction has written, the rest of it stays on the writer so
+    it reads its own writes.
+    """
+
+    _wrote = False
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        reader = self.info.get("read_bind")
+        if reader is None or self._wrote:
+            return super().get_bind(mapper, clause=clause, **kw)
+        if self._flushing or isinstance(clause, (Insert, Update, Delete)):
+            self._wrote = True
+            return super().get_bind(mapper, clause=clause, **kw)
+        return reader
+
+    def use_writer(self) -> None:
+        """Send the rest of the transaction to the writer, e.g. to read rows it is about to update."""
+        self._wrote = True
+
 
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _reset_routing(session, transaction):
+    if transaction.parent is None:
+        session._wrote = False
 
-def get_async_url():
-    # username = os.getenv("DB_USERNAME")
-    # password = os.getenv("DB_PASSWORD")
-    # host = os.getenv("DB_HOST")
-    # port = os.getenv("DB_PORT")
 
-    return f"sqlite+aiosqlite:///./dev.db"
+def configure_sessions(engines: Engines) -> None:
+    """Point ``SessionLocal`` at ``engines``."""
+    read_bind = engines.reader.sync_engine if engines.reader is not engines.writer else None
+    SessionLocal.configure(bind=engines.writer, info={"read_bind": read_bind})
 
-SQLALCHEMY_ASYNC_DATABASE_URL = get_async_url()
 
-engine = create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL, pool_pre_ping=True)
-SessionLocal = async_sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)
+engines = create_engines(settings.database_url)
+SessionLocal = async_sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, sync_session_class=RoutingSession
+)
+configure_sessions(engines)
 
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
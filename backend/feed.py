@@ -0,0 +1,259 @@
+import asyncio
+import logging
+from collections import defaultdict, deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Set
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import audit
+from config import Settings, settings
+from database import SessionLocal
+import metrics
+from models import FormSubmission
+
+logger = logging.getLogger(__name__)
+
+# Change feed of chats and forms, pushed to subscribers as they commit.
+#
+# Events are the audit records of committed transactions (see audit.py):
+# their seq is the journal's, global and increasing in commit order, and
+# their changes are the same {field: {"old": ..., "new": ...}} deltas, so an
+# insert carries every field and an update only the changed ones. A client
+# that reconnects with the last seq it saw is sent the events it missed from
+# a bounded buffer of recent ones, or a "reset" when they are no longer
+# there, after which it should refetch.
+#
+# Each worker tails the audit trail in the database by seq, so it sees every
+# commit: its own, other workers' and the job workers' (e.g. the forms a
+# chat turn's tool calls create with JOBS_IN_PROCESS=false). Its own commits
+# wake it at once; others are picked up within feed_poll_interval seconds.
+
+# Changes read per query while catching up
+POLL_BATCH = 1000
+
+
+async def _route(db: AsyncSession, records: List[dict]) -> None:
+    """Set the chat_id each record's event is published under."""
+    lookup = set()
+    for record in records:
+        if record["entity_type"] == "chat":
+            record["chat_id"] = record["entity_id"]
+            continue
+        # Inserts and deletes carry every field, updates that move a form too
+        change = record["changes"].get("chat_id")
+        record["chat_id"] = change.get("new", change.get("old")) if change else None
+        if change is None:
+            lookup.add(record["entity_id"])
+    if lookup:
+        result = await db.execute(
+            select(FormSubmission.id, FormSubmission.chat_id).where(FormSubmission.id.in_(lookup))
+        )
+        chat_ids = dict(result.all())
+        for record in records:
+            if record["chat_id"] is None:
+                # None for a form deleted since: only the global subscribers get it
+                record["chat_id"] = chat_ids.get(record["entity_id"])
+
+
+class Subscription:
+    __slots__ = ("chat_id", "_size", "_events", "_ready", "overflowed")
+
+    def __init__(self, chat_id: Optional[str], size: int):
+        """Events of ``chat_id`` (every chat if None), at most ``size`` waiting at once."""
+        self.chat_id = chat_id
+        self._size = size
+        self._events: Deque[dict] = deque()
+        self._ready = asyncio.Event()
+        # Set when events had to be dropped; the subscriber is sent a reset
+        self.overflowed = False
+
+    def push(self, event: dict) -> None:
+        if self.overflowed:
+            return
+        if len(self._events) >= self._size:
+            # A reset replaces what's waiting, so a slow reader doesn't hold memory
+            self.overflowed = True
+            self._events.clear()
+        else:
+            self._events.append(event)
+        self._ready.set()
+
+    async def next(self, timeout: float) -> List[dict]:
+        """The events waiting, once there are any, or [] after ``timeout`` seconds."""
+        if not self._events and not self.overflowed:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        self._ready.clear()
+        events = list(self._events)
+        self._events.clear()
+        return events
+
+
+def _event(record: dict) -> dict:
+    return {
+        "type": "change",
+        "seq": record["seq"],
+        "entity_type": record["entity_type"],
+        "entity_id": record["entity_id"],
+        "chat_id": record["chat_id"],
+        "action": record["action"],
+        "changes": record["changes"],
+        "changed_at": record["changed_at"].isoformat(),
+    }
+
+
+class ChangeFeed:
+    def __init__(self, settings: Settings):
+        """
+        Keeps the last ``feed_buffer_size`` events for resuming, and gives
+        each subscriber a buffer of ``feed_subscriber_buffer`` events. An idle
+        subscriber costs an empty deque and an Event; publishing only touches
+        the subscribers of the event's chat and the global ones.
+        """
+        self.settings = settings
+        self._recent: Deque[dict] = deque()
+        # Events up to this seq may be missing from _recent (evicted, or
+        # committed before the feed started); None until it is looked up
+        self._floor: Optional[int] = None
+        self.last_seq = 0
+        self._by_chat: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._everything: Set[Subscription] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    async def start(self) -> None:
+        """Start tailing the audit trail from the last seq assigned: older seqs can't be resumed from."""
+        if self._task is not None:
+            return
+        async with SessionLocal() as db:
+            # The journal's AUTOINCREMENT counter is the last seq ever assigned
+            seq = await db.scalar(text("SELECT seq FROM sqlite_sequence WHERE name = 'audit_journal'")) or 0
+        if self._task is not None:
+            return
+        if not self.settings.audit_enabled:
+            logger.warning("AUDIT_ENABLED is off, so the change feed has no events to send")
+        self._floor = seq
+        self.last_seq = seq
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.clear()
+
+    def notify(self, records: List[dict]) -> None:
+        """Called as this process commits changes, so they are published without waiting for a poll."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self) -> None:
+        while True:
+            # Cleared before looking, so a commit made meanwhile still wakes us
+            self._wake.clear()
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception("Reading the change feed failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.settings.feed_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def poll(self) -> None:
+        """Publish every change committed since ``last_seq``."""
+        while True:
+            async with SessionLocal() as db:
+                records = await audit.changes_after(db, self.last_seq, POLL_BATCH)
+                await _route(db, records)
+            self.publish(records)
+            if len(records) < POLL_BATCH:
+                return
+
+    def publish(self, records: List[dict]) -> None:
+        for record in records:
+            self.last_seq = max(self.last_seq, record["seq"])
+            if record["chat_id"] is None and record["entity_type"] != "chat":
+                continue  # e.g. a form without a chat
+            event = _event(record)
+            self._recent.append(event)
+            if len(self._recent) > self.settings.feed_buffer_size:
+                evicted = self._recent.popleft()
+                self._floor = max(self._floor or 0, evicted["seq"])
+            for subscription in self._by_chat.get(event["chat_id"], ()):
+                subscription.push(event)
+            for subscription in self._everything:
+                subscription.push(event)
+
+    async def subscribe(self, chat_id: Optional[str], after: Optional[int]) -> Subscription:
+        """
+        Subscribe to ``chat_id``'s events (every chat's if None). With
+        ``after``, the events since that seq are queued first, or a reset if
+        some of them are gone.
+        """
+        await self.start()
+        subscription = Subscription(chat_id, self.settings.feed_subscriber_buffer)
+        if after is not None:
+            if after < self._floor:
+                subscription.overflowed = True
+            else:
+                for event in self._recent:
+                    if event["seq"] > after and chat_id in (None, event["chat_id"]):
+                        subscription.push(event)
+        if chat_id is None:
+            self._everything.add(subscription)
+        else:
+            self._by_chat[chat_id].add(subscription)
+        metrics.feed_subscribers.inc(1, "chat" if chat_id else "all")
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        if subscription.chat_id is None:
+            self._everything.discard(subscription)
+        else:
+            subscribers = self._by_chat.get(subscription.chat_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._by_chat[subscription.chat_id]
+        metrics.feed_subscribers.inc(-1, "chat" if subscription.chat_id else "all")
+
+    async def events(self, chat_id: Optional[str], after: Optional[int]) -> AsyncIterator[dict]:
+        """
+        Change events as they are published, plus a "reset" event when some
+        were lost and a "heartbeat" every ``feed_heartbeat`` idle seconds.
+        Holds no database connection while waiting.
+        """
+        subscription = await self.subscribe(chat_id, after)
+        try:
+            while True:
+                events = await subscription.next(self.settings.feed_heartbeat)
+                if subscription.overflowed:
+                    subscription.overflowed = False
+                    metrics.feed_resets.inc(1)
+                    yield {"type": "reset", "seq": self.last_seq}
+                    continue
+                if not events:
+                    yield {"type": "heartbeat"}
+                for event in events:
+                    yield event
+        finally:
+            self.unsubscribe(subscription)
+
+    def clear(self) -> None:
+        self._recent.clear()
+        self._floor = None
+        self.last_seq = 0
+
+
+change_feed = ChangeFeed(settings)
+audit.committed_hooks.append(change_feed.notify)
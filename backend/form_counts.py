@@ -0,0 +1,103 @@
+import logging
+from datetime import date
+from typing import Dict, Optional
+
+from sqlalchemy import and_, delete, func, insert, literal, or_, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import jobs
+from models import FormCount, FormSubmission
+
+logger = logging.getLogger(__name__)
+
+# Form counts for dashboards, read from the form_count counters (see
+# models.FormCount), which triggers keep current on every form write.
+# rebuild() recomputes them from the forms themselves, in case they ever
+# drift (e.g. rows written with triggers disabled, or a restored backup).
+
+EVERY = ""  # chat_id of the all-chats counters, day of the all-days ones
+
+
+def _breakdown(counts: Dict[Optional[int], int]) -> dict:
+    return {
+        "total": sum(counts.values()),
+        "by_status": [{"status": status, "count": count} for status, count in sorted(counts.items(), key=_order)],
+    }
+
+
+def _order(item) -> tuple:
+    # Forms without a status last
+    return (item[0] is None, item[0] or 0)
+
+
+async def get_counts(
+    db: AsyncSession,
+    chat_id: Optional[str] = None,
+    *,
+    by_day: bool = False,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+) -> dict:
+    """
+    Form total and status breakdown of ``chat_id`` (every chat if None),
+    plus the same per created_at day with ``by_day``, between ``since`` and
+    ``until`` inclusive.
+    """
+    query = select(FormCount.day, FormCount.status, FormCount.count).where(
+        FormCount.chat_id == (chat_id if chat_id is not None else EVERY), FormCount.count != 0
+    )
+    if by_day:
+        days = [FormCount.day != EVERY]
+        if since is not None:
+            days.append(FormCount.day >= since.isoformat())
+        if until is not None:
+            days.append(FormCount.day <= until.isoformat())
+        query = query.where(or_(FormCount.day == EVERY, and_(*days)))
+    else:
+        query = query.where(FormCount.day == EVERY)
+
+    overall: Dict[Optional[int], int] = {}
+    per_day: Dict[str, Dict[Optional[int], int]] = {}
+    for day, status, count in await db.execute(query):
+        counts = overall if day == EVERY else per_day.setdefault(day, {})
+        counts[status or None] = count
+    result = _breakdown(overall)
+    if by_day:
+        result["by_day"] = [{"day": day, **_breakdown(counts)} for day, counts in sorted(per_day.items())]
+    return result
+
+
+def _recount():
+    """Every counter, computed from form_submission."""
+    day = func.date(FormSubmission.created_at)
+    status = func.coalesce(FormSubmission.status, 0)
+    queries = []
+    for chat in (FormSubmission.chat_id, None):
+        for per_day in (True, False):
+            keys = [k for k in (chat, day if per_day else None) if k is not None]
+            query = select(
+                (chat if chat is not None else literal(EVERY)).label("chat_id"),
+                (day if per_day else literal(EVERY)).label("day"),
+                status.label("status"),
+                func.count().label("count"),
+            ).group_by(*keys, status)
+            if per_day:
+                query = query.where(FormSubmission.created_at.is_not(None))
+            queries.append(query)
+    return union_all(*queries)
+
+
+@jobs.handler("rebuild_form_counts")
+async def rebuild(db: AsyncSession, payload: dict) -> None:
+    """Replace every counter with a fresh count, in one transaction."""
+    result = await db.execute(
+        select(FormCount.chat_id, FormCount.day, FormCount.status, FormCount.count).where(FormCount.count != 0)
+    )
+    before = {tuple(row[:3]): row[3] for row in result}
+    await db.execute(delete(FormCount))
+    rows = [row._asdict() for row in await db.execute(_recount())]
+    if rows:
+        await db.execute(insert(FormCount), rows)
+    drifted = sum(before.pop((r["chat_id"], r["day"], r["status"]), 0) != r["count"] for r in rows) + len(before)
+    log = logger.warning if drifted else logger.info
+    log("Rebuilt %s form counters, %s of them were off", len(rows), drifted)
@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import and_, delete, event, func, or_, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from config import Settings, settings
+from database import RoutingSession, SessionLocal
+import metrics
+from models import Job
+
+logger = logging.getLogger(__name__)
+
+# Durable job queue in the app database.
+#
+# enqueue() stages a job in the caller's session, so it is committed (or
+# rolled back) with the work that asked for it. Workers claim due jobs with
+# a lease, run the job's handler in a session of their own and mark the job
+# done in that same transaction: a handler's database writes happen exactly
+# once, while anything it does outside the database may be repeated if the
+# worker dies half way, so it should be idempotent.
+#
+# A failed attempt is retried after jobs_backoff_base * 2 ** (attempts - 1)
+# seconds (capped, with jitter) until jobs_max_attempts, then the job is
+# left "failed" with its last error. Jobs of one chat run one at a time, in
+# the order they were enqueued; a job waiting for a retry holds back the
+# chat's later jobs.
+
+Handler = Callable[[AsyncSession, dict], Awaitable[None]]
+HANDLERS: Dict[str, Handler] = {}
+# Kinds whose dedupe key is dropped once the job finishes, so it only
+# dedupes jobs that are queued or running
+RELEASES_DEDUPE_KEY: Set[str] = set()
+
+STATUSES = ["queued", "running", "done", "failed"]
+
+
+def handler(kind: str, *, keep_dedupe_key: bool = True) -> Callable[[Handler], Handler]:
+    """
+    Register the decorated ``async def f(db, payload)`` as the handler of
+    ``kind`` jobs. With ``keep_dedupe_key=False`` a finished job no longer
+    holds its dedupe key, e.g. for periodic work queued under a fixed key.
+    """
+    def register(f: Handler) -> Handler:
+        HANDLERS[kind] = f
+        if not keep_dedupe_key:
+            RELEASES_DEDUPE_KEY.add(kind)
+        return f
+    return register
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _released(job: Job) -> dict:
+    """The values that drop a finishing job's dedupe key, if its kind doesn't keep it."""
+    return {"dedupe_key": None} if job.kind in RELEASES_DEDUPE_KEY else {}
+
+
+async def enqueue(
+    db: AsyncSession,
+    kind: str,
+    payload: dict,
+    *,
+    chat_id: Optional[str] = None,
+    dedupe_key: Optional[str] = None,
+    delay: float = 0.0,
+) -> None:
+    """
+    Stage a ``kind`` job in ``db``; it is queued when ``db`` commits. A job
+    with the ``dedupe_key`` of a queued, running or retained job is dropped.
+    """
+    now = _now()
+    await db.execute(
+        insert(Job)
+        .values(
+            kind=kind, payload=payload, chat_id=chat_id, dedupe_key=dedupe_key, status="queued",
+            attempts=0, created_at=now, run_at=now + timedelta(seconds=delay),
+        )
+        .on_conflict_do_nothing(index_elements=["dedupe_key"])
+    )
+    db.sync_session.info["jobs_enqueued"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _wake_workers(session):
+    if session.info.pop("jobs_enqueued", False):
+        job_queue.wake()
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _drop_rolled_back(session):
+    session.info.pop("jobs_enqueued", None)
+
+
+def backoff(settings: Settings, attempts: int) -> float:
+    """Seconds before retrying a job that has failed ``attempts`` times."""
+    delay = min(settings.jobs_backoff_max, settings.jobs_backoff_base * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+async def count_by_status(db: AsyncSession) -> Dict[str, int]:
+    result = await db.execute(select(Job.status, func.count()).group_by(Job.status))
+    counts = dict.fromkeys(STATUSES, 0)
+    counts.update(result.all())
+    return counts
+
+
+async def update_depth(db: AsyncSession) -> None:
+    """Refresh the app_jobs gauge (done at scrape time)."""
+    for status, count in (await count_by_status(db)).items():
+        metrics.jobs.set(count, status)
+
+
+class JobQueue:
+    def __init__(self, settings: Settings):
+        """
+        ``jobs_workers`` worker tasks, each claiming and running one job at a
+        time. Several processes can run workers against the same database:
+        claims are single UPDATE ... RETURNING statements, and a worker that
+        dies leaves its job to be claimed again once the lease expires.
+        """
+        self.settings = settings
+        self._tasks: List[asyncio.Task] = []
+        # One per worker, so a worker clearing its own can't swallow another's wakeup
+        self._wakes: List[asyncio.Event] = []
+        self._stopping = False
+        self._last_purge = 0.0
+
+    def start(self) -> None:
+        self._stopping = False
+        self._wakes = [asyncio.Event() for _ in range(self.settings.jobs_workers)]
+        self._tasks = [asyncio.create_task(self._run(wake)) for wake in self._wakes]
+
+    async def stop(self) -> None:
+        """Stop the workers once their current jobs are done."""
+        if not self._tasks:
+            return
+        self._stopping = True
+        self.wake()
+        await asyncio.gather(*self._tasks)
+        self._tasks = []
+
+    def wake(self) -> None:
+        for wake in self._wakes:
+            wake.set()
+
+    async def _run(self, wake: asyncio.Event) -> None:
+        while not self._stopping:
+            # Cleared before looking, so a job enqueued meanwhile still wakes us
+            wake.clear()
+            try:
+                job = await self.claim()
+                if job is not None:
+                    await self.run(job)
+                    continue
+                await self._purge()
+            except Exception:
+                logger.exception("Job worker failed")
+            # Nothing due: sleep until woken or the next poll
+            try:
+                await asyncio.wait_for(wake.wait(), self.settings.jobs_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def claim(self) -> Optional[Job]:
+        """
+        Take the oldest due job whose chat has no earlier unfinished job,
+        or a running job whose lease has expired.
+        """
+        now = _now()
+        earlier = aliased(Job)
+        blocked = (
+            select(earlier.id)
+            .where(
+                earlier.chat_id == Job.chat_id,
+                earlier.id < Job.id,
+                earlier.status.in_(["queued", "running"]),
+            )
+            .exists()
+        )
+        claimable = or_(
+            and_(Job.status == "queued", Job.run_at <= now),
+            and_(Job.status == "running", Job.lease_until < now),
+        )
+        async with SessionLocal() as db:
+            # Looked up on a read connection first, so idle polling never
+            # takes the write lock
+            while True:
+                job_id = await db.scalar(
+                    select(Job.id).where(claimable, ~blocked).order_by(Job.id).limit(1)
+                )
+                if job_id is None:
+                    return None
+                job = await db.scalar(
+                    update(Job)
+                    .where(Job.id == job_id, claimable)
+                    .values(
+                        status="running",
+                        attempts=Job.attempts + 1,
+                        lease_until=now + timedelta(seconds=self.settings.jobs_lease),
+                    )
+                    .returning(Job)
+                )
+                await db.commit()
+                if job is not None:
+                    return job
+                # Another worker got it first
+
+    async def run(self, job: Job) -> None:
+        start = time.perf_counter()
+        try:
+            async with SessionLocal() as db:
+                await HANDLERS[job.kind](db, job.payload)
+                # Only if the lease wasn't lost to another worker meanwhile
+                finished = await db.execute(
+                    update(Job)
+                    .where(Job.id == job.id, Job.attempts == job.attempts, Job.status == "running")
+                    .values(status="done", finished_at=_now(), lease_until=None, last_error=None, **_released(job))
+                )
+                if finished.rowcount:
+                    await db.commit()
+                else:
+                    await db.rollback()
+        except Exception as e:
+            logger.warning("Job %s (%s) failed on attempt %s: %r", job.id, job.kind, job.attempts, e)
+            metrics.job_seconds.observe(time.perf_counter() - start, job.kind, "error")
+            await self._failed(job, e)
+            return
+        metrics.job_seconds.observe(time.perf_counter() - start, job.kind, "done")
+        metrics.job_latency_seconds.observe((_now() - job.created_at).total_seconds(), job.kind)
+
+    async def _failed(self, job: Job, error: Exception) -> None:
+        retry = job.attempts < self.settings.jobs_max_attempts
+        values = {"last_error": repr(error), "lease_until": None}
+        if retry:
+            delay = backoff(self.settings, job.attempts)
+            values.update(status="queued", run_at=_now() + timedelta(seconds=delay))
+            # Retry on time rather than at the next poll
+            asyncio.get_running_loop().call_later(delay, self.wake)
+        else:
+            values.update(status="failed", finished_at=_now(), **_released(job))
+        async with SessionLocal() as db:
+            await db.execute(
+                update(Job)
+                .where(Job.id == job.id, Job.attempts == job.attempts, Job.status == "running")
+                .values(**values)
+            )
+            await db.commit()
+
+    async def _purge(self) -> None:
+        """Delete jobs that finished more than ``jobs_retention`` seconds ago, at most once a minute."""
+        if time.monotonic() - self._last_purge < 60:
+            return
+        self._last_purge = time.monotonic()
+        cutoff = _now() - timedelta(seconds=self.settings.jobs_retention)
+        async with SessionLocal() as db:
+            await db.execute(
+                delete(Job).where(Job.status.in_(["done", "failed"]), Job.finished_at < cutoff)
+            )
+            await db.commit()
+
+
+job_queue = JobQueue(settings)
+
+
+async def main() -> None:
+    """Run workers until interrupted, for deployments with JOBS_IN_PROCESS=false."""
+    job_queue.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await job_queue.stop()
+
+
+if __name__ == "__main__":
+    import archive  # noqa: F401 (registers the handlers)
+    import form_counts  # noqa: F401
+    import tools  # noqa: F401
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,172 @@
+import asyncio
+from typing import AsyncIterator, Optional
+
+import httpx
+from openai import NOT_GIVEN, AsyncOpenAI
+from openai.types.chat.chat_completion_chunk import ChoiceDelta
+
+from config import Settings, settings
+from llm_cache import CompletionCache, cache_key
+import metrics
+
+
+class LLMClient:
+    def __init__(self, settings: Settings):
+        """
+        Async wrapper around the OpenAI chat completions API.
+
+        A single ``httpx.AsyncClient`` (and therefore a single bounded
+        connection pool) is shared by every request, and a semaphore caps how
+        many completions may be in flight at once so a burst of chat turns
+        queues up here instead of exhausting sockets upstream. Identical
+        requests are answered from ``cache`` when it is enabled.
+        """
+        self.settings = settings
+        self._client: Optional[AsyncOpenAI] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(settings.llm_max_concurrency)
+        self.cache = CompletionCache(settings)
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        if self._client is None:
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.settings.llm_max_connections,
+                    max_keepalive_connections=self.settings.llm_max_keepalive_connections,
+                ),
+                timeout=httpx.Timeout(
+                    self.settings.llm_timeout,
+                    connect=self.settings.llm_connect_timeout,
+                ),
+            )
+            self._client = AsyncOpenAI(
+                api_key=self.settings.openai_api_key,
+                base_url=self.settings.openai_base_url,
+                max_retries=self.settings.llm_max_retries,
+                http_client=self._http_client,
+            )
+        return self._client
+
+    async def complete(self, messages: list, tools: Optional[list] = None, **kwargs) -> dict:
+        if not self.settings.llm_cache_enabled:
+            return await self._complete(messages, tools, **kwargs)
+        key = cache_key(self.settings.llm_model, messages, tools, kwargs)
+        return await self.cache.get_or_compute(
+            key, self.settings.llm_model, lambda: self._complete(messages, tools, **kwargs)
+        )
+
+    async def _complete(self, messages: list, tools: Optional[list] = None, **kwargs) -> dict:
+        async with self._semaphore:
+            resp = await self.client.chat.completions.create(
+                messages=messages,
+                model=self.settings.llm_model,
+                tools=tools or NOT_GIVEN,
+                **kwargs,
+            )
+        if resp.usage is not None:
+            metrics.record_tokens(resp.usage.prompt_tokens, resp.usage.completion_tokens)
+        return resp.choices[0].message.model_dump()
+
+    async def stream(self, messages: list, tools: list) -> AsyncIterator[ChoiceDelta]:
+        """
+        Yield the deltas of a streamed completion as they arrive. A cached
+        completion is replayed as a single delta, and a streamed one is stored
+        in the cache once it finishes.
+        """
+        if not self.settings.llm_cache_enabled:
+            async for delta in self._stream(messages, tools):
+                yield delta
+            return
+
+        key = cache_key(self.settings.llm_model, messages, tools, {})
+        cached = await self.cache.get(key)
+        if cached is not None:
+            self.cache.stats["hits"] += 1
+            yield ChoiceDelta.model_validate(
+                {**cached, "tool_calls": [
+                    {**call, "index": i} for i, call in enumerate(cached.get("tool_calls") or [])
+                ] or None}
+            )
+            return
+
+        self.cache.stats["misses"] += 1
+        acc = MessageAccumulator()
+        async for delta in self._stream(messages, tools):
+            acc.add(delta)
+            yield delta
+        await self.cache.put(key, self.settings.llm_model, acc.message())
+
+    async def _stream(self, messages: list, tools: list) -> AsyncIterator[ChoiceDelta]:
+        async with self._semaphore:
+            stream = await self.client.chat.completions.create(
+                messages=messages,
+                model=self.settings.llm_model,
+                tools=tools,
+                stream=True,
+            )
+            async for chunk in stream:
+                if chunk.choices:
+                    yield chunk.choices[0].delta
+
+    async def aclose(self) -> None:
+        await self.cache.aclose()
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+            self._http_client = None
+
+
+class MessageAccumulator:
+    def __init__(self):
+        """
+        Rebuilds an assistant message from streamed deltas.
+
+        Content and tool-call argument fragments are appended to lists and
+        only joined once in ``message()``, so a long stream costs O(n) overall
+        instead of re-concatenating or re-parsing the buffer on every chunk.
+        """
+        self._content: list = []
+        self._tool_calls: dict = {}
+
+    def add(self, delta: ChoiceDelta) -> list:
+        """Record one delta and return the tool calls (id, name) first seen in it."""
+        if delta.content:
+            self._content.append(delta.content)
+
+        started = []
+        for tc in delta.tool_calls or []:
+            call = self._tool_calls.get(tc.index)
+            is_new = call is None
+            if is_new:
+                call = self._tool_calls[tc.index] = {"id": None, "name": "", "arguments": []}
+            if tc.id:
+                call["id"] = tc.id
+            if tc.function:
+                if tc.function.name:
+                    call["name"] += tc.function.name
+                if tc.function.arguments:
+                    call["arguments"].append(tc.function.arguments)
+            if is_new:
+                started.append({"id": call["id"], "name": call["name"]})
+        return started
+
+    def message(self) -> dict:
+        """The accumulated message, shaped like ``ChatCompletionMessage.model_dump()``."""
+        tool_calls = [
+            {
+                "id": call["id"],
+                "function": {"arguments": "".join(call["arguments"]), "name": call["name"]},
+                "type": "function",
+            }
+            for _, call in sorted(self._tool_calls.items())
+        ]
+        return {
+            "content": "".join(self._content) if self._content else None,
+            "role": "assistant",
+            "function_call": None,
+            "tool_calls": tool_calls or None,
+        }
+
+
+llm = LLMClient(settings)
@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import json
+import time
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import JSON, Column, Float, Integer, MetaData, String, Table, delete, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from config import Settings
+
+metadata = MetaData()
+
+# Lives in its own SQLite file (LLM_CACHE_PATH), not in the app database: it
+# is disposable, so it needs no migrations, and cache writes never contend
+# with chat writes for the database lock.
+completion_cache = Table(
+    "completion_cache",
+    metadata,
+    Column("key", String(64), primary_key=True),
+    Column("model", String),
+    Column("response", JSON, nullable=False),
+    Column("size_bytes", Integer, nullable=False),
+    Column("created_at", Float, nullable=False),
+    Column("last_used_at", Float, nullable=False, index=True),
+    Column("hits", Integer, nullable=False, default=0),
+)
+
+
+def _normalize(value):
+    """Drop None-valued keys, so a message that went through model_dump() matches one that didn't."""
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def cache_key(model: str, messages: list, tools: Optional[list], params: dict) -> str:
+    payload = _normalize({"model": model, "messages": messages, "tools": tools, "params": params})
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def _retrieve(task: asyncio.Task) -> None:
+    # Callers re-raise a failure; retrieve it here too so one nobody waited for doesn't warn
+    if not task.cancelled():
+        task.exception()
+
+
+class CompletionCache:
+    def __init__(self, settings: Settings):
+        """
+        Content-addressed cache of chat completions, keyed on the normalized
+        (model, messages, tools, params).
+
+        Entries expire after ``llm_cache_ttl`` seconds and the least recently
+        used ones are evicted beyond ``llm_cache_max_entries`` /
+        ``llm_cache_max_bytes``. Concurrent misses for the same key within a
+        process share one upstream call (single-flight); across workers the
+        SQLite file is the shared layer.
+        """
+        self.settings = settings
+        self._engine: Optional[AsyncEngine] = None
+        self._init_lock = asyncio.Lock()
+        # key -> [task computing it, callers waiting for it]
+        self._inflight: dict = {}
+        self._stores_since_evict = 0
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "expired": 0, "evictions": 0}
+
+    async def _get_engine(self) -> AsyncEngine:
+        if self._engine is None:
+            async with self._init_lock:
+                if self._engine is None:
+                    engine = create_async_engine(f"sqlite+aiosqlite:///{self.settings.llm_cache_path}")
+                    async with engine.begin() as conn:
+                        await conn.run_sync(metadata.create_all)
+                    self._engine = engine
+        return self._engine
+
+    async def get(self, key: str) -> Optional[dict]:
+        engine = await self._get_engine()
+        now = time.time()
+        async with engine.begin() as conn:
+            row = (
+                await conn.execute(
+                    select(completion_cache.c.response, completion_cache.c.created_at)
+                    .where(completion_cache.c.key == key)
+                )
+            ).first()
+            if row is None:
+                return None
+            if now - row.created_at > self.settings.llm_cache_ttl:
+                await conn.execute(delete(completion_cache).where(completion_cache.c.key == key))
+                self.stats["expired"] += 1
+                return None
+            await conn.execute(
+                update(completion_cache)
+                .where(completion_cache.c.key == key)
+                .values(last_used_at=now, hits=completion_cache.c.hits + 1)
+            )
+        return row.response
+
+    async def put(self, key: str, model: str, response: dict) -> None:
+        engine = await self._get_engine()
+        now = time.time()
+        size = len(json.dumps(response))
+        async with engine.begin() as conn:
+            statement = insert(completion_cache).values(
+                key=key, model=model, response=response, size_bytes=size,
+                created_at=now, last_used_at=now, hits=0,
+            )
+            await conn.execute(
+                statement.on_conflict_do_update(
+                    index_elements=["key"],
+                    set_={"response": statement.excluded.response, "size_bytes": size,
+                          "created_at": now, "last_used_at": now},
+                )
+            )
+
+        # Checking the totals costs a scan, so only do it every so often
+        self._stores_since_evict += 1
+        if self._stores_since_evict >= self.settings.llm_cache_evict_every:
+            self._stores_since_evict = 0
+            await self.evict()
+
+    async def evict(self) -> int:
+        """Drop expired entries, then least recently used ones until within the size limits."""
+        engine = await self._get_engine()
+        evicted = 0
+        async with engine.begin() as conn:
+            result = await conn.execute(
+                delete(completion_cache)
+                .where(completion_cache.c.created_at < time.time() - self.settings.llm_cache_ttl)
+            )
+            evicted += result.rowcount
+
+            count, total = (
+                await conn.execute(
+                    select(func.count(), func.coalesce(func.sum(completion_cache.c.size_bytes), 0))
+                )
+            ).one()
+            excess_count = count - self.settings.llm_cache_max_entries
+            excess_bytes = total - self.settings.llm_cache_max_bytes
+            if excess_count > 0 or excess_bytes > 0:
+                # Walk from the least recently used until both limits hold
+                doomed, freed = [], 0
+                rows = await conn.stream(
+                    select(completion_cache.c.key, completion_cache.c.size_bytes)
+                    .order_by(completion_cache.c.last_used_at)
+                )
+                async for key, size in rows:
+                    if len(doomed) >= excess_count and freed >= excess_bytes:
+                        break
+                    doomed.append(key)
+                    freed += size
+                await rows.close()
+                await conn.execute(delete(completion_cache).where(completion_cache.c.key.in_(doomed)))
+                evicted += len(doomed)
+
+        self.stats["evictions"] += evicted
+        return evicted
+
+    async def get_or_compute(
+        self, key: str, model: str, compute: Callable[[], Awaitable[dict]]
+    ) -> dict:
+        cached = await self.get(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["misses"] += 1
+            # A task of its own, so a caller that goes away (e.g. its client
+            # disconnected) doesn't take the other callers' response with it
+            inflight = self._inflight[key] = [asyncio.create_task(self._compute(key, model, compute)), 0]
+            inflight[0].add_done_callback(_retrieve)
+        task = inflight[0]
+        inflight[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # The last caller waiting gives up: nobody needs the response
+            if inflight[1] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            inflight[1] -= 1
+
+    async def _compute(self, key: str, model: str, compute: Callable[[], Awaitable[dict]]) -> dict:
+        try:
+            response = await compute()
+            await self.put(key, model, response)
+            return response
+        finally:
+            self._inflight.pop(key, None)
+
+    async def info(self) -> dict:
+        engine = await self._get_engine()
+        async with engine.connect() as conn:
+            entries, size = (
+                await conn.execute(
+                    select(func.count(), func.coalesce(func.sum(completion_cache.c.size_bytes), 0))
+                )
+            ).one()
+        return {**self.stats, "inflight": len(self._inflight), "entries": entries, "size_bytes": size}
+
+    async def aclose(self) -> None:
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
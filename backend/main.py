@@ -1,17 +1,57 @@
-from typing import Any, AsyncGenerator, Optional
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Literal, Optional, Union
+import base64
+import csv
+import hashlib
+import io
 import json
 import models  # Needed for filtering
-from fastapi import Depends, FastAPI, HTTPException
+from fastapi import Body, Depends, FastAPI, Header, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from openai import OpenAI
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
+import orjson
+from pydantic import BaseModel, ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy import select # Needed for the get_forms query
 
+from archive import chat_archive
+import audit
+from chat_locks import chat_turns
+from config import settings
 import crud
+import form_counts
 from database import SessionLocal
+from feed import change_feed
+import jobs
+import metrics
+from read_cache import not_modified, read_cache
 import schemas
+import tools
+from llm import llm
+from context import ChatContext, build_context
+from turns import run_turn, stream_turn
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    audit.audit_log.start()
+    await change_feed.start()
+    if settings.jobs_in_process:
+        jobs.job_queue.start()
+    yield
+    await jobs.job_queue.stop()
+    await change_feed.stop()
+    await audit.audit_log.stop()
+    await chat_archive.aclose()
+    await llm.aclose()
+
+
+# Responses built from response_model data are rendered with orjson; the
+# chat and form endpoints build their JSON bytes themselves (see chat_json)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,14 +60,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-# PASTE YOUR KEY HERE
-openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY", ""))
-SYSTEM_TEMPLATE = """"""
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Get a DB Session
 async def get_db() -> AsyncGenerator:
@@ -39,158 +72,658 @@ async def get_db() -> AsyncGenerator:
 async def root():
     return {"message": "Hello World"}
 
+# Hit/miss/coalesced/eviction counters of the completion cache (since this
+# worker started) plus the current size of the shared cache file
+@app.get("/llm/cache")
+async def llm_cache_info():
+    return await llm.cache.info()
+
+# Chats moved to the archive and restored, hot and cold load times (since
+# this worker started) plus the size of the archive and what it saves
+@app.get("/archive")
+async def archive_info():
+    return await chat_archive.info()
+
+# Archive the chats idle past ARCHIVE_AFTER, as a background job; also run
+# by `python archive.py`
+@app.post("/archive/compact", status_code=202)
+async def compact_archive(db: AsyncSession = Depends(get_db)):
+    # A request made while a pass is still pending is dropped
+    await jobs.enqueue(db, "archive_idle_chats", {}, dedupe_key="archive_idle_chats")
+    await db.commit()
+    return {"message": "Queued"}
+
+# Request latency, stage spans, DB statement and LLM token counts of this
+# worker, plus the job queue's depth, in the Prometheus text format
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(db: AsyncSession = Depends(get_db)):
+    await jobs.update_depth(db)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+STALE_CHAT = "Chat has newer messages, reload it"
+
+def chat_out(chat: models.Chat, messages: list, first_seq: Optional[int]) -> schemas.Chat:
+    """Build the Chat response from the row and a (possibly partial) list of message dicts."""
+    return schemas.Chat(
+        id=chat.id,
+        created_at=chat.created_at,
+        messages=messages,
+        message_count=chat.message_count,
+        first_seq=first_seq if messages else None,
+    )
+
+def chat_json(
+    chat: models.Chat, messages_json: bytes, first_seq: Optional[int], message_count: Optional[int] = None
+) -> Response:
+    """
+    The schemas.Chat response as JSON bytes, with ``messages_json`` (an
+    encoded JSON array) spliced in as is. Returning a Response skips
+    FastAPI's response_model pass, which would validate every message and
+    encode the list again; on long chats that is most of the request.
+    """
+    head = orjson.dumps({"id": chat.id, "created_at": chat.created_at})
+    tail = orjson.dumps({
+        "message_count": chat.message_count if message_count is None else message_count,
+        "first_seq": first_seq if messages_json != b"[]" else None,
+    })
+    return Response(
+        head[:-1] + b',"messages":' + messages_json + b"," + tail[1:], media_type="application/json"
+    )
+
+async def cached_json(
+    request: Request, db: AsyncSession, kind: str, key: str, query: tuple, load: Callable[[], Awaitable[bytes]]
+) -> Response:
+    """
+    The JSON body ``load()`` builds for (kind, key) and ``query``, through
+    the read cache (see read_cache.py), with ETag and Last-Modified headers.
+    A client that already has the current version gets a 304 before
+    anything else is read. ``load`` raises HTTPException for a missing
+    entity; misses aren't cached.
+    """
+    if not settings.read_cache_enabled:
+        return Response(await load(), media_type="application/json")
+
+    version = await read_cache.version(db, kind, key)
+    headers = {"ETag": version.etag(kind, query), "Cache-Control": "no-cache"}
+    if version.updated_at is not None:
+        headers["Last-Modified"] = version.last_modified()
+    if not_modified(request.headers, kind, query, version):
+        metrics.count_cache_lookup(kind, "not_modified")
+        return Response(status_code=304, headers=headers)
+
+    body = read_cache.get(kind, key, query, version)
+    if body is None:
+        body = await load()
+        read_cache.put(kind, key, query, version, body)
+    return Response(body, media_type="application/json", headers=headers)
+
+def stored_messages_json(rows: list) -> bytes:
+    """JSON array of the ``data`` of raw message rows (see crud.chat.get_messages), without parsing them."""
+    return b"[" + b",".join(row.data.encode() for row in rows) + b"]"
+
+def encode_cursor(*values: Any) -> str:
+    """Opaque pagination cursor holding the keyset values of a page's last row."""
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor: str, *types: type) -> tuple:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(values) != len(types):
+            raise ValueError(cursor)
+        return tuple(
+            v if v is None else datetime.fromisoformat(v) if t is datetime else t(v)
+            for t, v in zip(types, values)
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+
 # response_model represents the format of the response that this endpoint will produce. Responses are always in JSON
-@app.get("/chat", response_model=list[schemas.Chat])
-async def get_chats(db: AsyncSession = Depends(get_db)):
-    chats = await crud.chat.get_multi(db, limit=10)
-    return chats
+# Newest chats first, one page at a time: follow next_cursor for older ones
+@app.get("/chat", response_model=schemas.ChatPage)
+async def get_chats(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    before = decode_cursor(cursor, datetime, str) if cursor else None
+    # One row more than asked for tells whether there is a next page
+    rows = await crud.chat.get_summaries(db, before=before, limit=limit + 1)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return schemas.ChatPage(
+        chats=[schemas.ChatSummary.model_validate(r) for r in rows],
+        next_cursor=next_cursor,
+    )
 
 # the data parameter represents the body of the request. The request body should always be in JSON format
 @app.post("/chat", response_model=schemas.Chat)
 async def create_chat(data: schemas.ChatCreate, db: AsyncSession = Depends(get_db)):
     chat = await crud.chat.create(db=db, obj_in=data)
+    return chat_json(chat, orjson.dumps(data.messages), 0)
+
+async def get_turn_chat(db: AsyncSession, chat_id: str, data: schemas.ChatUpdate) -> models.Chat:
+    """
+    Load the chat a turn is for. ``data.messages`` is the client's full history,
+    so everything past the stored message count is new; a shorter list means
+    the client missed messages and its history can't be lined up.
+    """
+    chat = await chat_archive.load_chat(db, chat_id)
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    if len(data.messages) < chat.message_count:
+        raise HTTPException(status_code=409, detail=STALE_CHAT)
     return chat
 
+async def get_delta_turn_chat(db: AsyncSession, chat_id: str, data: schemas.ChatTurn) -> models.Chat:
+    """
+    Load the chat a delta turn is for, rejecting the turn if the client
+    hasn't seen the latest stored message.
+    """
+    chat = await chat_archive.load_chat(db, chat_id)
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    expected_count = 0 if data.last_seq is None else data.last_seq + 1
+    if chat.message_count != expected_count:
+        raise HTTPException(status_code=409, detail=STALE_CHAT)
+    return chat
+
+async def prepare_turn(
+    db: AsyncSession, chat_id: str, data: Union[schemas.ChatUpdate, schemas.ChatTurn]
+) -> tuple[models.Chat, ChatContext, list]:
+    """
+    Everything a turn needs before calling the model: the chat, the context
+    rebuilt from storage (never the client's copy of the history) and the
+    list of new messages the turn will append to.
+
+    The transaction is ended before returning, so a turn doesn't keep a
+    pooled connection through its completions; the chat's version still
+    catches a turn saved meanwhile (see save_turn).
+    """
+    if isinstance(data, schemas.ChatTurn):
+        chat = await get_delta_turn_chat(db, chat_id, data)
+        new_messages = list(data.messages)
+    else:
+        chat = await get_turn_chat(db, chat_id, data)
+        new_messages = data.messages[chat.message_count:]
+    context = await build_context(db, chat)
+    await db.commit()
+    return chat, context, new_messages
+
+async def save_turn(
+    db: AsyncSession,
+    chat: models.Chat,
+    context: ChatContext,
+    new_messages: list,
+    tool_jobs: list,
+    idempotency: Optional[dict] = None,
+) -> None:
+    """
+    Append the turn's messages and queue its tool calls' jobs in one
+    transaction, which fails if another turn was saved first: a rejected
+    turn leaves no side effects behind.
+    """
+    context.apply(chat)
+    await tools.enqueue_tool_jobs(db, chat.id, tool_jobs)
+    if idempotency:
+        await crud.idempotency_key.add(
+            db,
+            chat_id=chat.id,
+            first_seq=chat.message_count,
+            end_seq=chat.message_count + len(new_messages),
+            max_age=settings.idempotency_key_ttl,
+            **idempotency,
+        )
+    try:
+        await crud.chat.append_messages(db, db_obj=chat, messages=new_messages)
+    except StaleDataError:
+        # Another turn was saved while this one waited on the model
+        raise HTTPException(status_code=409, detail=STALE_CHAT)
+
+def request_hash(request: Request, data: BaseModel) -> str:
+    return hashlib.sha256(
+        f"{request.method} {request.url.path} {data.model_dump_json()}".encode()
+    ).hexdigest()
+
+async def replay_turn(
+    db: AsyncSession, chat_id: str, key: str, req_hash: str, full_history: bool
+) -> Optional[Response]:
+    """The response of an earlier turn sent with the same Idempotency-Key, if any."""
+    stored = await crud.idempotency_key.get(
+        db, chat_id=chat_id, key=key, max_age=settings.idempotency_key_ttl
+    )
+    if stored is None:
+        return None
+    if stored.request_hash != req_hash:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was used for a different request")
+
+    chat = await chat_archive.load_chat(db, chat_id)
+    first_seq = 0 if full_history else stored.first_seq
+    messages = await crud.chat.get_messages(
+        db, chat_id=chat_id, since_seq=first_seq, before_seq=stored.end_seq, raw=True
+    )
+    return chat_json(chat, stored_messages_json(messages), first_seq, message_count=stored.end_seq)
+
+async def run_chat_turn(
+    request: Request,
+    db: AsyncSession,
+    chat_id: str,
+    data: Union[schemas.ChatUpdate, schemas.ChatTurn],
+    idempotency_key: Optional[str],
+) -> Response:
+    """
+    Shared body of PUT /chat/{chat_id} and POST /chat/{chat_id}/messages.
+
+    Turns on one chat are serialized, so a retry that overlaps the original
+    waits for it and then replays its stored result instead of calling the
+    model (and running tool calls) a second time.
+    """
+    full_history = isinstance(data, schemas.ChatUpdate)
+    req_hash = request_hash(request, data)
+    async with chat_turns.hold(chat_id):
+        if idempotency_key:
+            replayed = await replay_turn(db, chat_id, idempotency_key, req_hash, full_history)
+            if replayed is not None:
+                replayed.headers["Idempotent-Replayed"] = "true"
+                return replayed
+
+        with metrics.span("turn.prepare"):
+            chat, context, new_messages = await prepare_turn(db, chat_id, data)
+        stored_count = chat.message_count
+
+        tool_jobs = []
+        await run_turn(chat_id, context.history, new_messages, tool_jobs)
+
+        # Only the new rows are written, never the whole history
+        with metrics.span("turn.save"):
+            await save_turn(
+                db, chat, context, new_messages, tool_jobs,
+                {"key": idempotency_key, "request_hash": req_hash} if idempotency_key else None,
+            )
+
+        if full_history:
+            # The stored history, not the client's copy of it, which may
+            # have diverged: the response matches GET /chat/{chat_id}
+            end_seq = stored_count + len(new_messages)
+            messages = await crud.chat.get_messages(db, chat_id=chat_id, before_seq=end_seq, raw=True)
+            return chat_json(chat, stored_messages_json(messages), 0, message_count=end_seq)
+    return chat_json(chat, orjson.dumps(new_messages), stored_count)
+
 # the chat_id parameter maps to the chat id in the URL
 @app.put("/chat/{chat_id}", response_model=schemas.Chat)
 async def update_chat(
-    chat_id: str, data: schemas.ChatUpdate, db: AsyncSession = Depends(get_db)
+    chat_id: str,
+    data: schemas.ChatUpdate,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    db: AsyncSession = Depends(get_db),
 ):
-    chat = await crud.chat.get(db, id=chat_id)
-    
-    # Defined tools list to be used in both calls
-    tools_list = [
-        {
-            "type": "function",
-            "function": {
-                "name": "submit_interest_form",
-                "description": "Submit an interest form for the user",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "name": {"type": "string", "description": "the user's name"},
-                        "email": {"type": "string", "description": "the user's email"},
-                        "phone_number": {"type": "string", "description": "the user's phone"},
-                    },
-                    "required": ["name", "email", "phone_number"]
-                },
-            },
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "update_interest_form",
-                "description": "Update an existing interest form",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "form_id": {"type": "string"},
-                        "name": {"type": "string"},
-                        "email": {"type": "string"},
-                        "phone_number": {"type": "string"},
-                        "status": {"type": "integer", "enum": [1, 2, 3]}
-                    },
-                    "required": ["form_id"]
-                }
-            }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "delete_interest_form",
-                "description": "Delete an interest form",
-                "parameters": {
-                    "type": "object",
-                    "properties": {"form_id": {"type": "string"}},
-                    "required": ["form_id"]
-                }
+    return await run_chat_turn(request, db, chat_id, data, idempotency_key)
+
+# Delta variant of PUT /chat/{chat_id}: the body carries only the new
+# message(s) and the last seq the client has seen; the response carries only
+# the messages added by this turn (first_seq tells where they start).
+@app.post("/chat/{chat_id}/messages", response_model=schemas.Chat)
+async def add_chat_messages(
+    chat_id: str,
+    data: schemas.ChatTurn,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    db: AsyncSession = Depends(get_db),
+):
+    return await run_chat_turn(request, db, chat_id, data, idempotency_key)
+
+
+async def stream_chat_events(
+    chat_id: str, data: Union[schemas.ChatUpdate, schemas.ChatTurn]
+) -> AsyncIterator[dict]:
+    """
+    Run a streamed turn and persist the new messages once it finishes. The
+    turn holds the chat's turn lock from start to end, like the JSON
+    endpoints.
+
+    The request-scoped session may already be closed while a streaming
+    response is being sent, so this uses sessions of its own.
+    """
+    async with chat_turns.hold(chat_id):
+        async with SessionLocal() as db:
+            try:
+                with metrics.span("turn.prepare"):
+                    chat, context, new_messages = await prepare_turn(db, chat_id, data)
+            except HTTPException as e:
+                yield {"type": "error", "detail": e.detail}
+                return
+        stored_count = chat.message_count
+
+        tool_jobs = []
+        try:
+            async for event in stream_turn(chat_id, context.history, new_messages, tool_jobs):
+                yield event
+        except Exception as e:
+            yield {"type": "error", "detail": str(e)}
+            return
+
+        async with SessionLocal() as db:
+            chat = await crud.chat.get(db, id=chat_id)
+            # Deleted while the turn was streaming
+            if chat is None:
+                yield {"type": "error", "detail": "Chat not found"}
+                return
+            if chat.message_count != stored_count:
+                yield {"type": "error", "detail": STALE_CHAT}
+                return
+            try:
+                with metrics.span("turn.save"):
+                    await save_turn(db, chat, context, new_messages, tool_jobs)
+            except HTTPException as e:
+                yield {"type": "error", "detail": e.detail}
+                return
+            # The client already has every message from the message events
+            yield {
+                "type": "done",
+                "chat": jsonable_encoder(chat_out(chat, new_messages, stored_count)),
             }
-        }
-    ]
 
-    resp = openai_client.chat.completions.create(
-        messages=[{"role": "system", "content": SYSTEM_TEMPLATE}] + data.messages,
-        model="gpt-4o-mini",
-        tools=tools_list,
+
+def sse_response(events: AsyncIterator[dict]) -> StreamingResponse:
+    async def sse():
+        async for event in events:
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        sse(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    resp_message = resp.choices[0].message.model_dump()
 
-    data.messages.append(resp_message)
 
-    if resp_message.get('tool_calls'):
-        for t in resp_message["tool_calls"]:
-            fname = t["function"]["name"]
-            args = json.loads(t["function"]["arguments"])
-            result_content = "Success"
+# Server-Sent Events variant of PUT /chat/{chat_id}: same body, but tokens and
+# tool-call progress are pushed as they happen. POST because EventSource can't
+# send a body; clients read the stream with fetch().
+@app.post("/chat/{chat_id}/stream")
+async def stream_chat(
+    chat_id: str, data: schemas.ChatUpdate, db: AsyncSession = Depends(get_db)
+):
+    # Checked here as well so these fail with a status code, not an error event
+    await get_turn_chat(db, chat_id, data)
+    return sse_response(stream_chat_events(chat_id, data))
+
+# Server-Sent Events variant of POST /chat/{chat_id}/messages
+@app.post("/chat/{chat_id}/messages/stream")
+async def stream_chat_messages(
+    chat_id: str, data: schemas.ChatTurn, db: AsyncSession = Depends(get_db)
+):
+    await get_delta_turn_chat(db, chat_id, data)
+    return sse_response(stream_chat_events(chat_id, data))
+
+
+# WebSocket variant: each message received is a ChatTurn body (new messages
+# plus last_seq), and the events of that turn are sent back as JSON messages.
+# The socket stays open across turns.
+@app.websocket("/chat/{chat_id}/ws")
+async def chat_websocket(websocket: WebSocket, chat_id: str):
+    async with SessionLocal() as db:
+        chat = await crud.chat.get(db, id=chat_id)
+    if not chat:
+        await websocket.close(code=4404, reason="Chat not found")
+        return
 
-            # Execute the DB logic based on the tool name
+    await websocket.accept()
+    try:
+        while True:
             try:
-                if fname == "submit_interest_form":
-                    form_in = schemas.FormSubmissionCreate(
-                        name=args["name"],
-                        email=args["email"],
-                        phone_number=args["phone_number"],
-                        chat_id=chat_id
-                    )
-                    await crud.form.create(db=db, obj_in=form_in)
-                
-                elif fname == "update_interest_form":
-                    fid = args.pop("form_id")
-                    f_obj = await crud.form.get(db, id=fid)
-                    if f_obj:
-                        await crud.form.update(db, db_obj=f_obj, obj_in=args)
-                    else:
-                        result_content = "Form not found"
-
-                elif fname == "delete_interest_form":
-                    fid = args["form_id"]
-                    f_obj = await crud.form.get(db, id=fid)
-                    if f_obj:
-                        await crud.form.remove(db, id=fid)
-                    else:
-                        result_content = "Form not found"
-            except Exception as e:
-                result_content = f"Error: {str(e)}"
-
-            data.messages.append(
-                {
-                    "tool_call_id": t["id"],
-                    "role": "tool",
-                    "name": fname,
-                    "content": result_content,
-                }
-            )
+                data = schemas.ChatTurn.model_validate(await websocket.receive_json())
+            except ValidationError as e:
+                await websocket.send_json({"type": "error", "detail": e.errors(include_url=False)})
+                continue
+            async for event in stream_chat_events(chat_id, data):
+                await websocket.send_json(event)
+    except WebSocketDisconnect:
+        pass
 
-        resp = openai_client.chat.completions.create(
-            messages=[{"role": "system", "content": SYSTEM_TEMPLATE}] + data.messages,
-            model="gpt-4o-mini",
-            tools=tools_list,
-        )
-        resp_message = resp.choices[0].message.model_dump()
 
-        data.messages.append(resp_message)
+# Change feed: each committed change to a chat or form is pushed as an event
+# of its audit seq, entity, action and changed fields ({field: {old, new}}).
+# A client that reconnects with Last-Event-ID (EventSource sends it) or
+# ?after=<seq> gets what it missed, or a reset event telling it to refetch.
+def feed_sse(events: AsyncIterator[dict]) -> StreamingResponse:
+    async def sse():
+        async for event in events:
+            if event["type"] == "heartbeat":
+                yield ": heartbeat\n\n"
+            else:
+                yield f"id: {event['seq']}\nevent: {event['type']}\ndata: {orjson.dumps(event).decode()}\n\n"
 
-    chat = await crud.chat.update(db, db_obj=chat, obj_in=data)
+    return StreamingResponse(
+        sse(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def resume_after(after: Optional[int], last_event_id: Optional[str]) -> Optional[int]:
+    if after is not None:
+        return after
+    if last_event_id is not None and last_event_id.isdigit():
+        return int(last_event_id)
+    return None
+
+
+@app.get("/chat/{chat_id}/changes")
+async def chat_changes(
+    chat_id: str,
+    after: Optional[int] = None,
+    last_event_id: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+):
+    if not await crud.chat.get(db, id=chat_id):
+        raise HTTPException(status_code=404, detail="Chat not found")
+    return feed_sse(change_feed.events(chat_id, resume_after(after, last_event_id)))
+
+
+# Every chat's changes, for dashboards
+@app.get("/changes")
+async def all_changes(after: Optional[int] = None, last_event_id: Optional[str] = Header(None)):
+    return feed_sse(change_feed.events(None, resume_after(after, last_event_id)))
 
-    return chat
 
+# WebSocket variant of both: ?chat_id=<id> for one chat, without for all
+@app.websocket("/changes/ws")
+async def changes_websocket(websocket: WebSocket, chat_id: Optional[str] = None, after: Optional[int] = None):
+    await websocket.accept()
+    try:
+        async for event in change_feed.events(chat_id, after):
+            await websocket.send_json(event)
+    except WebSocketDisconnect:
+        pass
 
+
+# Without limit the whole history is returned. With limit, only the latest
+# `limit` messages before `before_seq` are returned, so a client can page back
+# through a long chat with ?limit=50&before_seq=<first_seq of the last page>.
+# Cached per chat; send If-None-Match with the ETag to get a 304 when unchanged.
 @app.get("/chat/{chat_id}", response_model=schemas.Chat)
-async def get_chat(chat_id: str, db: AsyncSession = Depends(get_db)):
-    chat = await crud.chat.get(db, id=chat_id)
-    return chat
+async def get_chat(
+    chat_id: str,
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    before_seq: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    async def load() -> bytes:
+        chat = await chat_archive.load_chat(db, chat_id)
+        if not chat:
+            raise HTTPException(status_code=404, detail="Chat not found")
+        messages = await crud.chat.get_messages(
+            db, chat_id=chat_id, before_seq=before_seq, limit=limit, raw=True
+        )
+        return chat_json(chat, stored_messages_json(messages), messages[0].seq if messages else None).body
+
+    return await cached_json(request, db, "chat", chat_id, (limit, before_seq), load)
 
 
 # --- New Endpoints for Task 2 ---
 
+# Field order of schemas.FormSubmission
+FORM_COLUMNS = ["id", "created_at", "chat_id", "name", "phone_number", "email", "status"]
+
 @app.get("/chat/{chat_id}/forms", response_model=list[schemas.FormSubmission])
-async def get_forms(chat_id: str, status: Optional[int] = None, db: AsyncSession = Depends(get_db)):
-    # Using direct select to ensure filtering works regardless of CRUD implementation
-    query = select(models.FormSubmission).where(models.FormSubmission.chat_id == chat_id)
+async def get_forms(
+    chat_id: str, request: Request, status: Optional[int] = None, db: AsyncSession = Depends(get_db)
+):
+    async def load() -> bytes:
+        # Plain rows encoded with orjson, like the export: no ORM objects or
+        # response_model validation per form
+        query = select(*(getattr(models.FormSubmission, c) for c in FORM_COLUMNS)).where(
+            models.FormSubmission.chat_id == chat_id
+        )
+        if status is not None:
+            query = query.where(models.FormSubmission.status == status)
+        result = await db.execute(query)
+        return orjson.dumps([dict(zip(FORM_COLUMNS, row)) for row in result])
+
+    return await cached_json(request, db, "forms", chat_id, (status,), load)
+
+# Totals by status, read from counters kept by triggers, so they cost the
+# same whatever the number of forms. With by_day, the same per created_at
+# day (UTC), optionally between since and until.
+@app.get("/chat/{chat_id}/forms/counts", response_model=schemas.FormCounts)
+async def get_chat_form_counts(
+    chat_id: str,
+    by_day: bool = False,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    return await form_counts.get_counts(db, chat_id, by_day=by_day, since=since, until=until)
+
+def check_form_status(status: Optional[int]) -> None:
+    # Validate Status Enum (1=Todo, 2=In Progress, 3=Completed)
+    if status is not None and status not in [1, 2, 3]:
+        raise HTTPException(status_code=400, detail="Status must be 1, 2, or 3")
+
+def form_filters(where: schemas.FormSubmissionFilter) -> list:
+    filters = []
+    if where.chat_id is not None:
+        filters.append(models.FormSubmission.chat_id == where.chat_id)
+    if where.status is not None:
+        filters.append(models.FormSubmission.status == where.status)
+    return filters
+
+async def export_forms_rows(filters: list, format: str) -> AsyncIterator[bytes]:
+    """
+    Encode matching forms straight from DB rows to bytes, one chunk per
+    cursor batch. No ORM objects or Pydantic models are built per row.
+    """
+    columns = [getattr(models.FormSubmission, c) for c in FORM_COLUMNS]
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(FORM_COLUMNS)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    # The request-scoped session is closed before the response body is sent
+    async with SessionLocal() as db:
+        async for rows in crud.form.stream_multi(
+            db,
+            columns=columns,
+            filters=filters,
+            order_by=[models.FormSubmission.created_at, models.FormSubmission.id],
+        ):
+            if format == "csv":
+                writer.writerows(
+                    (r.id, r.created_at.isoformat() if r.created_at else None, *r[2:]) for r in rows
+                )
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+            else:
+                yield b"".join(orjson.dumps(dict(zip(FORM_COLUMNS, r))) + b"\n" for r in rows)
+
+@app.get("/form-submission/export")
+async def export_forms(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    status: Optional[int] = None,
+    chat_id: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+):
+    """All forms matching the filters, oldest first, streamed as NDJSON or CSV."""
+    filters = []
     if status is not None:
-        query = query.where(models.FormSubmission.status == status)
-    result = await db.execute(query)
-    return result.scalars().all()
+        filters.append(models.FormSubmission.status == status)
+    if chat_id is not None:
+        filters.append(models.FormSubmission.chat_id == chat_id)
+    if created_after is not None:
+        filters.append(models.FormSubmission.created_at >= created_after)
+    if created_before is not None:
+        filters.append(models.FormSubmission.created_at < created_before)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_forms_rows(filters, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="forms.{format}"'},
+    )
+
+# Same as GET /chat/{chat_id}/forms/counts, over every chat
+@app.get("/form-submission/counts", response_model=schemas.FormCounts)
+async def get_form_counts(
+    by_day: bool = False,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    return await form_counts.get_counts(db, by_day=by_day, since=since, until=until)
+
+# Recount every counter from the forms themselves, as a background job
+@app.post("/form-submission/counts/rebuild", status_code=202)
+async def rebuild_form_counts(db: AsyncSession = Depends(get_db)):
+    await jobs.enqueue(db, "rebuild_form_counts", {})
+    await db.commit()
+    return {"message": "Queued"}
+
+# Best matches first (newest first for very broad searches); follow
+# next_cursor for more
+@app.get("/form-submission/search", response_model=schemas.FormSubmissionPage)
+async def search_forms(
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    after = decode_cursor(cursor, float, int) if cursor else None
+    rows = await crud.form.search(db, query=q, after=after, limit=limit + 1)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].rank, rows[-1].rowid)
+    return schemas.FormSubmissionPage(forms=[r[0] for r in rows], next_cursor=next_cursor)
+
+# Every change to a form, newest first, each with the form as it was right
+# after it; follow next_cursor for older changes. Works for deleted forms too.
+@app.get("/form-submission/{form_id}/history", response_model=schemas.AuditPage)
+async def get_form_history(
+    form_id: str,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    before = decode_cursor(cursor, int)[0] if cursor else None
+    form_obj = await crud.form.get(db, id=form_id)
+    entries = await audit.history(
+        db, "form_submission", form_id, before=before, limit=limit + 1,
+        since=form_obj.created_at if form_obj else None,
+    )
+    if not entries and form_obj is None:
+        raise HTTPException(status_code=404, detail="Form not found")
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = encode_cursor(entries[-1]["seq"])
+    return schemas.AuditPage(entries=entries, next_cursor=next_cursor)
 
 @app.put("/form-submission/{form_id}", response_model=schemas.FormSubmission)
 async def update_form(form_id: str, data: schemas.FormSubmissionUpdate, db: AsyncSession = Depends(get_db)):
@@ -198,12 +731,34 @@ async def update_form(form_id: str, data: schemas.FormSubmissionUpdate, db: Asyn
     if not form_obj:
         raise HTTPException(status_code=404, detail="Form not found")
     
-    # Validate Status Enum (1=Todo, 2=In Progress, 3=Completed)
-    if data.status is not None and data.status not in [1, 2, 3]:
-        raise HTTPException(status_code=400, detail="Status must be 1, 2, or 3")
+    check_form_status(data.status)
 
     return await crud.form.update(db, db_obj=form_obj, obj_in=data)
 
+# Bulk variants: each one is a single statement in a single transaction,
+# e.g. mark every form of a chat as completed in one call
+
+@app.post("/form-submission/bulk-create", response_model=list[schemas.FormSubmission])
+async def create_forms(
+    data: list[schemas.FormSubmissionCreate] = Body(max_length=schemas.BULK_LIMIT),
+    db: AsyncSession = Depends(get_db),
+):
+    for form_in in data:
+        check_form_status(form_in.status)
+    return await crud.form.create_many(db, objs_in=data)
+
+@app.post("/form-submission/bulk-update", response_model=list[schemas.FormSubmission])
+async def update_forms(data: schemas.FormSubmissionBulkUpdate, db: AsyncSession = Depends(get_db)):
+    check_form_status(data.values.status)
+    return await crud.form.update_many(
+        db, obj_in=data.values, ids=data.where.ids, filters=form_filters(data.where)
+    )
+
+@app.post("/form-submission/bulk-delete")
+async def delete_forms(data: schemas.FormSubmissionFilter, db: AsyncSession = Depends(get_db)):
+    deleted = await crud.form.remove_many(db, ids=data.ids, filters=form_filters(data))
+    return {"message": "Deleted", "ids": [f.id for f in deleted]}
+
 @app.delete("/form-submission/{form_id}")
 async def delete_form(form_id: str, db: AsyncSession = Depends(get_db)):
     form_obj = await crud.form.get(db, id=form_id)
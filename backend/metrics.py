@@ -0,0 +1,280 @@
+import bisect
+import contextlib
+import json
+import random
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import settings
+
+# In-process request metrics, rendered in the Prometheus text format at
+# /metrics. Each worker process keeps its own counts, like any Prometheus
+# client without multiprocess mode; scrape every worker.
+#
+# With METRICS_ENABLED=false, span() hands out a shared no-op context
+# manager and the middleware passes requests straight through, so the only
+# cost left is a settings lookup per span.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+TOKEN_BUCKETS = (100, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[tuple, float] = {}
+        REGISTRY.append(self)
+
+    def inc(self, amount: float, *label_values: str) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, total in self._values.items():
+            lines.append(f"{self.name}{_labels(self.labels, values)} {total}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        """
+        Fixed-bucket histogram. Observing is a bisect and two additions; the
+        cumulative counts Prometheus wants are only computed when rendering.
+        """
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> per-bucket counts (the last one is +Inf), then the sum
+        self._series: Dict[tuple, list] = {}
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {series[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[tuple, float] = {}
+        REGISTRY.append(self)
+
+    def set(self, value: float, *label_values: str) -> None:
+        self._values[label_values] = value
+
+    def inc(self, amount: float, *label_values: str) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for values, value in self._values.items():
+            lines.append(f"{self.name}{_labels(self.labels, values)} {value}")
+        return lines
+
+
+REGISTRY: list = []
+
+request_seconds = Histogram(
+    "app_request_duration_seconds", "Time to handle a request, body included.", ["method", "route", "status"]
+)
+request_queries = Histogram(
+    "app_request_db_queries", "Database statements executed per request.", ["method", "route"], QUERY_BUCKETS
+)
+request_tokens = Histogram(
+    "app_request_llm_tokens", "LLM tokens used per request, for requests that called the model.",
+    ["route", "kind"], TOKEN_BUCKETS,
+)
+span_seconds = Histogram("app_span_duration_seconds", "Time spent in each instrumented stage.", ["span"])
+llm_tokens = Counter("app_llm_tokens_total", "LLM tokens reported by upstream completions.", ["kind"])
+jobs = Gauge("app_jobs", "Jobs in the queue by status, as of the last scrape.", ["status"])
+job_seconds = Histogram("app_job_duration_seconds", "Time to run a job attempt.", ["kind", "outcome"])
+job_latency_seconds = Histogram(
+    "app_job_latency_seconds", "Time from enqueueing a job to its successful end, retries included.", ["kind"]
+)
+feed_subscribers = Gauge("app_feed_subscribers", "Open change feed subscriptions, per chat or to all chats.", ["scope"])
+feed_resets = Counter("app_feed_resets_total", "Change feed subscribers told to refetch after missing events.")
+chat_load_seconds = Histogram(
+    "app_chat_load_seconds", "Time to load a chat for a request; cold includes restoring it from the archive.",
+    ["tier"],
+)
+cache_lookups = Counter(
+    "app_read_cache_lookups_total", "Read cache lookups by kind and outcome (hit, miss, not_modified).",
+    ["kind", "outcome"],
+)
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+class RequestProfile:
+    __slots__ = ("start", "queries", "prompt_tokens", "completion_tokens", "spans")
+
+    def __init__(self, sampled: bool):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        # (name, start offset, duration), only kept for sampled requests
+        self.spans: Optional[list] = [] if sampled else None
+
+
+# The profile of the request being handled. Tasks and SQLAlchemy's greenlets
+# started while handling it see the same object.
+current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        span_seconds.observe(end - self.start, self.name)
+        profile = current.get()
+        if profile is not None and profile.spans is not None:
+            profile.spans.append((self.name, self.start - profile.start, end - self.start))
+
+
+_NO_SPAN = contextlib.nullcontext()
+
+
+def span(name: str):
+    """Context manager timing a stage of request handling as ``name``."""
+    return _Span(name) if settings.metrics_enabled else _NO_SPAN
+
+
+def record_tokens(prompt_tokens: int, completion_tokens: int) -> None:
+    if not settings.metrics_enabled:
+        return
+    llm_tokens.inc(prompt_tokens, "prompt")
+    llm_tokens.inc(completion_tokens, "completion")
+    profile = current.get()
+    if profile is not None:
+        profile.prompt_tokens += prompt_tokens
+        profile.completion_tokens += completion_tokens
+
+
+def count_cache_lookup(kind: str, outcome: str) -> None:
+    if settings.metrics_enabled:
+        cache_lookups.inc(1, kind, outcome)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    profile = current.get()
+    if profile is not None:
+        profile.queries += 1
+
+
+def count_queries(engine: Engine) -> None:
+    """
+    Count ``engine``'s statements in the current request's queries. Called
+    for the app database's engines only (see database.create_engines), so
+    the completion cache and archive files aren't counted.
+    """
+    event.listen(engine, "before_cursor_execute", _count_query)
+
+
+def write_profile(breakdown: dict) -> None:
+    with open(settings.metrics_profile_path, "a") as f:
+        f.write(json.dumps(breakdown) + "\n")
+
+
+# Called with the breakdown of every sampled request; replace it to send
+# profiles somewhere else
+profile_hook: Callable[[dict], None] = write_profile
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        """
+        Times every HTTP request, labelled by route template (not the raw
+        path, which would make a series per chat), and counts its database
+        statements and LLM tokens. A METRICS_PROFILE_SAMPLE_RATE fraction of
+        requests also record every span and are passed to ``profile_hook``.
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.metrics_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(sampled=random.random() < settings.metrics_profile_sample_rate)
+        token = current.set(profile)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current.reset(token)
+            elapsed = time.perf_counter() - profile.start
+            route = getattr(scope.get("route"), "path", "unmatched")
+            request_seconds.observe(elapsed, scope["method"], route, str(status))
+            request_queries.observe(profile.queries, scope["method"], route)
+            if profile.prompt_tokens or profile.completion_tokens:
+                request_tokens.observe(profile.prompt_tokens, route, "prompt")
+                request_tokens.observe(profile.completion_tokens, route, "completion")
+            if profile.spans is not None:
+                profile_hook({
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route,
+                    "status": status,
+                    "duration_ms": round(elapsed * 1000, 3),
+                    "db_queries": profile.queries,
+                    "prompt_tokens": profile.prompt_tokens,
+                    "completion_tokens": profile.completion_tokens,
+                    "spans": [
+                        {"name": name, "start_ms": round(start * 1000, 3), "duration_ms": round(duration * 1000, 3)}
+                        for name, start, duration in profile.spans
+                    ],
+                })
@@ -1,6 +1,6 @@
 import uuid
 
-from sqlalchemy import JSON, UUID, Column, DateTime, ForeignKey, String, Integer
+from sqlalchemy import DDL, JSON, UUID, Column, DateTime, ForeignKey, Index, String, Integer, Text, event, text
 from sqlalchemy.orm import relationship
 import secrets
 
@@ -11,12 +11,50 @@ class Chat(Base):
     __tablename__ = "chat"
 
     id = Column(String(length=32), primary_key=True, index=True, default=secrets.token_urlsafe)
-    created_at = Column(DateTime, index=True)
-    messages = Column(JSON)
+    created_at = Column(DateTime)
+    # Number of rows in chat_message, i.e. the seq the next message will get.
+    # Also the chat's version: every UPDATE of the row checks it is unchanged
+    # since the row was loaded (StaleDataError otherwise), so two turns can't
+    # both append on top of the same history.
+    message_count = Column(Integer, nullable=False, default=0)
+    # Rolling summary of messages with seq < summary_seq, used in place of
+    # them once they no longer fit the context budget (see context.py)
+    summary = Column(Text)
+    summary_seq = Column(Integer, nullable=False, default=0)
+    # Start of the latest message with text content, kept up to date on every
+    # append so listing chats never has to read chat_message
+    last_message_preview = Column(String)
+    # Last turn, or last time the chat was brought back from the archive
+    active_at = Column(DateTime)
+    # Set while the chat's messages are in the archive instead of chat_message:
+    # chats idle for ARCHIVE_AFTER are moved there (see archive.py)
+    archived_at = Column(DateTime)
     form_submissions = relationship(
         "FormSubmission", cascade="all, delete", back_populates="chat"
     )
 
+    # (created_at, id) is the keyset GET /chat pages through, newest first
+    __table_args__ = (
+        Index("ix_chat_created_at", "created_at", "id"),
+        # Hot chats in the order they go idle, for the archiver
+        Index("ix_chat_active_at", "active_at", sqlite_where=text("archived_at IS NULL")),
+    )
+    __mapper_args__ = {"version_id_col": message_count, "version_id_generator": False}
+
+class ChatMessage(Base):
+    __tablename__ = "chat_message"
+
+    # Messages are append-only: a turn inserts its new rows and never rewrites
+    # older ones. (chat_id, seq) doubles as the keyset for pagination.
+    chat_id = Column(String(length=32), ForeignKey("chat.id"), primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    created_at = Column(DateTime)
+    role = Column(String)
+    # The OpenAI-format message dict, exactly as sent to / received from the API
+    data = Column(JSON, nullable=False)
+    # Prompt tokens of `data`, counted once on insert (rows never change)
+    token_count = Column(Integer)
+
 class FormSubmission(Base):
     __tablename__ = "form_submission"
 
@@ -31,3 +69,202 @@ class FormSubmission(Base):
     email = Column(String, index=True)
     status = Column(Integer, index=True)
     
+
+# Full-text index over form submissions for GET /form-submission/search. It
+# is an FTS5 virtual table, so it isn't mapped; triggers keep it in sync with
+# every write, including bulk UPDATE/DELETE statements that bypass the ORM.
+# Rows share the form's rowid. Besides the raw fields it holds two normalized
+# single-token keys: the email without separators ("jane.doe@x.com" ->
+# "janedoexcom") and the phone number's digits, so "jane.doe@x" and
+# "(555) 123" are cheap prefix lookups.
+_PHONE_DIGITS = "replace(replace(replace(replace(replace(replace({}, ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', '')"
+_EMAIL_KEY = "replace(replace(replace(replace(replace(lower({}), '.', ''), '@', ''), '_', ''), '-', ''), '+', '')"
+_SEARCH_ROW = (
+    "INSERT OR REPLACE INTO form_submission_search (rowid, form_id, name, email, email_key, phone) "
+    "VALUES (new.rowid, new.id, new.name, lower(new.email), "
+    + _EMAIL_KEY.format("new.email") + ", " + _PHONE_DIGITS.format("new.phone_number") + ");"
+)
+FORM_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE form_submission_search USING fts5("
+    "form_id UNINDEXED, name, email, email_key, phone, "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER form_submission_search_insert AFTER INSERT ON form_submission BEGIN "
+    + _SEARCH_ROW + " END",
+    "CREATE TRIGGER form_submission_search_update AFTER UPDATE OF name, email, phone_number ON form_submission BEGIN "
+    + _SEARCH_ROW + " END",
+    "CREATE TRIGGER form_submission_search_delete AFTER DELETE ON form_submission BEGIN "
+    "DELETE FROM form_submission_search WHERE rowid = old.rowid; END",
+]
+for statement in FORM_SEARCH_DDL:
+    event.listen(FormSubmission.__table__, "after_create", DDL(statement))
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_key"
+
+    # A retried turn (same Idempotency-Key header on the same chat) replays the
+    # stored outcome instead of calling the model again. The response itself
+    # isn't stored: it is rebuilt from chat_message rows [first_seq, end_seq).
+    chat_id = Column(String(length=32), ForeignKey("chat.id"), primary_key=True)
+    key = Column(String(length=255), primary_key=True)
+    # Hash of method, path and body; reusing a key for another request is an error
+    request_hash = Column(String(length=64), nullable=False)
+    first_seq = Column(Integer, nullable=False)
+    end_seq = Column(Integer, nullable=False)
+    created_at = Column(DateTime, index=True)
+
+
+# Audit trail of Chat and FormSubmission changes (see audit.py). A write
+# stages its field-level deltas in audit_journal, in the same transaction as
+# the write itself; a background flusher then moves them in batches to the
+# monthly audit_log_YYYY_MM tables, which are created on demand and so aren't
+# mapped here.
+class AuditJournal(Base):
+    __tablename__ = "audit_journal"
+
+    # Becomes the change's seq in audit_log_*: commits are serialized, so
+    # ids grow in commit order. No secondary indexes, to keep inserts cheap.
+    id = Column(Integer, primary_key=True)
+    entity_type = Column(String, nullable=False)
+    entity_id = Column(String, nullable=False)
+    # "insert", "update" or "delete"
+    action = Column(String, nullable=False)
+    # {field: {"old": ..., "new": ...}} for the fields that changed
+    changes = Column(JSON, nullable=False)
+    changed_at = Column(DateTime, nullable=False)
+
+    # The journal is emptied all the time; without AUTOINCREMENT SQLite would
+    # hand out the same ids again
+    __table_args__ = {"sqlite_autoincrement": True}
+
+class AuditSnapshot(Base):
+    __tablename__ = "audit_snapshot"
+
+    # Full state of an entity right after change `seq`, taken every
+    # AUDIT_SNAPSHOT_EVERY changes, so rebuilding a version replays at most
+    # that many deltas
+    entity_type = Column(String, primary_key=True)
+    entity_id = Column(String, primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    changed_at = Column(DateTime, nullable=False)
+    data = Column(JSON, nullable=False)
+
+class AuditEntity(Base):
+    __tablename__ = "audit_entity"
+
+    # Bookkeeping for when the next snapshot of an entity is due
+    entity_type = Column(String, primary_key=True)
+    entity_id = Column(String, primary_key=True)
+    last_seq = Column(Integer, nullable=False)
+    changes_since_snapshot = Column(Integer, nullable=False, default=0)
+
+
+# Durable background jobs (see jobs.py). A job is inserted in the same
+# transaction as the work that asks for it, so it exists exactly when that
+# work was committed; workers claim due jobs with a lease and retry failures
+# with backoff.
+class Job(Base):
+    __tablename__ = "job"
+
+    id = Column(Integer, primary_key=True)
+    # Name of the handler that runs it
+    kind = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    # Jobs of one chat run one at a time, in id order
+    chat_id = Column(String(length=32))
+    # A second job with the same key is dropped while the first is kept
+    dedupe_key = Column(String, unique=True)
+    # "queued", "running", "done" or "failed" (out of attempts)
+    status = Column(String, nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text)
+    created_at = Column(DateTime, nullable=False)
+    # Not claimed before this (backoff after a failed attempt)
+    run_at = Column(DateTime, nullable=False)
+    # A running job whose lease has expired is claimed again: its worker died
+    lease_until = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_job_status_run_at", "status", "run_at"),
+        Index("ix_job_chat_id", "chat_id", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
+# Version of each cached read (see read_cache.py): ("chat", chat_id) covers
+# GET /chat/{chat_id}, ("forms", chat_id) the chat's form list. Triggers bump
+# it in the same transaction as every write, bulk statements and tool calls
+# included, so any worker can tell whether its cached copy is current.
+# Messages are only ever added together with an UPDATE of their chat
+# (message_count), so chat_message needs no trigger of its own.
+class CacheVersion(Base):
+    __tablename__ = "cache_version"
+
+    kind = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False)
+    # Sent as Last-Modified; whole seconds (SQLite's CURRENT_TIMESTAMP)
+    updated_at = Column(DateTime, nullable=False)
+
+
+_BUMP_VERSION = (
+    "INSERT INTO cache_version (kind, key, version, updated_at) VALUES ('{}', {}, 1, CURRENT_TIMESTAMP) "
+    "ON CONFLICT (kind, key) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;"
+)
+CACHE_VERSION_DDL = [
+    *(
+        f"CREATE TRIGGER cache_version_chat_{op.lower()} AFTER {op} ON chat BEGIN "
+        + _BUMP_VERSION.format("chat", row) + " END"
+        for op, row in [("INSERT", "new.id"), ("UPDATE", "new.id"), ("DELETE", "old.id")]
+    ),
+    "CREATE TRIGGER cache_version_forms_insert AFTER INSERT ON form_submission BEGIN "
+    + _BUMP_VERSION.format("forms", "new.chat_id") + " END",
+    # A form moved to another chat leaves the old chat's list too
+    "CREATE TRIGGER cache_version_forms_update AFTER UPDATE ON form_submission BEGIN "
+    + _BUMP_VERSION.format("forms", "old.chat_id") + " "
+    + _BUMP_VERSION.format("forms", "new.chat_id") + " END",
+    "CREATE TRIGGER cache_version_forms_delete AFTER DELETE ON form_submission BEGIN "
+    + _BUMP_VERSION.format("forms", "old.chat_id") + " END",
+]
+# The triggers span three tables, so they are added once all tables exist
+for statement in CACHE_VERSION_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement))
+
+
+# Form counts by chat, created_at day (UTC) and status, for dashboards (see
+# form_counts.py). chat_id "" is every chat and day "" every day, so a total
+# or a status breakdown is a few primary-key rows whatever the number of
+# forms. Forms without a status count under status 0. Triggers keep the
+# counters current on every write, bulk statements and tool calls included;
+# counters that drop to 0 stay until the next rebuild.
+class FormCount(Base):
+    __tablename__ = "form_count"
+
+    chat_id = Column(String(length=32), primary_key=True)
+    day = Column(String, primary_key=True)
+    status = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False)
+
+
+def _count_form(row: str, delta: int) -> str:
+    # Forms without created_at are only in the every-day counters
+    return " ".join(
+        "INSERT INTO form_count (chat_id, day, status, count) "
+        f"SELECT {chat}, {day}, coalesce({row}.status, 0), {delta} WHERE {day} IS NOT NULL "
+        "ON CONFLICT (chat_id, day, status) DO UPDATE SET count = count + excluded.count;"
+        for chat in (f"{row}.chat_id", "''")
+        for day in (f"date({row}.created_at)", "''")
+    )
+
+FORM_COUNT_DDL = [
+    "CREATE TRIGGER form_count_insert AFTER INSERT ON form_submission BEGIN "
+    + _count_form("new", 1) + " END",
+    "CREATE TRIGGER form_count_update AFTER UPDATE OF chat_id, status, created_at ON form_submission "
+    "WHEN old.chat_id IS NOT new.chat_id OR old.status IS NOT new.status "
+    "OR date(old.created_at) IS NOT date(new.created_at) BEGIN "
+    + _count_form("old", -1) + " " + _count_form("new", 1) + " END",
+    "CREATE TRIGGER form_count_delete AFTER DELETE ON form_submission BEGIN "
+    + _count_form("old", -1) + " END",
+]
+for statement in FORM_COUNT_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement))
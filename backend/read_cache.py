@@ -0,0 +1,183 @@
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from config import Settings, settings
+from database import RoutingSession
+import metrics
+from models import CacheVersion, Chat, ChatMessage, FormSubmission
+
+# Cached reads are identified by a kind and a key, e.g. ("forms", chat_id),
+# plus the query they were made with, e.g. the status filter. Each (kind,
+# key) has a version in cache_version, bumped by triggers on every write
+# (see models.CACHE_VERSION_DDL); a cached response is served only while it
+# was built at the current version.
+
+
+class Version(NamedTuple):
+    number: int
+    # None until the first write since cache_version was added
+    updated_at: Optional[datetime]
+
+    def etag(self, kind: str, query: tuple) -> str:
+        """Strong ETag of the ``query`` response at this version; each page or filter has its own."""
+        # Not hash(): it differs between workers
+        digest = hashlib.blake2b(repr(query).encode(), digest_size=6).hexdigest()
+        return f'"{kind}-{self.number}-{digest}"'
+
+    def last_modified(self) -> Optional[str]:
+        if self.updated_at is None:
+            return None
+        return format_datetime(self.updated_at.replace(tzinfo=timezone.utc), usegmt=True)
+
+
+class ReadCache:
+    def __init__(self, settings: Settings):
+        """
+        LRU cache of encoded responses, bounded by ``read_cache_max_entries``
+        and ``read_cache_max_bytes``.
+
+        Checking a version is a primary-key lookup, and a version read from
+        the database is trusted for ``read_cache_version_ttl`` seconds, so a
+        burst of polls for an unchanged chat is served from memory, or with a
+        304, without querying at all. Commits made in this process forget the
+        versions they changed right away; other workers notice on their next
+        check.
+        """
+        self.settings = settings
+        # (kind, key, query) -> (version number, body), least recently used first
+        self._entries: OrderedDict = OrderedDict()
+        self._bytes = 0
+        # (kind, key) -> (Version, time.monotonic() when it was read)
+        self._versions: OrderedDict = OrderedDict()
+        # Bumped by forget(), so a lookup that overlapped a commit isn't trusted
+        self._forgotten = 0
+
+    async def version(self, db: AsyncSession, kind: str, key: str) -> Version:
+        """Current version of (kind, key)."""
+        remembered = self._versions.get((kind, key))
+        now = time.monotonic()
+        if remembered is not None and now - remembered[1] < self.settings.read_cache_version_ttl:
+            return remembered[0]
+
+        forgotten = self._forgotten
+        row = (
+            await db.execute(
+                select(CacheVersion.version, CacheVersion.updated_at).where(
+                    CacheVersion.kind == kind, CacheVersion.key == key
+                )
+            )
+        ).first()
+        version = Version(*row) if row else Version(0, None)
+        if forgotten == self._forgotten:
+            self._versions[(kind, key)] = (version, now)
+            self._versions.move_to_end((kind, key))
+            while len(self._versions) > self.settings.read_cache_max_entries:
+                self._versions.popitem(last=False)
+        return version
+
+    def get(self, kind: str, key: str, query: tuple, version: Version) -> Optional[bytes]:
+        entry = self._entries.get((kind, key, query))
+        if entry is None or entry[0] != version.number:
+            metrics.count_cache_lookup(kind, "miss")
+            return None
+        self._entries.move_to_end((kind, key, query))
+        metrics.count_cache_lookup(kind, "hit")
+        return entry[1]
+
+    def put(self, kind: str, key: str, query: tuple, version: Version, body: bytes) -> None:
+        if len(body) > self.settings.read_cache_max_bytes:
+            return
+        old = self._entries.pop((kind, key, query), None)
+        if old is not None:
+            self._bytes -= len(old[1])
+        self._entries[(kind, key, query)] = (version.number, body)
+        self._bytes += len(body)
+        while (
+            len(self._entries) > self.settings.read_cache_max_entries
+            or self._bytes > self.settings.read_cache_max_bytes
+        ):
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def forget(self, keys: Iterable[Tuple[str, str]]) -> None:
+        """Stop trusting the remembered versions of ``keys``; their next read checks the database."""
+        self._forgotten += 1
+        for key in keys:
+            self._versions.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._versions.clear()
+        self._bytes = 0
+        self._forgotten += 1
+
+
+def not_modified(headers, kind: str, query: tuple, version: Version) -> bool:
+    """Whether the request's If-None-Match / If-Modified-Since show the client has ``version`` of the ``query`` response."""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or version.etag(kind, query) in tags
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is None or version.updated_at is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return version.updated_at <= since
+
+
+# --- Invalidation ------------------------------------------------------------
+
+def _keys(obj) -> List[Tuple[str, str]]:
+    if isinstance(obj, Chat):
+        return [("chat", obj.id)]
+    if isinstance(obj, ChatMessage):
+        return [("chat", obj.chat_id)]
+    if isinstance(obj, FormSubmission):
+        # A form moved to another chat also leaves the old chat's list
+        moved_from = inspect(obj).attrs.chat_id.history.deleted
+        return [("forms", chat_id) for chat_id in {obj.chat_id, *moved_from} if chat_id]
+    return []
+
+
+def track(session: Session, objs: Iterable) -> None:
+    """
+    Note that ``objs`` were written in ``session``, so that their cached
+    reads are forgotten once it commits. Flushed objects are tracked
+    automatically; bulk statements that bypass the flush call this.
+    """
+    keys: Set[Tuple[str, str]] = session.info.setdefault("read_cache_keys", set())
+    for obj in objs:
+        keys.update(_keys(obj))
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _track_flush(session, flush_context):
+    track(session, [*session.new, *session.dirty, *session.deleted])
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _forget_committed(session):
+    keys = session.info.pop("read_cache_keys", None)
+    if keys:
+        read_cache.forget(keys)
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _drop_rolled_back(session):
+    session.info.pop("read_cache_keys", None)
+
+
+read_cache = ReadCache(settings)
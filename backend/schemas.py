@@ -1,29 +1,56 @@
 from typing import Optional
 import uuid
-from datetime import datetime
+from datetime import date, datetime
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 
 
 class Chat(BaseModel):
     id: str
     created_at: datetime
     messages: list
+    # Total number of stored messages; `messages` may be just the latest page
+    message_count: int = 0
+    # seq of messages[0]; pass it as before_seq to load the previous page
+    first_seq: Optional[int] = None
     # form_submissions: list['FormSubmission'] = []
 
     class Config:
         from_attributes = True
 
+class ChatSummary(BaseModel):
+    id: str
+    created_at: datetime
+    message_count: int
+    last_message_preview: Optional[str] = None
+    form_count: int
+
+    class Config:
+        from_attributes = True
+
+class ChatPage(BaseModel):
+    chats: list[ChatSummary]
+    # Pass as `cursor` to get the next (older) page; None on the last page
+    next_cursor: Optional[str] = None
+
 class ChatCreate(BaseModel):
     messages: list = []
 
 class ChatUpdate(BaseModel):
     messages: list
 
+class ChatTurn(BaseModel):
+    # Only the new message(s), normally a single user message
+    messages: list = Field(min_length=1)
+    # seq of the last message the client has seen (None for an empty chat).
+    # The turn is rejected if the chat has moved on since.
+    last_seq: Optional[int]
+
 
 class FormSubmission(BaseModel):
     id: str
     created_at: datetime
+    chat_id: Optional[str] = None
     name: str
     phone_number: str
     email: str
@@ -32,6 +59,25 @@ class FormSubmission(BaseModel):
     class Config:
         from_attributes = True
 
+class FormSubmissionPage(BaseModel):
+    forms: list[FormSubmission]
+    next_cursor: Optional[str] = None
+
+class AuditEntry(BaseModel):
+    # Increases with every audited change, across all entities
+    seq: int
+    action: str
+    # {field: {"old": ..., "new": ...}}; "old" is missing when it wasn't known
+    changes: dict
+    changed_at: datetime
+    # Full state right after this change; None once deleted
+    data: Optional[dict] = None
+
+class AuditPage(BaseModel):
+    entries: list[AuditEntry]
+    # Pass as `cursor` to get the next (older) page; None on the last page
+    next_cursor: Optional[str] = None
+
 class FormSubmissionCreate(BaseModel):
     name: str
     phone_number: str
@@ -43,4 +89,39 @@ class FormSubmissionUpdate(BaseModel):
     name: Optional[str] = None
     phone_number: Optional[str] = None
     email: Optional[str] = None
-    status: Optional[int] = None
\ No newline at end of file
+    status: Optional[int] = None
+
+# At most this many forms per bulk request
+BULK_LIMIT = 1000
+
+class FormSubmissionFilter(BaseModel):
+    """Selects the forms a bulk update/delete applies to; the criteria are ANDed."""
+    ids: Optional[list[str]] = Field(None, max_length=BULK_LIMIT)
+    chat_id: Optional[str] = None
+    status: Optional[int] = None
+
+    @model_validator(mode="after")
+    def check_not_empty(self):
+        if self.ids is None and self.chat_id is None and self.status is None:
+            raise ValueError("at least one of ids, chat_id or status is required")
+        return self
+
+class FormSubmissionBulkUpdate(BaseModel):
+    where: FormSubmissionFilter
+    values: FormSubmissionUpdate
+
+class FormStatusCount(BaseModel):
+    # None for forms without a status
+    status: Optional[int] = None
+    count: int
+
+class FormDayCounts(BaseModel):
+    day: date
+    total: int
+    by_status: list[FormStatusCount]
+
+class FormCounts(BaseModel):
+    total: int
+    by_status: list[FormStatusCount]
+    # Only when asked for; days without forms are left out
+    by_day: Optional[list[FormDayCounts]] = None
@@ -0,0 +1,57 @@
+import json
+from functools import lru_cache
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a character-based estimate
+    tiktoken = None
+
+# Per-message framing overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD = 4
+
+
+@lru_cache(maxsize=1)
+def _encoding() -> Optional["tiktoken.Encoding"]:
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # The BPE file is downloaded on first use, which fails offline
+        return None
+
+
+def count_text_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(message: dict) -> int:
+    """
+    Tokens a message takes up in a prompt. Exact with tiktoken installed;
+    otherwise roughly a quarter of its JSON length, which errs on the high side.
+    """
+    encoding = _encoding()
+    if encoding is None:
+        return len(json.dumps(message)) // 4 + MESSAGE_OVERHEAD
+
+    tokens = MESSAGE_OVERHEAD + count_text_tokens(message.get("content"))
+    for call in message.get("tool_calls") or []:
+        tokens += count_text_tokens(call["function"]["name"])
+        tokens += count_text_tokens(call["function"]["arguments"])
+    return tokens
+
+
+@lru_cache(maxsize=32)
+def _count_json_tokens(serialized: str) -> int:
+    return count_text_tokens(serialized)
+
+
+def count_tools_tokens(tools: list) -> int:
+    """Tokens taken by tool definitions; memoized since they rarely change."""
+    return _count_json_tokens(json.dumps(tools, sort_keys=True))
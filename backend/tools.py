@@ -0,0 +1,181 @@
+import json
+from typing import List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud
+from database import SessionLocal
+import jobs
+from models import FormSubmission
+import schemas
+
+# Tool definitions sent with every completion in update_chat
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "submit_interest_form",
+            "description": "Submit an interest form for the user",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string", "description": "the user's name"},
+                    "email": {"type": "string", "description": "the user's email"},
+                    "phone_number": {"type": "string", "description": "the user's phone"},
+                },
+                "required": ["name", "email", "phone_number"]
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "update_interest_form",
+            "description": "Update an existing interest form",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "form_id": {"type": "string"},
+                    "name": {"type": "string"},
+                    "email": {"type": "string"},
+                    "phone_number": {"type": "string"},
+                    "status": {"type": "integer", "enum": [1, 2, 3]}
+                },
+                "required": ["form_id"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "delete_interest_form",
+            "description": "Delete an interest form",
+            "parameters": {
+                "type": "object",
+                "properties": {"form_id": {"type": "string"}},
+                "required": ["form_id"]
+            }
+        }
+    }
+]
+
+
+@jobs.handler("submit_interest_form")
+async def submit_interest_form(db: AsyncSession, payload: dict) -> None:
+    await crud.form.create(db=db, obj_in=schemas.FormSubmissionCreate(**payload), commit=False)
+
+
+@jobs.handler("update_interest_form")
+async def update_interest_form(db: AsyncSession, payload: dict) -> None:
+    values = dict(payload)
+    f_obj = await crud.form.get(db, id=values.pop("form_id"))
+    # Deleted by a later call in the meantime: nothing left to update
+    if f_obj:
+        await crud.form.update(db, db_obj=f_obj, obj_in=values, commit=False)
+
+
+@jobs.handler("delete_interest_form")
+async def delete_interest_form(db: AsyncSession, payload: dict) -> None:
+    if await crud.form.get(db, id=payload["form_id"]):
+        await crud.form.remove(db, id=payload["form_id"], commit=False)
+
+
+class ToolJob(NamedTuple):
+    """The job a tool call asked for, queued with the turn's messages (see enqueue_tool_jobs)."""
+    kind: str
+    payload: dict
+    dedupe_key: str
+
+
+FORM_TOOLS = ("update_interest_form", "delete_interest_form")
+
+
+def _form_id(tool_call: dict) -> Optional[str]:
+    """The form an update / delete call refers to, if its arguments can be read."""
+    if tool_call["function"]["name"] not in FORM_TOOLS:
+        return None
+    try:
+        form_id = json.loads(tool_call["function"]["arguments"]).get("form_id")
+    except (ValueError, AttributeError):
+        return None
+    return form_id if isinstance(form_id, str) else None
+
+
+def check_tool_call(chat_id: str, tool_call: dict, forms: Set[str]) -> Tuple[dict, Optional[ToolJob]]:
+    """
+    Check one tool call against ``forms``, the ids of the existing forms it
+    may refer to, returning the ``tool`` message to append to the chat and
+    the job (see jobs.py) that carries out its side effects, if any. Nothing
+    is written: the job is queued by ``enqueue_tool_jobs``, in the
+    transaction that saves the turn, so a turn that is never saved (e.g.
+    rejected with a 409) leaves no forms behind.
+
+    The model is told the call was accepted once it passes the checks; the
+    form write itself runs in a job worker, in order with the chat's other
+    calls. The chat and tool call id make the job's dedupe key, so a call
+    is never queued twice.
+    """
+    fname = tool_call["function"]["name"]
+    result_content = "Accepted"
+    job = None
+
+    try:
+        args = json.loads(tool_call["function"]["arguments"])
+        if fname == "submit_interest_form":
+            form_in = schemas.FormSubmissionCreate(
+                name=args["name"],
+                email=args["email"],
+                phone_number=args["phone_number"],
+                chat_id=chat_id
+            )
+            payload = form_in.model_dump()
+
+        elif fname in FORM_TOOLS:
+            payload = {"form_id": args["form_id"]}
+            if fname == "update_interest_form":
+                payload.update(
+                    schemas.FormSubmissionUpdate(**args).model_dump(exclude_unset=True)
+                )
+            # Answered right away: the model can correct the id
+            if payload["form_id"] not in forms:
+                result_content = "Form not found"
+                payload = None
+
+        else:
+            raise ValueError(f"Unknown tool {fname}")
+
+        if payload is not None:
+            job = ToolJob(fname, payload, f"tool_call:{chat_id}:{tool_call['id']}")
+    except Exception as e:
+        result_content = f"Error: {str(e)}"
+
+    message = {
+        "tool_call_id": tool_call["id"],
+        "role": "tool",
+        "name": fname,
+        "content": result_content,
+    }
+    return message, job
+
+
+async def run_tool_calls(chat_id: str, tool_calls: list) -> Tuple[list, List[ToolJob]]:
+    """
+    Check the tool calls of one assistant message; returns their ``tool``
+    messages, in order, and the jobs to queue when the turn is saved.
+    """
+    # Every form the calls refer to is looked up with one query, so checking
+    # costs a single round trip however many calls the model made
+    form_ids = {form_id for form_id in map(_form_id, tool_calls) if form_id is not None}
+    forms = set()
+    if form_ids:
+        async with SessionLocal() as db:
+            found = await crud.form.get_multi(db, filters=[FormSubmission.id.in_(form_ids)], limit=None)
+        forms = {form.id for form in found}
+    checked = [check_tool_call(chat_id, t, forms) for t in tool_calls]
+    return [message for message, _ in checked], [job for _, job in checked if job is not None]
+
+
+async def enqueue_tool_jobs(db: AsyncSession, chat_id: str, tool_jobs: List[ToolJob]) -> None:
+    """Stage ``tool_jobs`` in ``db``; they are queued when it commits."""
+    for job in tool_jobs:
+        await jobs.enqueue(db, job.kind, job.payload, chat_id=chat_id, dedupe_key=job.dedupe_key)
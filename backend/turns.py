@@ -0,0 +1,101 @@
+from typing import AsyncIterator
+
+from llm import MessageAccumulator, llm
+import metrics
+from tools import TOOLS, run_tool_calls
+
+SYSTEM_TEMPLATE = """"""
+
+
+def _prompt(history: list, messages: list) -> list:
+    return [{"role": "system", "content": SYSTEM_TEMPLATE}] + history + messages
+
+
+async def run_turn(chat_id: str, history: list, messages: list, tool_jobs: list) -> list:
+    """
+    Answer the last user message: one completion, then (if the model asked for
+    tools) the tool calls and a second completion.
+
+    ``history`` is the earlier context as assembled by ``context.build_context``
+    and ``messages`` the turn's new message(s); the replies are appended to
+    ``messages`` in place, which is also returned. The jobs of the tool calls
+    are appended to ``tool_jobs``, for the caller to queue when it saves the
+    turn (see tools.enqueue_tool_jobs).
+    """
+    with metrics.span("turn.first_completion"):
+        resp_message = await llm.complete(_prompt(history, messages), TOOLS)
+
+    messages.append(resp_message)
+
+    if resp_message.get('tool_calls'):
+        with metrics.span("turn.tool_calls"):
+            results, jobs = await run_tool_calls(chat_id, resp_message["tool_calls"])
+        messages.extend(results)
+        tool_jobs.extend(jobs)
+
+        with metrics.span("turn.second_completion"):
+            resp_message = await llm.complete(_prompt(history, messages), TOOLS)
+
+        messages.append(resp_message)
+
+    return messages
+
+
+async def _stream_completion(
+    history: list, messages: list, acc: MessageAccumulator
+) -> AsyncIterator[dict]:
+    async for delta in llm.stream(_prompt(history, messages), TOOLS):
+        for call in acc.add(delta):
+            yield {"type": "tool_call", **call}
+        if delta.content:
+            yield {"type": "token", "content": delta.content}
+
+
+async def stream_turn(
+    chat_id: str, history: list, messages: list, tool_jobs: list
+) -> AsyncIterator[dict]:
+    """
+    Streaming counterpart of ``run_turn``: yields events as the turn progresses
+    and appends the same messages to ``messages`` and jobs to ``tool_jobs``.
+
+    Event types: ``token`` (a content fragment), ``tool_call`` (the model began
+    emitting a call), ``tool_call_start`` / ``tool_call_end`` (checking of a
+    call; its side effects are queued once the turn is saved) and
+    ``message`` (a message was appended).
+    Persisting the result is left to the caller, once the stream is exhausted.
+    """
+    # Streamed spans include the time the client takes to read the events
+    acc = MessageAccumulator()
+    with metrics.span("turn.first_completion"):
+        async for event in _stream_completion(history, messages, acc):
+            yield event
+    resp_message = acc.message()
+    messages.append(resp_message)
+    yield {"type": "message", "message": resp_message}
+
+    if resp_message["tool_calls"]:
+        tool_calls = resp_message["tool_calls"]
+        for t in tool_calls:
+            yield {"type": "tool_call_start", "id": t["id"], "name": t["function"]["name"]}
+
+        with metrics.span("turn.tool_calls"):
+            results, jobs = await run_tool_calls(chat_id, tool_calls)
+        tool_jobs.extend(jobs)
+        for result in results:
+            yield {
+                "type": "tool_call_end",
+                "id": result["tool_call_id"],
+                "name": result["name"],
+                "content": result["content"],
+            }
+        for result in results:
+            messages.append(result)
+            yield {"type": "message", "message": result}
+
+        acc = MessageAccumulator()
+        with metrics.span("turn.second_completion"):
+            async for event in _stream_completion(history, messages, acc):
+                yield event
+        resp_message = acc.message()
+        messages.append(resp_message)
+        yield {"type": "message", "message": resp_message}
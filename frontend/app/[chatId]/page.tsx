@@ -81,48 +81,152 @@ function InterestFormsSidebar({ forms }: { forms: any[] }) {
   );
 }
 
+// Applies a change feed event to the forms list, or returns null when the
+// event alone isn't enough (a form moved here from another chat) and the
+// list must be refetched. Events may repeat what the list already shows.
+function applyFormChange(forms: any[], event: any, chatId: string): any[] | null {
+  const values = Object.fromEntries(
+    Object.entries(event.changes).map(([field, change]: [string, any]) => [field, change.new])
+  )
+  const others = forms.filter((f) => f.id != event.entity_id)
+  if (event.action == "delete" || (values.chat_id !== undefined && values.chat_id != chatId)) {
+    return others
+  }
+  const form = forms.find((f) => f.id == event.entity_id)
+  if (event.action == "insert") {
+    return form ? forms.map((f) => (f.id == form.id ? { ...f, ...values } : f)) : [...forms, values]
+  }
+  if (!form) {
+    return null
+  }
+  return forms.map((f) => (f.id == form.id ? { ...f, ...values } : f))
+}
+
+
+const PAGE_SIZE = 50
 
 export default function Home({ params }: { params: { chatId: string } }) {
   const [input, setInput] = useState("")
   const [messages, setMessages] = useState<any[]>([])
-  const { data } = useSWR({ url: `chat/${params.chatId}` }, fetcher)
+  const [messageCount, setMessageCount] = useState(0)         // messages stored on the server
+  const [firstSeq, setFirstSeq] = useState<number | null>(null) // seq of messages[0]
+  // Only the latest page of history is loaded; older pages on demand
+  const { data, mutate } = useSWR({ url: `chat/${params.chatId}?limit=${PAGE_SIZE}` }, fetcher)
 
   //for task 1
-  const { data: formData, mutate: mutateForms } = useSWR({ url: `chat/${params.chatId}/forms` }, fetcher)
+  // Kept up to date by the change feed below rather than by revalidating
+  const { data: formData, mutate: mutateForms } = useSWR({ url: `chat/${params.chatId}/forms` }, fetcher, {
+    revalidateOnFocus: false,
+    revalidateOnReconnect: false,
+  })
+
+  useEffect(() => {
+    // EventSource reconnects by itself, sending the last event id, and the
+    // server replays what was missed (or sends a reset)
+    const changes = new EventSource(`http://localhost:8000/chat/${params.chatId}/changes`)
+    let opened = false
+    changes.onopen = () => {
+      // Changes made between the first fetch and subscribing
+      if (!opened) mutateForms()
+      opened = true
+    }
+    changes.addEventListener("change", (e) => {
+      const event = JSON.parse((e as MessageEvent).data)
+      if (event.entity_type != "form_submission") return
+      let refetch = false
+      mutateForms((forms: any[] | undefined) => {
+        const updated = applyFormChange(forms ?? [], event, params.chatId)
+        refetch = updated == null
+        return updated ?? forms
+      }, { revalidate: false }).then(() => {
+        if (refetch) mutateForms()
+      })
+    })
+    changes.addEventListener("reset", () => mutateForms())
+    return () => changes.close()
+  }, [params.chatId, mutateForms])
 
   useEffect(() => {
     if (data) {
       setMessages(data.messages)
+      setMessageCount(data.message_count)
+      setFirstSeq(data.first_seq)
     }
   }, [data])
 
+  async function loadEarlier() {
+    const page = await fetcher({ url: `chat/${params.chatId}?limit=${PAGE_SIZE}&before_seq=${firstSeq}` })
+    setMessages((current) => [...page.messages, ...current])
+    setFirstSeq(page.first_seq)
+  }
+
   async function generateResponse() {
     if (!input) {
       return
     }
 
 
-    const newMessages = [...messages, { "role": "user", "content": input }]
+    const userMessage = { "role": "user", "content": input }
+    const newMessages = [...messages, userMessage]
     setMessages(newMessages)
     setInput("")
 
+    // Only the new message is sent; the server rebuilds the history itself
     const data = {
-      messages: newMessages
+      messages: [userMessage],
+      last_seq: messageCount > 0 ? messageCount - 1 : null
     }
 
-    const resp = await fetch(`http://localhost:8000/chat/${params.chatId}`, {
-      method: 'PUT',
+    // Events of the turn arrive as Server-Sent Events
+    const resp = await fetch(`http://localhost:8000/chat/${params.chatId}/messages/stream`, {
+      method: 'POST',
       headers: {
-        'Accept': 'application/json',
+        'Accept': 'text/event-stream',
         'Content-Type': 'application/json'
       },
       body: JSON.stringify(data),
     })
 
-    if (resp.ok) {
-      const json = await resp.json()
-      setMessages(json.messages)
-      mutateForms() //triggers a refresh of the forms list
+    if (resp.status == 409) {
+      mutate() //someone else added messages, reload the chat
+      return
+    }
+    if (!resp.ok || !resp.body) {
+      return
+    }
+
+    const reader = resp.body.pipeThrough(new TextDecoderStream()).getReader()
+    let completed = [...newMessages] // messages the server has finished
+    let partial = ""                 // assistant text still streaming in
+    let buffer = ""
+
+    while (true) {
+      const { value, done } = await reader.read()
+      if (done) break
+      buffer += value
+
+      // SSE events are separated by a blank line; keep any incomplete tail
+      const events = buffer.split("\n\n")
+      buffer = events.pop() ?? ""
+
+      for (const raw of events) {
+        const line = raw.split("\n").find((l) => l.startsWith("data: "))
+        if (!line) continue
+        const event = JSON.parse(line.slice(6))
+
+        if (event.type == "token") {
+          partial += event.content
+          setMessages([...completed, { "role": "assistant", "content": partial }])
+        } else if (event.type == "message") {
+          partial = ""
+          completed = [...completed, event.message]
+          setMessages(completed)
+        } else if (event.type == "done") {
+          setMessageCount(event.chat.message_count)
+        } else if (event.type == "error") {
+          mutate()
+        }
+      }
     }
 
   }
@@ -136,6 +240,11 @@ export default function Home({ params }: { params: { chatId: string } }) {
         <div className="flex-grow flex flex-col bg-gray-50 border-r border-gray-300">
           <div className="grow overflow-y-auto p-4 flex flex-col-reverse">
             <OpenAIConversationDisplay messages={messages} />
+            {firstSeq != null && firstSeq > 0 && (
+              <button onClick={() => loadEarlier()} className="self-center text-sm text-blue-600 hover:underline mb-2">
+                Load earlier messages
+              </button>
+            )}
           </div>
 
           {/* INPUT BOX */}
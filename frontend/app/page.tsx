@@ -4,11 +4,23 @@ import { fetcher } from "@/utils/fetcher";
 import Link from "next/link";
 import { useRouter } from "next/navigation";
 import { useState } from "react";
-import useSWR from "swr";
+import useSWRInfinite from "swr/infinite";
+
+const PAGE_SIZE = 20
 
 export default function Home() {
   const router = useRouter()
-  const { data } = useSWR({ url: `chat` }, fetcher) // make GET request
+  // make GET requests, one per page; each page starts where the previous one's next_cursor points
+  const { data, size, setSize } = useSWRInfinite(
+    (index: number, previous: any) => {
+      if (index === 0) return { url: `chat?limit=${PAGE_SIZE}` }
+      if (!previous?.next_cursor) return null
+      return { url: `chat?limit=${PAGE_SIZE}&cursor=${encodeURIComponent(previous.next_cursor)}` }
+    },
+    fetcher
+  )
+  const chats = data?.flatMap((page: any) => page.chats) ?? []
+  const hasMore = !!data?.[data.length - 1]?.next_cursor
 
   async function createChat() { // make POST request
     const resp = await fetch('http://localhost:8000/chat', {
@@ -40,13 +52,22 @@ export default function Home() {
             <div className="font-semibold table-cell px-3 py-3">
               Created At
             </div>
+            <div className="font-semibold table-cell px-3 py-3">
+              Last Message
+            </div>
+            <div className="font-semibold table-cell px-3 py-3">
+              Messages
+            </div>
+            <div className="font-semibold table-cell px-3 py-3">
+              Forms
+            </div>
           </div>
         </div>
         <div className="table-row-group">
-          {data?.map((s: any) => {
+          {chats.map((s: any) => {
             const date = new Date(s.created_at + 'Z')
             return (
-              <Link key={`${s.user_id}:${s.resource_id}`} href={`/${s.id}`} className="border-b hover:bg-neutral-200 hover:cursor-pointer table-row align-middle">
+              <Link key={s.id} href={`/${s.id}`} className="border-b hover:bg-neutral-200 hover:cursor-pointer table-row align-middle">
                 <div className="px-3 py-3 table-cell font-medium text-gray-900 whitespace-nowrap ">
                   {s.id}
                 </div>
@@ -55,11 +76,25 @@ export default function Home() {
                     {date.toLocaleString()}
                   </div>
                 </div>
+                <div className="table-cell px-3 py-3 text-gray-600 truncate max-w-xs">
+                  {s.last_message_preview}
+                </div>
+                <div className="table-cell px-3 py-3">
+                  {s.message_count}
+                </div>
+                <div className="table-cell px-3 py-3">
+                  {s.form_count}
+                </div>
               </Link>
             )
           })}
         </div>
       </div>
+      {hasMore && (
+        <button onClick={() => setSize(size + 1)} className="mt-4 text-sm text-blue-600 hover:underline">
+          Load more chats
+        </button>
+      )}
     </div>
   </div>
 